@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark of variant loading, dataset updates, variant removal and allele queries.
+
+Loads a synthetic VCF file (see synthetic_vcf.py) into a public dataset, sends exact, missing,
+range and wildcard (N bases) queries to /apiv1.0/query using the Flask test client, then removes
+the variants again.
+Durations, throughput and query latency percentiles are printed and saved as JSON, together with
+the current git commit, so that results collected on different commits can be compared.
+
+The benchmark runs against mongomock by default, or against a local mongod if --mongo-uri is
+provided. No network access is required. The benchmark database is dropped before and after
+the run, so don't point it to a database containing real data.
+
+Usage:
+    python benchmarks/load_query.py [--samples 100] [--variants 10000] [--sv-fraction 0.05]
+        [--bnd-fraction 0.01] [--chromosomes 1,2,X] [--queries 1000]
+        [--key-format md5|compact] [--mongo-uri mongodb://127.0.0.1:27017] [--output results.json]
+        [--compare baseline.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy
+from cgbeacon2.server import create_app
+from cgbeacon2.utils.add import add_dataset, add_variants
+from cgbeacon2.utils.delete import delete_variants
+from cgbeacon2.utils.index import create_indexes
+from cgbeacon2.utils.metrics import LOAD_STAGE_SECONDS, QUERY_STAGE_SECONDS
+from cgbeacon2.utils.mongo import LOADING_CLIENT, client_settings, create_client
+from cgbeacon2.utils.parse import extract_variants
+from cgbeacon2.utils.update import update_dataset
+from cgbeacon2.utils.variant_key import KEY_FORMATS, MD5_KEY
+from synthetic_vcf import add_generator_arguments, write_vcf
+
+DB_NAME = "cgbeacon2-benchmark"
+DATASET = dict(
+    _id="benchmark_ds",
+    name="Benchmark dataset",
+    assembly_id="GRCh37",
+    authlevel="public",
+    description="Synthetic variants used in benchmarks",
+    version="v1.0",
+)
+HEADERS = {"Content-type": "application/json", "Accept": "application/json"}
+PERCENTILES = [50, 95, 99]
+
+
+def git_commit() -> str:
+    """Return the commit of the checked out code, if available"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_seconds(histogram) -> dict:
+    """Return the total seconds observed for each stage of a metrics histogram"""
+    return {
+        dict(labels)["stage"]: round(value, 6)
+        for name, labels, value in histogram.samples()
+        if name.endswith("_sum")
+    }
+
+
+def timed_call(function, *args, **kwargs) -> tuple:
+    """Call a function and return its result and the seconds it took"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_queries(client, queries) -> dict:
+    """Send GET requests to the query endpoint and compute throughput and latency percentiles
+
+    Accepts:
+        client(flask.testing.FlaskClient)
+        queries(list): query strings
+
+    Returns:
+        stats(dict)
+    """
+    latencies = []
+    n_hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        response = client.get(f"/apiv1.0/query?{query}", headers=HEADERS)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"Query '{query}' failed:{response.get_data(as_text=True)}")
+        n_hits += response.get_json()["exists"] is True
+
+    stats = dict(requests=len(latencies), hits=n_hits, seconds=round(sum(latencies), 6))
+    stats["requests_per_second"] = round(len(latencies) / sum(latencies), 1)
+    for percentile, value in zip(PERCENTILES, numpy.percentile(latencies, PERCENTILES)):
+        stats[f"p{percentile}_ms"] = round(value * 1000, 3)
+    return stats
+
+
+def build_queries(database, n_queries, seed) -> dict:
+    """Create exact, missing and range queries for the variants saved in database
+
+    Returns:
+        queries(dict): query type as keys and lists of query strings as values
+    """
+    rng = numpy.random.default_rng(seed)
+    snvs = list(database["variant"].find({"variantType": {"$in": ["SNP", "INDEL"]}}))
+    svs = list(database["variant"].find({"variantType": {"$in": ["DEL", "DUP", "INV"]}}))
+    queries = {"exact": [], "missing": [], "range": [], "wildcard": [], "sv_range": []}
+
+    for variant in rng.choice(snvs, size=min(n_queries, len(snvs)), replace=False):
+        base = (
+            f"assemblyId={variant['assemblyId']}&referenceName={variant['referenceName']}"
+            f"&referenceBases={variant['referenceBases']}&includeDatasetResponses=HIT"
+        )
+        queries["exact"].append(
+            f"{base}&start={variant['start']}&alternateBases={variant['alternateBases']}"
+        )
+        queries["missing"].append(
+            f"{base}&start={variant['start'] + 1}&alternateBases={variant['alternateBases']}"
+        )
+        queries["range"].append(
+            f"{base}&startMin={variant['start'] - 100000}&startMax={variant['start'] + 100000}"
+            f"&alternateBases={variant['alternateBases']}"
+        )
+        # the last alt base replaced by N, i.e. a query expanded to concrete sequences
+        queries["wildcard"].append(
+            f"{base}&startMin={variant['start'] - 100000}&startMax={variant['start'] + 100000}"
+            f"&alternateBases={variant['alternateBases'][:-1]}N"
+        )
+
+    for variant in rng.choice(svs, size=min(n_queries, len(svs)), replace=False):
+        queries["sv_range"].append(
+            f"assemblyId={variant['assemblyId']}&referenceName={variant['referenceName']}"
+            f"&referenceBases={variant['referenceBases']}&variantType={variant['variantType']}"
+            f"&startMin={variant['start'] - 1000}&startMax={variant['start'] + 1000}"
+            f"&endMin={variant['end'] - 1000}&endMax={variant['end'] + 1000}"
+            "&includeDatasetResponses=HIT"
+        )
+    return queries
+
+
+def run_benchmark(args, database, vcf_path, samples) -> dict:
+    """Load, query and remove the variants of a synthetic VCF file
+
+    Returns:
+        results(dict): durations and throughput of each benchmarked operation
+    """
+    results = {}
+    dataset_id = DATASET["_id"]
+    add_dataset(database, dict(DATASET))
+
+    vcf_obj = extract_variants(vcf_path, samples)
+    n_saved, seconds = timed_call(
+        add_variants,
+        database,
+        vcf_obj,
+        set(samples),
+        DATASET["assembly_id"],
+        dataset_id,
+        show_progress=False,
+        key_format=args.key_format,
+    )
+    results["add_variants"] = dict(
+        variants=n_saved, seconds=round(seconds, 6), variants_per_second=round(n_saved / seconds, 1)
+    )
+
+    _, seconds = timed_call(update_dataset, database, dataset_id, samples, True)
+    results["update_dataset"] = dict(seconds=round(seconds, 6))
+
+    app = create_app()
+    app.db = database
+    app.query_db = database
+    app.config["VARIANT_KEY_FORMAT"] = args.key_format
+    if not args.query_cache:
+        app.query_cache = None
+    client = app.test_client()
+    results["query"] = {
+        query_type: benchmark_queries(client, queries)
+        for query_type, queries in build_queries(database, args.queries, args.seed).items()
+        if queries
+    }
+
+    (n_updated, n_removed), seconds = timed_call(delete_variants, database, dataset_id, samples)
+    results["delete_variants"] = dict(
+        variants=n_updated + n_removed,
+        seconds=round(seconds, 6),
+        variants_per_second=round((n_updated + n_removed) / seconds, 1),
+    )
+    _, seconds = timed_call(update_dataset, database, dataset_id, samples, False)
+    results["update_dataset_remove"] = dict(seconds=round(seconds, 6))
+
+    results["load_stage_seconds"] = stage_seconds(LOAD_STAGE_SECONDS)
+    results["query_stage_seconds"] = stage_seconds(QUERY_STAGE_SECONDS)
+    return results
+
+
+def compare(report, baseline) -> None:
+    """Print the change of durations and query latencies compared to the report of a previous run"""
+    print(f"\nCompared to {baseline.get('commit')} ({baseline.get('created')}):")
+    if (report["params"], report["database"]) != (baseline["params"], baseline["database"]):
+        print("  WARNING: runs used different parameters or databases")
+    results = report["results"]
+    for operation in ["add_variants", "update_dataset", "delete_variants"]:
+        old, new = baseline["results"].get(operation), results[operation]
+        if old:
+            print(f"  {operation:<28} {(new['seconds'] / old['seconds'] - 1) * 100:+7.1f}% time")
+    for query_type, stats in results["query"].items():
+        old = baseline["results"].get("query", {}).get(query_type)
+        if not old:
+            continue
+        for percentile in PERCENTILES:
+            key = f"p{percentile}_ms"
+            change = (stats[key] / old[key] - 1) * 100
+            print(f"  query {query_type:<14} {key:<7} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_generator_arguments(parser)
+    parser.add_argument("--queries", type=int, default=1000, help="queries sent for each type")
+    parser.add_argument(
+        "--key-format", choices=KEY_FORMATS, default=MD5_KEY, help="format of the variant _id"
+    )
+    parser.add_argument(
+        "--mongo-uri", default=None, help="URI of a local mongod. Default: use mongomock"
+    )
+    parser.add_argument(
+        "--query-cache", action="store_true", help="keep the query cache of the app enabled"
+    )
+    parser.add_argument("--output", default=None, help="save results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        client = create_client(args.mongo_uri, client_settings(create_app().config, LOADING_CLIENT))
+    else:
+        import mongomock  # development requirement
+
+        client = mongomock.MongoClient()
+    client.drop_database(DB_NAME)
+    database = client[DB_NAME]
+    create_indexes(database)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vcf_path = os.path.join(tmp_dir, "synthetic.vcf")
+        samples = write_vcf(
+            vcf_path,
+            args.samples,
+            args.variants,
+            sv_fraction=args.sv_fraction,
+            bnd_fraction=args.bnd_fraction,
+            chromosomes=args.chromosomes,
+            seed=args.seed,
+        )
+        try:
+            results = run_benchmark(args, database, vcf_path, samples)
+        finally:
+            client.drop_database(DB_NAME)
+
+    report = dict(
+        commit=git_commit(),
+        created=datetime.datetime.now().isoformat(timespec="seconds"),
+        database="mongod" if args.mongo_uri else "mongomock",
+        params={
+            key: value for key, value in vars(args).items() if key not in ["output", "compare"]
+        },
+        results=results,
+    )
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(report, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
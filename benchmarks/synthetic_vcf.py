@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Generate a synthetic multi-sample VCF file for benchmarking variant loading and queries.
+
+Variants are SNVs and short indels, symbolic structural variants (DEL, DUP, INV) and
+breakends (BND), randomly placed on the requested chromosomes and called in a random
+subset of the samples.
+
+Usage:
+    python benchmarks/synthetic_vcf.py synthetic.vcf [--samples 100] [--variants 10000]
+        [--sv-fraction 0.05] [--bnd-fraction 0.01] [--chromosomes 1,2,X] [--seed 0]
+"""
+import argparse
+
+import numpy
+
+BASES = numpy.array(list("ACGT"))
+SV_TYPES = ["DEL", "DUP", "INV"]
+CHROMOSOME_LENGTH = 50000000  # variants are placed within the first 50Mb of each chromosome
+CARRIER_FREQUENCY = 0.1  # fraction of samples with a HET or HOM_ALT call for each variant
+
+HEADER_LINES = [
+    "##fileformat=VCFv4.2",
+    '##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">',
+    '##INFO=<ID=END,Number=1,Type=Integer,Description="End position of the variant">',
+    '##INFO=<ID=SVLEN,Number=1,Type=Integer,Description="Length of structural variant">',
+    '##INFO=<ID=MATEID,Number=1,Type=String,Description="ID of mate breakend">',
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+]
+
+
+def _random_bases(rng, length) -> str:
+    return "".join(rng.choice(BASES, size=length))
+
+
+def _genotypes(rng, n_samples) -> str:
+    """Return tab-separated genotypes with at least one HET or HOM_ALT call"""
+    gts = numpy.full(n_samples, "0/0", dtype=object)
+    carriers = rng.random(n_samples) < CARRIER_FREQUENCY
+    carriers[rng.integers(n_samples)] = True
+    gts[carriers] = rng.choice(["0/1", "1/1"], size=int(carriers.sum()))
+    return "\t".join(gts)
+
+
+def _variant_fields(rng, chrom, pos, index, variant_class, chromosomes) -> list:
+    """Return CHROM, POS, ID, REF, ALT, QUAL, FILTER and INFO fields of a variant
+
+    Accepts:
+        rng(numpy.random.Generator)
+        chrom(str)
+        pos(int): 1-based position
+        index(int): progressive number of the variant, used in its ID
+        variant_class(str): "snv", "sv" or "bnd"
+        chromosomes(list): chromosomes available for breakend mates
+    """
+    ref = _random_bases(rng, 1)
+    info = "."
+    if variant_class == "sv":
+        sv_type = rng.choice(SV_TYPES)
+        sv_len = int(rng.integers(50, 100000))
+        alt = f"<{sv_type}>"
+        sv_len_value = -sv_len if sv_type == "DEL" else sv_len
+        info = f"SVTYPE={sv_type};END={pos + sv_len};SVLEN={sv_len_value}"
+    elif variant_class == "bnd":
+        mate_chrom = rng.choice(chromosomes)
+        mate_pos = int(rng.integers(1, CHROMOSOME_LENGTH))
+        alt = f"{ref}]{mate_chrom}:{mate_pos}]"
+        info = f"SVTYPE=BND;MATEID=bnd_{index}_mate"
+    else:
+        alt_length = 1 if rng.random() < 0.8 else int(rng.integers(2, 10))  # SNV or insertion
+        alt = rng.choice([base for base in BASES if base != ref])
+        if alt_length > 1:
+            alt = ref + _random_bases(rng, alt_length - 1)
+    return [chrom, str(pos), f"var_{index}", ref, alt, "50", "PASS", info]
+
+
+def write_vcf(
+    path, n_samples, n_variants, sv_fraction=0.05, bnd_fraction=0.01, chromosomes=None, seed=0
+) -> list:
+    """Write a synthetic VCF file, sorted by chromosome and position
+
+    Accepts:
+        path(str): path of the VCF file to create (uncompressed)
+        n_samples(int): number of samples
+        n_variants(int): number of variants
+        sv_fraction(float): fraction of symbolic structural variants (DEL, DUP, INV)
+        bnd_fraction(float): fraction of breakends
+        chromosomes(list): chromosomes the variants are spread on. Default: 1-22, X, Y
+        seed(int): seed of the random number generator
+
+    Returns:
+        samples(list): names of the samples in the VCF file
+    """
+    rng = numpy.random.default_rng(seed)
+    chromosomes = chromosomes or [str(nr) for nr in range(1, 23)] + ["X", "Y"]
+    samples = [f"sample_{i}" for i in range(n_samples)]
+
+    variant_classes = rng.choice(
+        ["snv", "sv", "bnd"],
+        size=n_variants,
+        p=[1 - sv_fraction - bnd_fraction, sv_fraction, bnd_fraction],
+    )
+    variant_chroms = rng.integers(len(chromosomes), size=n_variants)
+    variant_positions = rng.integers(1, CHROMOSOME_LENGTH, size=n_variants)
+    order = numpy.lexsort((variant_positions, variant_chroms))
+
+    with open(path, "w") as vcf_file:
+        for line in HEADER_LINES:
+            vcf_file.write(line + "\n")
+        for chrom in chromosomes:
+            vcf_file.write(f"##contig=<ID={chrom},length={CHROMOSOME_LENGTH}>\n")
+        vcf_file.write(
+            "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"])
+            + "\t"
+            + "\t".join(samples)
+            + "\n"
+        )
+        for index in order:
+            fields = _variant_fields(
+                rng,
+                chromosomes[variant_chroms[index]],
+                int(variant_positions[index]),
+                index,
+                variant_classes[index],
+                chromosomes,
+            )
+            vcf_file.write("\t".join(fields + ["GT", _genotypes(rng, n_samples)]) + "\n")
+
+    return samples
+
+
+def add_generator_arguments(parser) -> None:
+    """Add the options of the synthetic VCF generator to an argument parser"""
+    parser.add_argument("--samples", type=int, default=100, help="number of samples")
+    parser.add_argument("--variants", type=int, default=10000, help="number of variants")
+    parser.add_argument(
+        "--sv-fraction", type=float, default=0.05, help="fraction of structural variants"
+    )
+    parser.add_argument("--bnd-fraction", type=float, default=0.01, help="fraction of breakends")
+    parser.add_argument(
+        "--chromosomes",
+        type=lambda value: value.split(","),
+        default=None,
+        help="comma-separated chromosomes the variants are spread on. Default: 1-22,X,Y",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="path of the VCF file to create")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    write_vcf(
+        args.path,
+        args.samples,
+        args.variants,
+        sv_fraction=args.sv_fraction,
+        bnd_fraction=args.bnd_fraction,
+        chromosomes=args.chromosomes,
+        seed=args.seed,
+    )
+    print(f"Created {args.path} with {args.variants} variants and {args.samples} samples")
+
+
+if __name__ == "__main__":
+    main()
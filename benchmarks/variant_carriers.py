@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of the extraction of sample calls from the genotypes of a VCF variant.
+
+Compares cgbeacon2.utils.parse.variant_carriers with the loop-based implementation that the
+vectorized extraction replaced, using random genotypes for increasing numbers of samples.
+
+Usage:
+    python benchmarks/variant_carriers.py [--repeat 1000]
+"""
+import argparse
+import timeit
+
+import numpy
+from cgbeacon2.utils.parse import variant_carriers
+from cgbeacon2.utils.sample_index import HET, HOM_ALT
+
+SAMPLE_SIZES = [3, 100, 1000, 5000]
+CARRIER_FREQUENCY = 0.05  # fraction of samples with a HET or HOM_ALT call
+
+
+def variant_called_loop(vcf_samples, gt_positions, g_types) -> dict:
+    """Loop-based extraction of sample calls replaced by the vectorized implementation, used as reference"""
+    samples_with_call = {}
+    allele_count = 0
+
+    for i, g_type in enumerate(g_types):
+        if i not in gt_positions:
+            continue
+
+        if g_type in [1, 3]:
+            if g_type == 1:
+                allele_count = 1
+            else:
+                allele_count = 2
+
+            samples_with_call[vcf_samples[i]] = {"allele_count": allele_count}
+
+    return samples_with_call
+
+
+def loop_carriers(samples_with_call, sample_indices) -> dict:
+    """Return the calls of the reference implementation as sample indices by genotype, like variant_carriers"""
+    carriers = {}
+    for sample, call in samples_with_call.items():
+        genotype = HET if call["allele_count"] == 1 else HOM_ALT
+        carriers.setdefault(genotype, []).append(sample_indices[sample])
+    return carriers
+
+
+def random_genotypes(n_samples, rng) -> numpy.ndarray:
+    """Return cyvcf2-like gt_types, mostly HOM_REF with some HET and HOM_ALT calls"""
+    carrier_gts = rng.choice([1, 3], size=n_samples)
+    is_carrier = rng.random(n_samples) < CARRIER_FREQUENCY
+    return numpy.where(is_carrier, carrier_gts, 0).astype(numpy.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=1000, help="calls timed for each function")
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    print(f"{'samples':>8} {'loop (us)':>12} {'vectorized (us)':>16} {'speedup':>8}")
+    for n_samples in SAMPLE_SIZES:
+        vcf_samples = [f"sample_{i}" for i in range(n_samples)]
+        gt_list = list(range(n_samples))
+        gt_array = numpy.array(gt_list, dtype=numpy.intp)
+        sample_indices = numpy.array(gt_list)
+        g_types = random_genotypes(n_samples, rng)
+
+        assert loop_carriers(
+            variant_called_loop(vcf_samples, gt_list, g_types),
+            {sample: i for i, sample in enumerate(vcf_samples)},
+        ) == variant_carriers(sample_indices, gt_array, g_types)
+
+        loop_time = timeit.timeit(
+            lambda: variant_called_loop(vcf_samples, gt_list, g_types), number=args.repeat
+        )
+        vect_time = timeit.timeit(
+            lambda: variant_carriers(sample_indices, gt_array, g_types), number=args.repeat
+        )
+        print(
+            f"{n_samples:>8} {loop_time / args.repeat * 1e6:>12.1f} "
+            f"{vect_time / args.repeat * 1e6:>16.1f} {loop_time / vect_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,20 @@ import datetime
 
 import click
 from cgbeacon2.cli.update import genes as update_genes
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE
 from cgbeacon2.models.user import User
-from cgbeacon2.utils.add import add_dataset, add_user, add_variants
-from cgbeacon2.utils.parse import count_variants, extract_variants, get_vcf_samples, merge_intervals
+from cgbeacon2.utils.add import add_dataset, add_user, add_variants, add_variants_parallel
+from cgbeacon2.utils.mongo import LOADING_CLIENT, client_settings
+from cgbeacon2.utils.parse import (
+    count_indexed_variants,
+    extract_variants,
+    get_vcf_samples,
+    indexed_contigs,
+    merge_intervals,
+    vcf_has_variants,
+)
 from cgbeacon2.utils.update import update_dataset, update_event
+from cgbeacon2.utils.variant_key import MD5_KEY
 from flask.cli import current_app, with_appcontext
 from pymongo.results import InsertOneResult
 
@@ -176,8 +186,22 @@ def dataset(did, name, build, authlevel, desc, version, url, update) -> None:
     required=False,
     help="one or more bed files containing genomic intervals",
 )
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=BULK_WRITE_BATCH_SIZE,
+    show_default=True,
+    help="number of variants saved to database with each bulk write",
+)
+@click.option(
+    "--processes",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="number of processes loading the chromosomes of an indexed VCF file in parallel",
+)
 @with_appcontext
-def variants(ds, vcf, sample, panel) -> None:
+def variants(ds, vcf, sample, panel, batch_size, processes) -> None:
     """Add variants from a VCF file to a dataset"""
     # make sure dataset id corresponds to a dataset in the database
 
@@ -198,30 +222,61 @@ def variants(ds, vcf, sample, panel) -> None:
 
     filter_intervals = None
     if len(panel) > 0:
-        # create BedTool panel with genomic intervals to filter VCF with
+        # create an index of genomic intervals to filter VCF with
         filter_intervals = merge_intervals(list(panel))
 
-    vcf_obj = extract_variants(vcf_file=vcf, samples=custom_samples, filter=filter_intervals)
-
-    if vcf_obj is None:
+    try:
+        has_variants = vcf_has_variants(vcf)
+    except Exception as err:  # cyvcf2 raises plain exceptions for unreadable headers and records
+        click.echo(f"Error while reading VCF file:{err}")
         raise click.Abort()
-
-    nr_variants = count_variants(vcf_obj)
-    if nr_variants == 0:
+    if has_variants is False:
         click.echo("Provided VCF file doesn't contain any variant")
         raise click.Abort()
 
-    vcf_obj = extract_variants(vcf_file=vcf, samples=custom_samples, filter=filter_intervals)
-
-    # ADD variants
-    added = add_variants(
-        database=current_app.db,
-        vcf_obj=vcf_obj,
-        samples=custom_samples,
-        assembly=dataset["assembly_id"],
-        dataset_id=ds,
-        nr_variants=nr_variants,
-    )
+    contigs = []
+    if processes > 1:
+        contigs = indexed_contigs(vcf) if filter_intervals is None else []
+        if not contigs:
+            click.echo(
+                "Parallel loading requires an indexed VCF file and no panel filter. Loading variants using one process"
+            )
+
+    if contigs:
+        # ADD variants, one chromosome per process
+        added = add_variants_parallel(
+            database_uri=current_app.config["DB_URI"],
+            database_name=current_app.config["DB_NAME"],
+            vcf_file=vcf,
+            contigs=contigs,
+            samples=custom_samples,
+            assembly=dataset["assembly_id"],
+            dataset_id=ds,
+            processes=processes,
+            batch_size=batch_size,
+            client_settings=client_settings(current_app.config, LOADING_CLIENT),
+            bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR"),
+            key_format=current_app.config.get("VARIANT_KEY_FORMAT", MD5_KEY),
+        )
+    else:
+        vcf_obj = extract_variants(vcf_file=vcf, samples=custom_samples)
+
+        if vcf_obj is None:
+            raise click.Abort()
+
+        # ADD variants
+        added = add_variants(
+            database=current_app.db,
+            vcf_obj=vcf_obj,
+            samples=custom_samples,
+            assembly=dataset["assembly_id"],
+            dataset_id=ds,
+            nr_variants=count_indexed_variants(vcf_obj) if filter_intervals is None else None,
+            intervals=filter_intervals,
+            batch_size=batch_size,
+            bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR"),
+            key_format=current_app.config.get("VARIANT_KEY_FORMAT", MD5_KEY),
+        )
     click.echo(f"{added} variants loaded into the database")
 
     if added > 0:
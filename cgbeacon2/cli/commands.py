@@ -7,7 +7,9 @@ from flask.cli import FlaskGroup
 
 from .add import add
 from .delete import delete
+from .index import index
 from .update import update
+from .worker import worker
 
 
 @click.version_option(__version__)
@@ -25,4 +27,6 @@ def cli(**_) -> None:
 
 cli.add_command(add)
 cli.add_command(delete)
+cli.add_command(index)
 cli.add_command(update)
+cli.add_command(worker)
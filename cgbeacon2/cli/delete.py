@@ -61,7 +61,9 @@ def variants(ds, sample) -> None:
             click.echo(f"Couldn't find any sample '{s}' in the sample list of dataset 'dataset'")
             raise click.Abort()
 
-    updated, removed = delete_variants(current_app.db, ds, sample)
+    updated, removed = delete_variants(
+        current_app.db, ds, sample, bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR")
+    )
     click.echo(f"Number of variants updated:{updated}, removed:{removed}")
 
     if updated + removed > 0:
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+
+import click
+from cgbeacon2.utils.bloom import bloom_filter_path, create_bloom_filter, open_bloom_filter
+from cgbeacon2.utils.index import create_indexes, missing_indexes, unused_indexes
+from flask.cli import current_app, with_appcontext
+
+MIN_BLOOM_CAPACITY = 1000000
+
+
+@click.group()
+def index():
+    """Manage database indexes using the CLI"""
+    pass
+
+
+@index.command()
+@with_appcontext
+def create() -> None:
+    """Create missing database indexes"""
+
+    created = create_indexes(current_app.db)
+    click.echo(f"Database indexes available:{', '.join(created)}")
+
+
+@index.command()
+@with_appcontext
+def rebuild() -> None:
+    """Drop and re-create all database indexes"""
+
+    click.confirm(
+        "Dropping and re-creating all database indexes. Do you want to continue?",
+        abort=True,
+    )
+    created = create_indexes(current_app.db, rebuild=True)
+    click.echo(f"Database indexes re-created:{', '.join(created)}")
+
+
+@index.command()
+@click.option(
+    "--assembly",
+    type=click.Choice(["GRCh37", "GRCh38"]),
+    multiple=True,
+    help="genome assembly of the variants. Default: all assemblies in database",
+)
+@click.option(
+    "--capacity",
+    type=click.INT,
+    help="number of variant keys the filter should accommodate. Default: twice the variants in database",
+)
+@click.option(
+    "--error-rate",
+    type=click.FLOAT,
+    default=0.001,
+    show_default=True,
+    help="false positive rate of the filter, when it contains 'capacity' keys",
+)
+@with_appcontext
+def bloom(assembly, capacity, error_rate) -> None:
+    """Create the Bloom filters of the variant keys, replacing any pre-existing filters.
+    Variants being added wait for the filters to be created"""
+
+    bloom_dir = current_app.config.get("BLOOM_FILTER_DIR")
+    if not bloom_dir:
+        click.echo("Please set the BLOOM_FILTER_DIR parameter in the app config file")
+        raise click.Abort()
+    os.makedirs(bloom_dir, exist_ok=True)
+
+    variant_collection = current_app.db["variant"]
+    for build in assembly or variant_collection.distinct("assemblyId"):
+        n_variants = variant_collection.count_documents({"assemblyId": build})
+        build_capacity = capacity or max(2 * n_variants, MIN_BLOOM_CAPACITY)
+        path = bloom_filter_path(bloom_dir, build)
+        n_keys = create_bloom_filter(
+            path,
+            (
+                variant["_id"]
+                for variant in variant_collection.find({"assemblyId": build}, {"_id": 1})
+            ),
+            build_capacity,
+            error_rate,
+        )
+        click.echo(f"Bloom filter {path} created with {n_keys} variants, capacity:{build_capacity}")
+
+
+@index.command()
+@with_appcontext
+def report() -> None:
+    """Report missing and unused database indexes"""
+
+    missing = missing_indexes(current_app.db)
+    for collection, indexes in missing.items():
+        click.echo(f"Missing indexes for collection '{collection}':{', '.join(indexes)}")
+    if not missing:
+        click.echo("No missing indexes")
+
+    for collection, indexes in unused_indexes(current_app.db).items():
+        click.echo(f"Unused indexes for collection '{collection}':{', '.join(indexes)}")
+
+    for build in ["GRCh37", "GRCh38"]:
+        bloom_filter = open_bloom_filter(current_app.config.get("BLOOM_FILTER_DIR"), build)
+        if bloom_filter is None:
+            continue
+        click.echo(
+            f"Bloom filter {bloom_filter.path}: {bloom_filter.count} variants added (capacity:{bloom_filter.capacity}), {bloom_filter.removed} removed from database since creation"
+        )
+        bloom_filter.close()
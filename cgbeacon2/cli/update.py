@@ -1,9 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import gzip
+
 import click
 from cgbeacon2.utils.ensembl_biomart import EnsemblBiomartClient
-from cgbeacon2.utils.update import update_genes
-from flask.cli import with_appcontext
+from cgbeacon2.utils.update import (
+    compact_variant_samples,
+    compute_datasets_stats,
+    update_allele_lengths,
+    update_event,
+    update_genes,
+    update_variant_counters,
+    update_variant_keys,
+)
+from cgbeacon2.utils.variant_key import COMPACT_KEY
+from flask.cli import current_app, with_appcontext
 
 
 @click.group()
@@ -21,15 +32,143 @@ def update():
     help="Genome assembly (default:GRCh37)",
     default="GRCh37",
 )
-def genes(build) -> None:
+@click.option(
+    "--file",
+    type=click.Path(exists=True),
+    help="Ensembl Biomart TSV file (optionally gzipped) to read genes from, instead of downloading them",
+)
+def genes(build, file) -> None:
     """Update genes and gene coordinates in database"""
 
-    click.echo(f"Collecting gene names from Ensembl, genome build -> {build}")
-    client = EnsemblBiomartClient(build)
-    gene_lines = client.query_service()
-    # If gene query was not successful, exit command
-    if gene_lines is None:
-        return
+    if file:
+        click.echo(f"Reading gene names from file {file}, genome build -> {build}")
+        open_file = gzip.open if file.endswith(".gz") else open
+        with open_file(file, "rt") as gene_lines:
+            n_inserted = update_genes(gene_lines, build)
+    else:
+        click.echo(f"Collecting gene names from Ensembl, genome build -> {build}")
+        client = EnsemblBiomartClient(build)
+        gene_lines = client.query_service()
+        # If gene query was not successful, exit command
+        if gene_lines is None:
+            return
+
+        n_inserted = update_genes(gene_lines, build)
+    click.echo(f"Number of inserted genes for build {build}: {n_inserted}\n")
+
+
+@update.command()
+@with_appcontext
+@click.option(
+    "--ds",
+    type=click.STRING,
+    multiple=True,
+    help="ID of one or more datasets (default: all datasets)",
+)
+@click.option(
+    "--recompute",
+    is_flag=True,
+    help="Count variants and allele calls in the variant collection and fix dataset stats",
+)
+def stats(ds, recompute) -> None:
+    """Show or recompute the variant and allele counts of datasets"""
+
+    query = {"_id": {"$in": list(ds)}} if ds else {}
+    datasets = list(current_app.db["dataset"].find(query))
+    if not datasets:
+        click.echo("Couldn't find any dataset in the database")
+        raise click.Abort()
+
+    computed = {}
+    if recompute:
+        computed = compute_datasets_stats(current_app.db, [dataset["_id"] for dataset in datasets])
+
+    for dataset in datasets:
+        saved_stats = {
+            "variant_count": dataset.get("variant_count", 0),
+            "allele_count": dataset.get("allele_count", 0),
+        }
+        click.echo(
+            f"Dataset '{dataset['_id']}': variants:{saved_stats['variant_count']}, alleles:{saved_stats['allele_count']}"
+        )
+        if recompute is False or computed[dataset["_id"]] == saved_stats:
+            continue
+
+        ds_stats = computed[dataset["_id"]]
+        current_app.db["dataset"].update_one({"_id": dataset["_id"]}, {"$set": ds_stats})
+        update_event(current_app.db, dataset["_id"], "dataset", True)
+        click.echo(
+            f"Dataset '{dataset['_id']}' stats updated to variants:{ds_stats['variant_count']}, alleles:{ds_stats['allele_count']}"
+        )
+
+
+@update.command()
+@with_appcontext
+@click.option(
+    "--ds",
+    type=click.STRING,
+    multiple=True,
+    help="ID of one or more datasets (default: all datasets)",
+)
+def variant_counters(ds) -> None:
+    """Save the sample and call counters of datasets in variants saved by previous software versions"""
+
+    query = {"_id": {"$in": list(ds)}} if ds else {}
+    ds_ids = [dataset["_id"] for dataset in current_app.db["dataset"].find(query, {"_id": 1})]
+    if not ds_ids:
+        click.echo("Couldn't find any dataset in the database")
+        raise click.Abort()
+
+    n_updated = update_variant_counters(current_app.db, ds_ids)
+    click.echo(f"Dataset counters saved in {n_updated} variants")
+
+
+@update.command()
+@with_appcontext
+@click.option(
+    "--ds",
+    type=click.STRING,
+    multiple=True,
+    help="ID of one or more datasets (default: all datasets)",
+)
+def compact_samples(ds) -> None:
+    """Replace the sample names saved in variants by previous software versions with sample indices"""
+
+    query = {"_id": {"$in": list(ds)}} if ds else {}
+    ds_ids = [dataset["_id"] for dataset in current_app.db["dataset"].find(query, {"_id": 1})]
+    if not ds_ids:
+        click.echo("Couldn't find any dataset in the database")
+        raise click.Abort()
+
+    n_updated = compact_variant_samples(current_app.db, ds_ids)
+    click.echo(f"Samples compacted in {n_updated} variants")
+
+
+@update.command()
+@with_appcontext
+def variant_keys() -> None:
+    """Convert the md5 _id of variants to compact keys, sorting variants by position in the _id index"""
+
+    if current_app.config.get("VARIANT_KEY_FORMAT") != COMPACT_KEY:
+        click.echo(
+            f"Set VARIANT_KEY_FORMAT = '{COMPACT_KEY}' in the app config before converting variant keys"
+        )
+        raise click.Abort()
+
+    try:
+        n_converted = update_variant_keys(
+            current_app.db, bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR")
+        )
+    except ValueError as err:
+        click.echo(str(err))
+        raise click.Abort()
+    click.echo(f"{n_converted} variants converted to compact keys")
+
+
+@update.command()
+@with_appcontext
+def allele_lengths() -> None:
+    """Save the length of reference and alternate bases in variants saved by previous software versions"""
 
-    n_inserted = update_genes(gene_lines, build)
-    click.echo(f"Number of inserted genes for build {build}: {len(n_inserted)}\n")
+    n_updated = update_allele_lengths(current_app.db)
+    click.echo(f"Allele lengths saved in {n_updated} variants")
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import click
+from cgbeacon2.server.worker import JobWorkerPool
+from flask.cli import current_app, with_appcontext
+
+
+@click.command()
+@click.option(
+    "--threads",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of jobs run in parallel (jobs for the same dataset are always run one at the time)",
+)
+@with_appcontext
+def worker(threads) -> None:
+    """Run the add and delete variants jobs created by API requests"""
+
+    pool = JobWorkerPool(
+        current_app._get_current_object(),
+        n_workers=threads,
+        poll_interval=current_app.config.get("JOB_POLL_INTERVAL", 5),
+        job_timeout=current_app.config.get("JOB_TIMEOUT", 300),
+        heartbeat_interval=current_app.config.get("JOB_HEARTBEAT_INTERVAL", 30),
+    )
+    click.echo(f"Starting {threads} worker thread(s). Press CTRL+C to stop")
+    pool.start()
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        click.echo("Stopping workers after their current job")
+        pool.stop()
@@ -1,3 +1,4 @@
+from .indexes import INDEXES
 from .oauth_errors import (
     EXPIRED_TOKEN_SIGNATURE,
     INVALID_TOKEN_AUTH,
@@ -8,7 +9,9 @@ from .oauth_errors import (
     PASSPORTS_ERROR,
 )
 from .query_errors import (
+    BATCH_TOO_LARGE,
     BUILD_MISMATCH,
+    INVALID_BATCH,
     INVALID_COORDINATES,
     NO_MANDATORY_PARAMS,
     NO_POSITION_PARAMS,
@@ -17,4 +20,4 @@ from .query_errors import (
 )
 from .request_errors import MISSING_TOKEN, WRONG_SCHEME
 from .response_objs import QUERY_PARAMS_API_V1
-from .variant_constants import CHROMOSOMES
+from .variant_constants import BULK_WRITE_BATCH_SIZE, CHROMOSOMES, MAX_WILDCARD_SEQUENCES
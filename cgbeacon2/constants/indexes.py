@@ -0,0 +1,40 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+####### DATABASE INDEXES #######
+INDEXES = {
+    "variant": [
+        IndexModel(
+            [
+                ("assemblyId", ASCENDING),
+                ("referenceName", ASCENDING),
+                ("start", ASCENDING),
+                ("end", ASCENDING),
+                ("referenceBases", ASCENDING),
+                ("alternateBases", ASCENDING),
+            ],
+            name="assembly_chrom_start_end_ref_alt",
+        ),
+        IndexModel(
+            [("assemblyId", ASCENDING), ("referenceName", ASCENDING), ("end", ASCENDING)],
+            name="assembly_chrom_end",
+        ),
+        # Supports queries on datasetIds.<dataset> and on the sample indices and counters of each dataset
+        IndexModel([("datasetIds.$**", ASCENDING)], name="dataset_samples"),
+    ],
+    "dataset": [
+        IndexModel([("authlevel", ASCENDING)], name="authlevel"),
+    ],
+    "user": [
+        IndexModel([("token", ASCENDING)], name="token"),
+    ],
+    "gene": [
+        IndexModel([("build", ASCENDING), ("hgnc_id", ASCENDING)], name="build_hgnc_id"),
+        IndexModel([("build", ASCENDING), ("ensembl_id", ASCENDING)], name="build_ensembl_id"),
+    ],
+    "event": [
+        IndexModel([("created", DESCENDING)], name="created"),
+    ],
+    "job": [
+        IndexModel([("status", ASCENDING), ("created", ASCENDING)], name="status_created"),
+    ],
+}
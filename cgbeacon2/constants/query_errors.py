@@ -28,3 +28,13 @@ BUILD_MISMATCH = dict(
     errorCode=400,
     errorMessage="Requested genome assembly is in conflict with the assembly of one or more requested datasets",
 )
+
+INVALID_BATCH = dict(
+    errorCode=400,
+    errorMessage="Batch queries require a non-empty list of allele requests in the 'alleleRequests' field",
+)
+
+BATCH_TOO_LARGE = dict(
+    errorCode=413,
+    errorMessage="Too many allele requests in batch query",
+)
@@ -1 +1,7 @@
 CHROMOSOMES = [str(i) for i in range(1, 23)] + ["X", "Y", "MT"]
+
+# Number of variants buffered by the loader before being sent to the database in a bulk write
+BULK_WRITE_BATCH_SIZE = 1000
+
+# Ref or alt alleles with N bases are queried using the list of sequences they represent, if not longer than this
+MAX_WILDCARD_SEQUENCES = 125  # i.e. up to 3 Ns
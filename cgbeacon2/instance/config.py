@@ -13,6 +13,51 @@ DB_NAME = "cgbeacon2-test"
 DB_URI = f"mongodb://{DB_HOST}:{DB_PORT}/{DB_NAME}"  # standalone MongoDB instance
 # DB_URI = "mongodb://localhost:27011,localhost:27012,localhost:27013/?replicaSet=rs0" # MongoDB replica set
 
+# MongoDB client settings, passed to pymongo.MongoClient (https://pymongo.readthedocs.io/en/stable/api/pymongo/mongo_client.html)
+MONGO_CLIENT = dict(
+    maxIdleTimeMS=300000,  # close connections idle for more than 5 minutes
+    serverSelectionTimeoutMS=10000,  # fail fast when no suitable server is available (i.e. during failover)
+    connectTimeoutMS=10000,
+)
+# Settings overriding MONGO_CLIENT for the client answering queries
+MONGO_QUERY_CLIENT = dict(
+    maxPoolSize=100,
+    socketTimeoutMS=30000,
+)
+# Settings overriding MONGO_CLIENT for the client saving and removing data (command line and add/delete jobs)
+MONGO_LOADING_CLIENT = dict(
+    maxPoolSize=10,
+    socketTimeoutMS=600000,
+    w="majority",  # write concern of bulk writes
+    wtimeoutMS=60000,
+)
+
+CHECK_INDEXES = False  # if True, warn at startup about missing database indexes
+DATASET_REGISTRY_TTL = 10  # seconds between checks for dataset changes in the event collection
+
+# Cache of query results. Cached results are discarded when datasets or variants are modified (within DATASET_REGISTRY_TTL seconds)
+QUERY_CACHE = dict(backend="lru", maxsize=10000)  # in-process cache, one for each server process
+# QUERY_CACHE = dict(backend="redis", url="redis://localhost:6379/0", ttl=3600) # cache shared by all server processes, requires the redis extra: pip install cgbeacon2[redis]
+# QUERY_CACHE = None # no query cache
+
+# Directory of the Bloom filters of variant keys, answering queries for variants which are not in the database without querying it.
+# Filters are created with 'beacon index bloom' and updated when variants are added. All processes adding variants must use the same directory
+BLOOM_FILTER_DIR = None
+
+# Format of the _id of the variants saved in database: "md5" (32-character hex string) or "compact" (14-byte binary key,
+# sorting variants by assembly, chromosome and start). Existing md5 keys are converted with 'beacon update variant-keys'
+VARIANT_KEY_FORMAT = "md5"
+LEGACY_VARIANT_KEYS = False  # set to True with the "compact" format while md5 keys are converted, so that queries look up both keys
+
+# Maximum number of allele requests accepted by the /apiv1.0/query/batch endpoint
+QUERY_BATCH_MAX_SIZE = 1000
+
+# Jobs created by add and delete requests are saved in the job collection and run by worker threads
+JOB_WORKERS = 0  # worker threads started by each server process (i.e. each gunicorn worker). With 0, jobs are run only by 'beacon worker'
+JOB_POLL_INTERVAL = 5  # seconds between checks for new jobs
+JOB_HEARTBEAT_INTERVAL = 30  # seconds between updates of running jobs by their worker
+JOB_TIMEOUT = 300  # running jobs not updated for this number of seconds (i.e. their worker was terminated) are queued again
+
 # ADMINS will receive email notification is app crashes
 # MAIL_SERVER = "smtp.gmail.com"
 # MAIL_PORT = 587
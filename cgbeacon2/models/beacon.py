@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
-import datetime
-
-import pymongo
 from cgbeacon2 import __version__
+from cgbeacon2.utils.dataset_registry import DatasetRegistry
 
 API_VERSION = "v1.0.1"
 
@@ -22,12 +20,13 @@ DATASET_MAPPING = {
 class Beacon:
     """Represents a general beacon object"""
 
-    def __init__(self, conf_obj, database=None) -> None:
+    def __init__(self, conf_obj, database=None, dataset_registry=None) -> None:
+        if dataset_registry is None:
+            dataset_registry = DatasetRegistry()
+        first_event_date, last_event_date = dataset_registry.event_dates(database)
         self.apiVersion = API_VERSION
-        self.createDateTime = conf_obj.get("createDateTime") or self._date_event(
-            database, pymongo.ASCENDING
-        )
-        self.updateDateTime = self._date_event(database, pymongo.DESCENDING)
+        self.createDateTime = conf_obj.get("createDateTime") or first_event_date
+        self.updateDateTime = last_event_date
         self.description = conf_obj.get("description")
         self.id = conf_obj.get("id")
         self.name = conf_obj.get("name")
@@ -36,23 +35,8 @@ class Beacon:
         self.version = f"v{__version__}"
         self.welcomeUrl = conf_obj.get("welcomeUrl")
         self.alternativeUrl = conf_obj.get("alternativeUrl")
-        self.datasets = self._datasets(database)
-        self.datasets_by_auth_level = self._datasets_by_access_level(database)
-
-    def _date_event(self, database, ordering) -> datetime.datetime:
-        """Return the date of the first event event created for this beacon
-
-        Accepts:
-            database(pymongo.database.Database)
-            ordering(pymongo.ASCENDING or pymongo.DESCENDING)
-
-        Returns
-            event.created(datetime.datetime): date of creation of the event
-        """
-        if database is not None:
-            events = database["event"].find().sort([("created", ordering)]).limit(1)
-            for event in events:
-                return event.get("created")
+        self.datasets = self._datasets(dataset_registry.datasets(database))
+        self.datasets_by_auth_level = dataset_registry.datasets_by_level(database)
 
     def info(self) -> dict:
         """Returns a the description of this beacon, with the fields required by the / endpoint"""
@@ -60,19 +44,17 @@ class Beacon:
         beacon_obj.pop("datasets_by_auth_level")
         return beacon_obj
 
-    def _datasets(self, database) -> list:
+    def _datasets(self, db_datasets) -> list:
         """Retrieve all datasets associated to this Beacon
 
         Accepts:
-            database(pymongo.database.Database)
+            db_datasets(dict): dataset objects saved in database, by dataset id
         Returns:
             datasets(list)
         """
-        if database is None:
-            return []
         datasets = []
 
-        for db_ds in database["dataset"].find():
+        for db_ds in db_datasets.values():
             if db_ds.get("samples") is None:
                 continue
             ds = {"sampleCount": len(db_ds.get("samples"))}
@@ -83,26 +65,6 @@ class Beacon:
 
         return datasets
 
-    def _datasets_by_access_level(self, database) -> dict:
-        """Retrieve all datasets associated to this Beacon, by access level
-
-        Accepts:
-            database(pymongo.database.Database)
-        Returns:
-            datasets_by_level(dict): the keys are "public", "registered", "controlled"
-        """
-        datasets_by_level = dict(public={}, registered={}, controlled={})
-
-        if database is None:
-            return datasets_by_level
-
-        datasets = database["dataset"].find()
-        for ds in list(datasets):
-            # add dataset as id=dataset_id, value=dataset to the dataset category
-            datasets_by_level[ds["authlevel"]][ds["_id"]] = ds
-
-        return datasets_by_level
-
     def _sample_allele_requests(self) -> list:
         """Returns a list of example allele requests"""
 
@@ -4,11 +4,11 @@
 class DatasetAlleleResponse:
     """Create a Beacon Dataset Allele Response object to be returned by Beacon Response"""
 
-    def __init__(self, dataset, variants) -> None:
+    def __init__(self, dataset, variants=None, counts=None) -> None:
         self.datasetId = dataset["_id"]
-        n_samples, n_alleles, n_variants = self._sample_allele_variant_count(
-            self.datasetId, variants
-        )
+        if counts is None:  # count samples, alleles and variants from query results
+            counts = self._sample_allele_variant_count(self.datasetId, variants)
+        n_samples, n_alleles, n_variants = counts
         self.sampleCount = n_samples
         self.callCount = n_alleles
         self.variantCount = n_variants
@@ -28,22 +28,24 @@ class DatasetAlleleResponse:
         return info
 
     def _sample_allele_variant_count(self, dataset_id, variants) -> tuple:
-        """Counts samples and allelic calls for one or more variants
+        """Counts samples and allelic calls of a dataset for one or more variants,
+        using the dataset counters saved in each variant
 
         Accepts:
             dataset_id(str)
             variants(list)
 
         Returns:
-            n_samples(int), n_calls(int)
+            n_samples(int), n_calls(int), n_variants(int)
         """
         n_samples = 0
         n_calls = 0
         n_variants = 0
         for variant_obj in variants:
-            if dataset_id in variant_obj.get("datasetIds"):
-                if variant_obj["datasetIds"][dataset_id].get("samples"):
-                    n_samples += len(variant_obj["datasetIds"][dataset_id]["samples"].keys())
-                n_variants += 1
-                n_calls += variant_obj["call_count"]
+            dataset_obj = variant_obj.get("datasetIds", {}).get(dataset_id)
+            if dataset_obj is None:
+                continue
+            n_samples += dataset_obj.get("sample_count", 0)
+            n_calls += dataset_obj.get("call_count", 0)
+            n_variants += 1
         return n_samples, n_calls, n_variants
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
-from cgbeacon2.utils.md5 import md5_key
+from cgbeacon2.utils.variant_key import MD5_KEY, variant_key
 
 
 class Variant:
     """A variant object"""
 
-    def __init__(self, parsed_variant, dataset_ids, genome_assembly="GRCh37") -> None:
+    def __init__(
+        self, parsed_variant, dataset_ids, genome_assembly="GRCh37", key_format=MD5_KEY
+    ) -> None:
         self.referenceName = parsed_variant["chromosome"]  # Accepting values 1-22, X, Y, MT
         if parsed_variant.get("mate_name"):
             self.mateName = parsed_variant["mate_name"]
@@ -15,17 +17,20 @@ class Variant:
         self.end = parsed_variant["end"]  # int
         self.referenceBases = "".join(parsed_variant["reference_bases"])  # str, '^([ACGT]+|N)$'
         self.alternateBases = "".join(parsed_variant["alternate_bases"])  # str, '^([ACGT]+|N)$'
+        self.referenceLength = len(self.referenceBases)  # int, used by queries with N bases
+        self.alternateLength = len(self.alternateBases)  # int
         if parsed_variant.get("variant_type"):
             self.variantType = parsed_variant[
                 "variant_type"
             ]  # is used to denote structural variants: 'INS', 'DUP', 'DEL', 'INV'
         self.assemblyId = genome_assembly  # str
-        self.datasetIds = dataset_ids  # list of dictionaries, i.e. [{ dataset_id: { samples : [list of samples]}  }]
-        self._id = md5_key(
+        self.datasetIds = dataset_ids  # dictionary, i.e. { dataset_id: { het: [0, 4], hom_alt: [2] } }, sample indices by genotype
+        self._id = variant_key(
             self.referenceName,
             self.start,
             self.end,
             self.referenceBases,
             self.alternateBases,
             genome_assembly,
-        )
+            key_format,
+        )  # md5 or compact key
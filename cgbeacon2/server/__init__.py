@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+import atexit
 import logging
 import os
 
+from cgbeacon2.server.worker import JobWorkerPool
+from cgbeacon2.utils.bloom import BloomFilterRegistry
+from cgbeacon2.utils.dataset_registry import DatasetRegistry
+from cgbeacon2.utils.index import missing_indexes
+from cgbeacon2.utils.mongo import LOADING_CLIENT, QUERY_CLIENT, client_settings, create_client
 from cgbeacon2.utils.notify import TlsSMTPHandler
+from cgbeacon2.utils.query_cache import create_query_cache
 from flask import Flask
-from pymongo import MongoClient
 
 from .blueprints import api_v1
 
@@ -63,10 +69,48 @@ def create_app() -> Flask:
     # If app is runned from inside a container, override host port
     db_uri = app.config["DB_URI"]
 
-    client = MongoClient(db_uri)
-    app.db = client[app.config["DB_NAME"]]
+    # Separate connection pools for saving/removing data and for answering queries
+    loading_client = create_client(db_uri, client_settings(app.config, LOADING_CLIENT))
+    query_client = create_client(db_uri, client_settings(app.config, QUERY_CLIENT))
+    for client in [loading_client, query_client]:
+        atexit.register(client.close)
+    app.db = loading_client[app.config["DB_NAME"]]
+    app.query_db = query_client[app.config["DB_NAME"]]
     LOG.info("database connection info:{}".format(app.db))
 
+    # In-process cache of the datasets saved in database
+    app.dataset_registry = DatasetRegistry(ttl=app.config.get("DATASET_REGISTRY_TTL", 10))
+
+    # Bloom filters answering exact queries for variants which are not in the database
+    app.bloom_filters = None
+    if app.config.get("BLOOM_FILTER_DIR"):
+        app.bloom_filters = BloomFilterRegistry(
+            app.config["BLOOM_FILTER_DIR"], ttl=app.config.get("DATASET_REGISTRY_TTL", 10)
+        )
+
+    # Cache of query results, invalidated by new events
+    app.query_cache = create_query_cache(app.config.get("QUERY_CACHE"))
+
+    # Worker threads running add and delete variants jobs in this process, disabled by default
+    app.job_pool = JobWorkerPool(
+        app,
+        n_workers=app.config.get("JOB_WORKERS", 0),
+        poll_interval=app.config.get("JOB_POLL_INTERVAL", 5),
+        job_timeout=app.config.get("JOB_TIMEOUT", 300),
+        heartbeat_interval=app.config.get("JOB_HEARTBEAT_INTERVAL", 30),
+    )
+    # Started with the first request (not by command line tools creating the app), resuming jobs
+    # left queued or running by a previous server process
+    if app.job_pool.n_workers > 0:
+        app.before_request(app.job_pool.start)
+
+    # Optionally check that database indexes are in place
+    if app.config.get("CHECK_INDEXES") is True:
+        for collection, indexes in missing_indexes(app.db).items():
+            LOG.warning(
+                f"Collection '{collection}' is missing indexes:{indexes}. Create them with 'beacon index create'"
+            )
+
     app.register_blueprint(api_v1.api1_bp)
 
     # Configure email logging of errors
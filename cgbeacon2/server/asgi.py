@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qsl
+
+from cgbeacon2.models import Beacon
+from cgbeacon2.models.beacon import API_VERSION
+from cgbeacon2.server.blueprints.api_v1.controllers import (
+    absent_variant_response,
+    allowed_datasets,
+    auth_projection,
+    auth_query,
+    cached_query_results,
+    create_allele_query,
+    create_ds_allele_response,
+    key_range_query,
+    range_query_pipeline,
+    variant_filtered_out,
+)
+from cgbeacon2.utils.auth import authlevel, prefetch_auth_data
+from cgbeacon2.utils.metrics import (
+    QUERY_STAGE_SECONDS,
+    MongoCommandCounter,
+    finish_request_metrics,
+    start_request_metrics,
+    timed,
+)
+from cgbeacon2.utils.mongo import QUERY_CLIENT, client_settings
+from pymongo import AsyncMongoClient
+from werkzeug.datastructures import Headers, MultiDict
+
+LOG = logging.getLogger(__name__)
+
+INFO_PATHS = ["/", "/apiv1.0/", "/apiv1.0/info"]
+QUERY_PATH = "/apiv1.0/query"
+
+
+class AsyncRequest:
+    """Request received by the ASGI app, with the attributes of a flask.request used by the query controllers"""
+
+    def __init__(self, scope, body) -> None:
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = Headers(
+            [(key.decode("latin-1"), value.decode("latin-1")) for key, value in scope["headers"]]
+        )
+        self.args = MultiDict(parse_qsl(scope.get("query_string", b"").decode("utf-8")))
+        self.form = MultiDict()
+        self.json = None
+        if self.method == "POST":
+            if self.headers.get("Content-type") == "application/x-www-form-urlencoded":
+                self.form = MultiDict(parse_qsl(body.decode("utf-8")))
+            else:
+                self.json = json.loads(body or b"{}")
+
+
+class AsyncQueryApp:
+    """ASGI application serving the read-only info and query endpoints on one event loop.
+
+    Variants are queried with the async MongoDB client and JWK sets and GA4GH passports are
+    collected with an async HTTP client (httpx), if installed. Query validation, dataset
+    responses, the dataset registry and the query cache are shared with the Flask app, whose
+    configuration is used. The beacon id and API version returned with query responses are set
+    once, when the app is created.
+    Datasets are still read by the dataset registry with the synchronous query client of the
+    Flask app, so the server keeps a pool of synchronous connections besides the async one.
+    The dataset registry and the query cache are used in worker threads, since they may send
+    blocking requests to the database or to the cache server.
+    All other endpoints must be served by the Flask (WSGI) app.
+    """
+
+    def __init__(self, flask_app) -> None:
+        self.flask_app = flask_app
+        self.beacon_id = flask_app.config["BEACON_OBJ"].get("id")
+        self.client = AsyncMongoClient(
+            flask_app.config["DB_URI"],
+            event_listeners=[MongoCommandCounter()],
+            **client_settings(flask_app.config, QUERY_CLIENT),
+        )
+        self.db = self.client[flask_app.config["DB_NAME"]]
+        self.http_client = None
+        try:
+            import httpx  # optional dependency, only required by the async server mode
+
+            self.http_client = httpx.AsyncClient(timeout=10)
+        except ImportError:
+            LOG.warning("httpx is not installed, auth data will be collected in worker threads")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        start_request_metrics()
+        with self.flask_app.app_context():
+            status, resp_obj = await self._dispatch(scope, body)
+            resp_body = self.flask_app.json.dumps(resp_obj).encode("utf-8")
+        finish_request_metrics(f"asgi:{scope['path']}", status)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(resp_body)).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": resp_body})
+
+    async def _lifespan(self, receive, send) -> None:
+        """Handle ASGI server startup and shutdown"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.client.close()
+                if self.http_client is not None:
+                    await self.http_client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _dispatch(self, scope, body) -> tuple:
+        """Route a request to the info or the query endpoint
+
+        Returns:
+            tuple(int, dict): (response status code, response object)
+        """
+        try:
+            request = AsyncRequest(scope, body)
+        except ValueError:
+            return 400, {"message": "Could not parse request body"}
+
+        try:
+            if request.path in INFO_PATHS and request.method == "GET":
+                return 200, await asyncio.to_thread(self.info)
+            if request.path == QUERY_PATH and request.method in ["GET", "POST"]:
+                return await self.query(request)
+        except Exception as ex:
+            LOG.exception(f"Error while handling request to {request.path}")
+            return 500, {"message": str(ex)}
+        return 404, {
+            "message": f"{request.method} {request.path} is not served by the async server"
+        }
+
+    def info(self) -> dict:
+        """Returns Beacon info data"""
+        beacon_config = self.flask_app.config.get("BEACON_OBJ")
+        beacon = Beacon(beacon_config, self.flask_app.query_db, self.flask_app.dataset_registry)
+        return beacon.info()
+
+    async def query(self, request) -> tuple:
+        """Create a query from params provided in the request and return a response with eventual results, or errors
+
+        Returns:
+            tuple(int, dict): (response status code, response object)
+        """
+        with timed(QUERY_STAGE_SECONDS, "auth"):
+            auth_levels = await self.authlevel(request)
+        if isinstance(auth_levels, dict):  # an error must have occurred, otherwise it's a tuple
+            return auth_levels.get("errorCode", 403), auth_levels
+
+        customer_query, mongo_query, error = create_allele_query(request)
+
+        resp_obj = {"beaconId": self.beacon_id, "apiVersion": API_VERSION}
+        if error:
+            resp_obj["error"] = error
+            resp_obj["exists"] = None
+            return error["errorCode"], resp_obj
+
+        response_type = customer_query.get("includeDatasetResponses", "NONE")
+        query_datasets = customer_query.get("datasetIds", [])
+        exists, ds_allele_responses = await self.cached_dispatch_query(
+            mongo_query,
+            response_type,
+            query_datasets,
+            auth_levels,
+            assembly=customer_query.get("assemblyId"),
+        )
+        resp_obj["exists"] = exists
+        resp_obj["datasetAlleleResponses"] = ds_allele_responses
+        return 200, resp_obj
+
+    async def authlevel(self, request):
+        """Return the auth level of a request, collecting the auth data it requires without blocking the event loop"""
+        oauth2_settings = self.flask_app.config.get("ELIXIR_OAUTH2")
+        if "Authorization" not in request.headers:
+            return authlevel(request, oauth2_settings)
+        if self.http_client is None:
+            return await asyncio.to_thread(authlevel, request, oauth2_settings)
+        await prefetch_auth_data(
+            request.headers.get("Authorization"), oauth2_settings, self.http_client
+        )
+        return authlevel(request, oauth2_settings)
+
+    async def cached_dispatch_query(
+        self, mongo_query, response_type, datasets, auth_levels, assembly=None
+    ):
+        """Return the results of a query from the variant Bloom filter or the app query cache, if available,
+        otherwise query the database"""
+        if variant_filtered_out(mongo_query, assembly):
+            return absent_variant_response(response_type, datasets)
+        if self.flask_app.query_cache is None:
+            return await self.dispatch_query(mongo_query, response_type, datasets, auth_levels)
+
+        cache_key, results = await asyncio.to_thread(
+            cached_query_results, mongo_query, response_type, datasets, auth_levels
+        )
+        if results is None:
+            results = await self.dispatch_query(mongo_query, response_type, datasets, auth_levels)
+            await asyncio.to_thread(self.flask_app.query_cache.set, cache_key, results)
+        return results
+
+    async def dispatch_query(self, mongo_query, response_type, datasets, auth_levels) -> tuple:
+        """Query variant collection with the async database client.
+        Accepts the same parameters and returns the same results as controllers.dispatch_query
+        """
+        variant_collection = self.db["variant"]
+        ds_ids = await asyncio.to_thread(allowed_datasets, auth_levels)
+        if not ds_ids:
+            return create_ds_allele_response(response_type, set(datasets), ds_counts={})
+        if "_id" in mongo_query:  # exact variant query
+            variant_query = auth_query(mongo_query, ds_ids)
+        else:
+            variant_query = auth_query(key_range_query(mongo_query), ds_ids)
+
+        if response_type == "NONE":
+            with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+                return await variant_collection.find_one(variant_query, {"_id": 1}) is not None, []
+
+        if "_id" in mongo_query:  # exact variant query
+            with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+                variants = await variant_collection.find(
+                    variant_query, auth_projection(ds_ids)
+                ).to_list(None)
+            with timed(QUERY_STAGE_SECONDS, "response"):
+                return create_ds_allele_response(response_type, set(datasets), variants)
+
+        with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+            cursor = await variant_collection.aggregate(range_query_pipeline(variant_query, ds_ids))
+            ds_counts = {
+                res["_id"]: (res["sampleCount"], res["callCount"], res["variantCount"])
+                async for res in cursor
+            }
+        with timed(QUERY_STAGE_SECONDS, "response"):
+            return create_ds_allele_response(response_type, set(datasets), ds_counts=ds_counts)
+
+
+def create_asgi_app(flask_app=None) -> AsyncQueryApp:
+    """Create the ASGI app serving the info and query endpoints
+
+    Accepts:
+        flask_app(flask.Flask): app providing configuration, database and caches. Created if not provided
+
+    Returns:
+        asgi_app(AsyncQueryApp)
+    """
+    if flask_app is None:
+        from cgbeacon2.server import create_app
+
+        flask_app = create_app()
+    return AsyncQueryApp(flask_app)
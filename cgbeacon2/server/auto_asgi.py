@@ -0,0 +1,3 @@
+from cgbeacon2.server.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import logging
+from itertools import product
 from os.path import exists
 from typing import Union
 
 from cgbeacon2.constants import (
     BUILD_MISMATCH,
+    BULK_WRITE_BATCH_SIZE,
     INVALID_COORDINATES,
+    MAX_WILDCARD_SEQUENCES,
     NO_MANDATORY_PARAMS,
     NO_POSITION_PARAMS,
     NO_SECONDARY_PARAMS,
@@ -14,24 +17,36 @@ from cgbeacon2.constants import (
 )
 from cgbeacon2.models import DatasetAlleleResponse
 from cgbeacon2.utils.add import add_variants as variants_loader
+from cgbeacon2.utils.add import add_variants_parallel as parallel_variants_loader
 from cgbeacon2.utils.delete import delete_variants as variant_deleter
 from cgbeacon2.utils.md5 import md5_key
+from cgbeacon2.utils.metrics import (
+    BLOOM_FILTER_LOOKUPS,
+    QUERY_CACHE_LOOKUPS,
+    QUERY_STAGE_SECONDS,
+    timed,
+)
+from cgbeacon2.utils.mongo import LOADING_CLIENT, client_settings
 from cgbeacon2.utils.parse import (
     compute_filter_intervals,
-    count_variants,
+    count_indexed_variants,
     extract_variants,
     get_vcf_samples,
+    indexed_contigs,
 )
 from cgbeacon2.utils.update import update_dataset
+from cgbeacon2.utils.variant_key import COMPACT_KEY, MD5_KEY, compact_key_range, variant_key
 from flask import current_app
 
 RANGE_COORDINATES = ("startMin", "startMax", "endMin", "endMax")
+WILDCARD_BASES = "ACGTN"  # bases matched by N in a query
+ALLELE_LENGTH_FIELDS = {"referenceBases": "referenceLength", "alternateBases": "alternateLength"}
 LOG = logging.getLogger(__name__)
 
 
 def stats() -> dict:
     """Return general stats to be displayed on landing page"""
-    db = current_app.db
+    db = current_app.query_db
     stats = dict(
         db_name=current_app.config.get("DB_NAME"),
         n_datasets=db["dataset"].count_documents({}),
@@ -113,13 +128,16 @@ def validate_delete_data(req) -> Union[None, str]:
         return "One or more provided samples was not found in the dataset"
 
 
-def add_variants_task(req) -> None:
+def add_variants_task(req_data, progress_callback=None) -> int:
     """Perform the actual task of adding variants to the database after receiving an add request
     Accepts:
-        req(flask.request): POST request received by server
+        req_data(dict): data of the POST request received by server
+        progress_callback(function): called with the number of variants saved after each batch
+
+    Returns:
+        added(int): number of variants added or updated
     """
     db = current_app.db
-    req_data = req.json
     dataset_id = req_data.get("dataset_id")
     samples = req_data.get("samples", [])
     assembly = req_data.get("assemblyId")
@@ -128,25 +146,49 @@ def add_variants_task(req) -> None:
     if genes:
         filter_intervals = compute_filter_intervals(req_data)
 
-    vcf_obj = extract_variants(
-        vcf_file=req_data.get("vcf_path"), samples=samples, filter=filter_intervals
-    )
-    nr_variants = count_variants(vcf_obj)
-    vcf_obj = extract_variants(
-        vcf_file=req_data.get("vcf_path"), samples=samples, filter=filter_intervals
-    )
-    added = variants_loader(
-        database=db,
-        vcf_obj=vcf_obj,
-        samples=set(samples),
-        assembly=assembly,
-        dataset_id=dataset_id,
-        nr_variants=nr_variants,
-    )
+    vcf_path = req_data.get("vcf_path")
+    batch_size = req_data.get("batch_size", BULK_WRITE_BATCH_SIZE)
+    processes = req_data.get("processes", 1)
+    contigs = []
+    if processes > 1 and filter_intervals is None:
+        contigs = indexed_contigs(vcf_path)
+
+    if contigs:  # Load the chromosomes of an indexed VCF in parallel
+        added = parallel_variants_loader(
+            database_uri=current_app.config["DB_URI"],
+            database_name=current_app.config["DB_NAME"],
+            vcf_file=vcf_path,
+            contigs=contigs,
+            samples=set(samples),
+            assembly=assembly,
+            dataset_id=dataset_id,
+            processes=processes,
+            batch_size=batch_size,
+            progress_callback=progress_callback,
+            client_settings=client_settings(current_app.config, LOADING_CLIENT),
+            bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR"),
+            key_format=current_app.config.get("VARIANT_KEY_FORMAT", MD5_KEY),
+        )
+    else:
+        vcf_obj = extract_variants(vcf_file=vcf_path, samples=samples)
+        added = variants_loader(
+            database=db,
+            vcf_obj=vcf_obj,
+            samples=set(samples),
+            assembly=assembly,
+            dataset_id=dataset_id,
+            nr_variants=count_indexed_variants(vcf_obj) if filter_intervals is None else None,
+            intervals=filter_intervals,
+            batch_size=batch_size,
+            progress_callback=progress_callback,
+            bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR"),
+            key_format=current_app.config.get("VARIANT_KEY_FORMAT", MD5_KEY),
+        )
     if added > 0:
         # Update dataset object accordingly
         update_dataset(database=db, dataset_id=dataset_id, samples=samples, add=True)
     LOG.info(f"Number of inserted variants for samples:{samples}:{added}")
+    return added
 
 
 def overlapping_samples(dataset_samples, request_samples) -> bool:
@@ -165,21 +207,26 @@ def overlapping_samples(dataset_samples, request_samples) -> bool:
     return all(sample in ds_sampleset for sample in sampleset)
 
 
-def delete_variants_task(req) -> None:
+def delete_variants_task(req_data) -> tuple:
     """Perform the actual task of removing variants from the database after receiving an delete request
     Accepts:
-        req(flask.request): POST request received by server
+        req_data(dict): data of the POST request received by server
+
+    Returns:
+        updated, removed(tuple): number of variants updated and number of variants removed
     """
     db = current_app.db
-    req_data = req.json
 
     dataset_id = req_data.get("dataset_id")
     samples = req_data.get("samples")
 
-    updated, removed = variant_deleter(db, dataset_id, samples)
+    updated, removed = variant_deleter(
+        db, dataset_id, samples, bloom_filter_dir=current_app.config.get("BLOOM_FILTER_DIR")
+    )
     if updated + removed > 0:
         update_dataset(database=db, dataset_id=dataset_id, samples=samples, add=False)
         LOG.info(f"Number of updated variants:{updated}. Number of deleted variants:{removed}")
+    return updated, removed
 
 
 def create_allele_query(req) -> tuple:
@@ -214,17 +261,55 @@ def create_allele_query(req) -> tuple:
         data.clear()
         data.update(filtered)
 
+    customer_query.update(_customer_query_params(data))
+
+    # check if the minimum required params were provided in query
+    error = check_allele_request(customer_query, mongo_query)
+
+    return customer_query, mongo_query, error
+
+
+def create_allele_queries(allele_requests) -> list:
+    """Create the database queries for the allele requests of a batch query
+
+    Accepts:
+        allele_requests(list): list of dictionaries with the params of an allele query each
+
+    Returns:
+        queries(list): a (customer_query, mongo_query, error) tuple for each allele request
+    """
+    queries = []
+    for data in allele_requests:
+        customer_query = {}
+        mongo_query = {}
+        if not isinstance(data, dict):
+            queries.append((customer_query, mongo_query, NO_MANDATORY_PARAMS))
+            continue
+        data = {k: v for k, v in data.items() if v != ""}
+        customer_query["datasetIds"] = data.get("datasetIds", [])
+        customer_query.update(_customer_query_params(data))
+        error = check_allele_request(customer_query, mongo_query)
+        queries.append((customer_query, mongo_query, error))
+    return queries
+
+
+def _customer_query_params(data) -> dict:
+    """Collect the query params of an allele request
+
+    Accepts:
+        data(dict): params provided in the request
+
+    Returns:
+        customer_query(dict): allele query params, with includeDatasetResponses set to NONE if missing
+    """
+    customer_query = {}
     # loop over all available query params
     for param in QUERY_PARAMS_API_V1:
         if data.get(param):
             customer_query[param] = data[param]
     if "includeDatasetResponses" not in customer_query:
         customer_query["includeDatasetResponses"] = "NONE"
-
-    # check if the minimum required params were provided in query
-    error = check_allele_request(customer_query, mongo_query)
-
-    return customer_query, mongo_query, error
+    return customer_query
 
 
 def check_allele_request(customer_query, mongo_query) -> None:
@@ -326,7 +411,9 @@ def _set_exact_position_query(start, end, mongo_query) -> Union[None, dict]:
         return INVALID_COORDINATES
 
 
-def _simple_search_id(customer_query, chrom, start, end, ref, alt, build) -> Union[None, str]:
+def _simple_search_id(
+    customer_query, chrom, start, end, ref, alt, build
+) -> Union[None, str, bytes, dict]:
     """Check if query is simple query: SNV with precise coordinates, alt and ref
 
     Accepts:
@@ -339,7 +426,7 @@ def _simple_search_id(customer_query, chrom, start, end, ref, alt, build) -> Uni
         build(str)
 
     Returns:
-        str(md5_key) or None
+        variant key (str or bytes), {"$in": [compact key, md5 key]} while md5 keys are converted, or None
     """
 
     # If customer wants to match a SNV with precise coordinates, alt and ref
@@ -349,15 +436,50 @@ def _simple_search_id(customer_query, chrom, start, end, ref, alt, build) -> Uni
         and not "N" in ref
         and not "N" in alt
     ):
-        # generate md5_key to quickly compare with our database
-        return md5_key(
-            chrom,
-            start,
-            end,
-            ref,
-            alt,
-            build,
-        )
+        # generate the variant key to quickly compare with our database
+        key_format = current_app.config.get("VARIANT_KEY_FORMAT", MD5_KEY)
+        try:
+            key = variant_key(chrom, start, end, ref, alt, build, key_format)
+        except ValueError:  # no compact key for these coordinates, use a regular query
+            return None
+        if key_format == COMPACT_KEY and current_app.config.get("LEGACY_VARIANT_KEYS"):
+            return {"$in": [key, md5_key(chrom, start, end, ref, alt, build)]}
+        return key
+
+
+def exact_query_keys(mongo_query) -> list:
+    """Return the variant keys looked up by an exact variant query
+
+    Accepts:
+        mongo_query(dict): a query dictionary containing a variant _id
+
+    Returns:
+        keys(list): one key, or the keys of both formats while md5 keys are converted
+    """
+    key = mongo_query["_id"]
+    return key["$in"] if isinstance(key, dict) else [key]
+
+
+def key_range_query(mongo_query) -> dict:
+    """Add bounds on the variant _id to a range query when variants are saved with compact keys,
+    which sort variants by genome assembly, chromosome and start in the _id index
+
+    Accepts:
+        mongo_query(dict): a range query dictionary
+
+    Returns:
+        mongo_query(dict): a copy of the query with _id bounds, or the query itself
+    """
+    if current_app.config.get("VARIANT_KEY_FORMAT") != COMPACT_KEY or current_app.config.get(
+        "LEGACY_VARIANT_KEYS"
+    ):
+        return mongo_query
+    key_range = compact_key_range(
+        mongo_query.get("assemblyId"), mongo_query.get("referenceName"), mongo_query.get("start")
+    )
+    if key_range is None:
+        return mongo_query
+    return dict(mongo_query, _id=key_range)
 
 
 def _check_query_datasets(datasets, build) -> Union[None, dict]:
@@ -372,7 +494,8 @@ def _check_query_datasets(datasets, build) -> Union[None, dict]:
     """
     if len(datasets) > 0:
         # Check that requested datasets are contained in this beacon
-        dsets = list(current_app.db["dataset"].find({"_id": {"$in": datasets}}))
+        all_dsets = current_app.dataset_registry.datasets(current_app.query_db)
+        dsets = [all_dsets[ds_id] for ds_id in datasets if ds_id in all_dsets]
         if len(dsets) == 0:  # requested dataset is not present in database
             return UNKNOWN_DATASETS
 
@@ -415,18 +538,176 @@ def _set_fuzzy_coord_query(customer_query, mongo_query) -> Union[None, dict]:
 
 
 def add_coords_query(mongo_query, field, value) -> None:
-    """Created a regex for a database query when ref or alt coords contain Ns
+    """Add ref or alt bases to a database query. N bases match any base:
+    alleles with few Ns are expanded to the list of sequences they represent, which keeps the query
+    on the allele fields of the variant index, otherwise an anchored regex is used together with
+    the allele length saved in variants
 
     Accepts:
         mongo_query(dict): an allele query dictionary
         field(string): "referenceBases" or "alternateBases"
         value(string): A stretch of bases, might containg Ns
     """
-
-    if "N" in value:
-        mongo_query[field] = {"$regex": value.replace("N", ".")}
-    else:
+    n_wildcards = value.count("N")
+    if n_wildcards == 0:
         mongo_query[field] = value
+    elif value == "N":
+        return  # a single N matches alleles of any length (i.e. reference bases of structural variants)
+    elif len(WILDCARD_BASES) ** n_wildcards <= MAX_WILDCARD_SEQUENCES:
+        mongo_query[field] = {"$in": _wildcard_sequences(value)}
+    else:
+        mongo_query[field] = {"$regex": "".join(["^", value.replace("N", "."), "$"])}
+        mongo_query[ALLELE_LENGTH_FIELDS[field]] = len(value)
+
+
+def _wildcard_sequences(value) -> list:
+    """Return all the sequences represented by a stretch of bases containing Ns"""
+    parts = value.split("N")
+    sequences = []
+    for bases in product(WILDCARD_BASES, repeat=len(parts) - 1):
+        sequences.append(parts[0] + "".join(base + part for base, part in zip(bases, parts[1:])))
+    return sequences
+
+
+def cached_dispatch_query(
+    mongo_query, response_type, datasets=[], auth_levels=([], False), assembly=None
+) -> tuple:
+    """Return the results of a query from the app query cache, if available, otherwise query the database
+    and save the results to the cache. Accepts the same parameters as dispatch_query, plus the
+    genome assembly of the query, used to look up exact variant queries in the variant Bloom filter.
+
+    Returns:
+        tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
+    """
+    if variant_filtered_out(mongo_query, assembly):
+        return absent_variant_response(response_type, datasets)
+
+    query_cache = current_app.query_cache
+    if query_cache is None:
+        return dispatch_query(mongo_query, response_type, datasets, auth_levels)
+
+    cache_key, results = cached_query_results(mongo_query, response_type, datasets, auth_levels)
+    if results is None:
+        results = dispatch_query(mongo_query, response_type, datasets, auth_levels)
+        query_cache.set(cache_key, results)
+    return results
+
+
+def cached_query_results(mongo_query, response_type, datasets, auth_levels) -> tuple:
+    """Look up the results of a query in the app query cache
+
+    Accepts:
+        mongo_query(dic): a query dictionary
+        response_type(str): ALL, HIT, MISS or NONE
+        datasets(list): dataset ids from request "datasetIds" field
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+
+    Returns:
+        tuple(str, tuple): (cache key, cached results or None)
+    """
+    query_cache = current_app.query_cache
+    with timed(QUERY_STAGE_SECONDS, "cache"):
+        last_event_id = current_app.dataset_registry.last_event_id(current_app.query_db)
+        cache_key = query_cache.key(
+            mongo_query, response_type, datasets, auth_levels, last_event_id
+        )
+        results = query_cache.get(cache_key)
+    QUERY_CACHE_LOOKUPS.inc(result="miss" if results is None else "hit")
+    return cache_key, results
+
+
+def variant_filtered_out(mongo_query, assembly) -> bool:
+    """Check if the variant of an exact query is definitely not in the database, according to the
+    variant Bloom filter of the genome assembly. Without a filter, variants are never filtered out.
+
+    Accepts:
+        mongo_query(dic): a query dictionary
+        assembly(str): genome assembly of the query
+
+    Returns:
+        bool: True if the query can't match any variant
+    """
+    bloom_filters = current_app.bloom_filters
+    if bloom_filters is None or assembly is None or "_id" not in mongo_query:
+        return False
+    with timed(QUERY_STAGE_SECONDS, "bloom_filter"):
+        filtered_out = not any(
+            bloom_filters.might_contain(assembly, key) for key in exact_query_keys(mongo_query)
+        )
+    BLOOM_FILTER_LOOKUPS.inc(result="absent" if filtered_out else "maybe")
+    return filtered_out
+
+
+def absent_variant_response(response_type, datasets) -> tuple:
+    """Return the response of an exact query whose variant is not in the database
+
+    Accepts:
+        response_type(str): ALL, HIT, MISS or NONE
+        datasets(list): dataset ids from request "datasetIds" field
+
+    Returns:
+        tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
+    """
+    if response_type == "NONE":
+        return False, []
+    return create_ds_allele_response(response_type, set(datasets), [])
+
+
+def dispatch_batch_query(queries, auth_levels=([], False)) -> list:
+    """Query variant collection with the queries of a batch request.
+    Queries matching a variant _id are resolved with a single database lookup, the others one at the time.
+
+    Accepts:
+        queries(list): (customer_query, mongo_query, error) tuples returned by create_allele_queries
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+
+    Returns:
+        results(list): a (allele_exists(bool), datasetAlleleResponses(list)) tuple for each query,
+            or None for queries with errors
+    """
+    exact_ids = {
+        key
+        for customer_query, mongo_query, error in queries
+        if error is None
+        and "_id" in mongo_query
+        and not variant_filtered_out(mongo_query, customer_query.get("assemblyId"))
+        for key in exact_query_keys(mongo_query)
+    }
+    variants_by_id = {}
+    ds_ids = allowed_datasets(auth_levels)
+    if exact_ids and ds_ids:
+        projection = auth_projection(ds_ids)
+        projection["_id"] = 1
+        with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+            variants_by_id = {
+                variant["_id"]: variant
+                for variant in current_app.query_db["variant"].find(
+                    auth_query({"_id": {"$in": list(exact_ids)}}, ds_ids), projection
+                )
+            }
+
+    results = []
+    for customer_query, mongo_query, error in queries:
+        if error is not None:
+            results.append(None)
+            continue
+
+        response_type = customer_query.get("includeDatasetResponses", "NONE")
+        datasets = customer_query.get("datasetIds", [])
+        if "_id" not in mongo_query:
+            results.append(cached_dispatch_query(mongo_query, response_type, datasets, auth_levels))
+            continue
+
+        variants = [
+            variants_by_id[key] for key in exact_query_keys(mongo_query) if key in variants_by_id
+        ]
+        if response_type == "NONE":
+            results.append((len(variants) > 0, []))
+            continue
+        with timed(QUERY_STAGE_SECONDS, "response"):
+            results.append(create_ds_allele_response(response_type, set(datasets), variants))
+
+    return results
 
 
 def dispatch_query(mongo_query, response_type, datasets=[], auth_levels=([], False)) -> tuple:
@@ -446,18 +727,24 @@ def dispatch_query(mongo_query, response_type, datasets=[], auth_levels=([], Fal
         tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
 
     """
-    variant_collection = current_app.db["variant"]
+    variant_collection = current_app.query_db["variant"]
 
     LOG.info(f"Perform database query -----------> {mongo_query}.")
     LOG.info(f"Response level (datasetAlleleResponses) -----> {response_type}.")
 
-    # End users are only interested in knowing which datasets have one or more specific vars, return only datasets and callCount
-    variants = list(
-        variant_collection.find(mongo_query, {"_id": 0, "datasetIds": 1, "call_count": 1})
-    )
+    # Range queries might match many variants: count samples, calls and variants in the database
+    if "_id" not in mongo_query:
+        return _dispatch_range_query(mongo_query, response_type, datasets, auth_levels)
 
-    # Filter variants by auth level specified by user token (or lack of it)
-    variants = results_filter_by_auth(variants, auth_levels)
+    # Consider only variants and datasets the user has access to (specified by token, if present, otherwise public access only datasets)
+    ds_ids = allowed_datasets(auth_levels)
+    variants = []
+    if ds_ids:
+        # End users are only interested in knowing which datasets have one or more specific vars, return only datasets and callCount
+        with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+            variants = list(
+                variant_collection.find(auth_query(mongo_query, ds_ids), auth_projection(ds_ids))
+            )
 
     if response_type == "NONE":
         if len(variants) > 0:
@@ -468,58 +755,147 @@ def dispatch_query(mongo_query, response_type, datasets=[], auth_levels=([], Fal
         req_dsets = set(datasets)
 
         # IDs of datasets found for this variant(s)
-        result = create_ds_allele_response(response_type, req_dsets, variants)
+        with timed(QUERY_STAGE_SECONDS, "response"):
+            result = create_ds_allele_response(response_type, req_dsets, variants)
         return result
 
     return False, []
 
 
-def results_filter_by_auth(variants, auth_levels) -> list:
-    """Filter variants returned by query using auth levels (specified by token, if present, otherwise public access only datasets)
+def _dispatch_range_query(mongo_query, response_type, datasets, auth_levels) -> tuple:
+    """Query variant collection using a range query, aggregating results by dataset in the database
 
     Accepts:
-        variants(list): a list of variants returned by database query
+        mongo_query(dic): a query dictionary
+        response_type(str): ALL, HIT, MISS or NONE
+        datasets(list): dataset ids from request "datasetIds" field
         auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
 
-    Return:
-        filtered_variants(list): Variants filtered using authlevel criteria
+    Returns:
+        tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
+    """
+    variant_collection = current_app.query_db["variant"]
+
+    # Consider only variants found in datasets the user has access to
+    ds_ids = allowed_datasets(auth_levels)
+    if not ds_ids:
+        return create_ds_allele_response(response_type, set(datasets), ds_counts={})
+    variant_query = auth_query(key_range_query(mongo_query), ds_ids)
+
+    if response_type == "NONE":
+        with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+            return variant_collection.find_one(variant_query, {"_id": 1}) is not None, []
+
+    pipeline = range_query_pipeline(variant_query, ds_ids)
+    with timed(QUERY_STAGE_SECONDS, "mongo_query"):
+        ds_counts = {
+            res["_id"]: (res["sampleCount"], res["callCount"], res["variantCount"])
+            for res in variant_collection.aggregate(pipeline)
+        }
+    with timed(QUERY_STAGE_SECONDS, "response"):
+        return create_ds_allele_response(response_type, set(datasets), ds_counts=ds_counts)
+
+
+def range_query_pipeline(variant_query, dataset_ids) -> list:
+    """Create an aggregation pipeline counting samples, calls and variants of each dataset matching a range query
+
+    Accepts:
+        variant_query(dict): a range query, restricted to the datasets the user has access to
+        dataset_ids(list): IDs of the datasets the user has access to
+
+    Returns:
+        pipeline(list)
     """
+    return [
+        {"$match": variant_query},
+        {
+            "$project": {
+                "_id": 0,
+                "datasets": {"$objectToArray": "$datasetIds"},
+            }
+        },
+        {"$unwind": "$datasets"},
+        # Don't count samples and calls of datasets the user has no access to
+        {"$match": {"datasets.k": {"$in": dataset_ids}}},
+        {
+            "$group": {
+                "_id": "$datasets.k",
+                "sampleCount": {"$sum": "$datasets.v.sample_count"},
+                "callCount": {"$sum": "$datasets.v.call_count"},
+                "variantCount": {"$sum": 1},
+            }
+        },
+    ]
+
+
+def allowed_datasets(auth_levels) -> list:
+    """Return the IDs of the datasets that can be queried with the given auth levels
+
+    Accepts:
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
 
-    # Filter variants by auth level (specified by token, if present, otherwise public access only datasets)
-    ds_collection = current_app.db["dataset"]
-    public_ds = ds_collection.find({"authlevel": "public"})
-    pyblic_ds_ids = [ds["_id"] for ds in public_ds]
+    Returns:
+        dataset_ids(list): public datasets + registered and controlled datasets the user has access to
+    """
+    datasets_by_level = current_app.dataset_registry.datasets_by_level(current_app.query_db)
+    pyblic_ds_ids = list(datasets_by_level["public"])
 
-    LOG.info(f"The following public dataset were found in database:{public_ds}")
+    LOG.info(f"The following public dataset were found in database:{pyblic_ds_ids}")
 
     registered_access_ds_ids = auth_levels[0]
     controlled_access_ds_ids = []
 
     if auth_levels[1] is True:  # user has access to controlled access datasets
-        controlled_access_ds = ds_collection.find({"authlevel": "controlled"})
-        controlled_access_ds_ids = [ds["_id"] for ds in controlled_access_ds]
+        controlled_access_ds_ids = list(datasets_by_level["controlled"])
 
-    dataset_filter = pyblic_ds_ids + registered_access_ds_ids + controlled_access_ds_ids
+    # remove duplicated IDs, keeping their order
+    return list(dict.fromkeys(pyblic_ds_ids + registered_access_ds_ids + controlled_access_ds_ids))
 
-    # Filter results
-    LOG.info(f"Filtering out results with datasets different from :{dataset_filter}")
-    filtered_variants = []
 
-    for variant in variants:
-        for key in variant.get("datasetIds", []):
-            if key in dataset_filter:
-                filtered_variants.append(variant)
+def auth_query(mongo_query, dataset_ids) -> dict:
+    """Restrict a variant query to the variants found in one or more datasets
+
+    Accepts:
+        mongo_query(dict): a variant query
+        dataset_ids(list): IDs of the datasets the user has access to
 
-    return filtered_variants
+    Returns:
+        auth_query(dict): the variant query, matching only variants found in the given datasets
+    """
+    dataset_query = [{".".join(["datasetIds", ds_id]): {"$exists": True}} for ds_id in dataset_ids]
+    if "$or" in mongo_query:
+        return {"$and": [mongo_query, {"$or": dataset_query}]}
+    auth_query = dict(mongo_query)
+    auth_query["$or"] = dataset_query
+    return auth_query
+
+
+def auth_projection(dataset_ids) -> dict:
+    """Create a projection returning only the sample and call counters of variants for the given datasets,
+    so that sample data and data from datasets the user has no access to are not returned by the database
+
+    Accepts:
+        dataset_ids(list): IDs of the datasets the user has access to
+
+    Returns:
+        projection(dict)
+    """
+    projection = {}
+    for ds_id in dataset_ids:
+        projection[".".join(["datasetIds", ds_id, "sample_count"])] = 1
+        projection[".".join(["datasetIds", ds_id, "call_count"])] = 1
+    projection["_id"] = 0
+    return projection
 
 
-def create_ds_allele_response(response_type, req_dsets, variants) -> tuple:
+def create_ds_allele_response(response_type, req_dsets, variants=None, ds_counts=None) -> tuple:
     """Create a Beacon Dataset Allele Response
 
     Accepts:
         response_type(str): ALL, HIT or MISS
         req_dsets(set): datasets requested, could be empty
         variants(list): a list of query results
+        ds_counts(dict): sample, call and variant counts by dataset, if already computed from query results
 
     Returns:
         ds_responses(list): list of cgbeacon2.model.DatasetAlleleResponse
@@ -527,8 +903,7 @@ def create_ds_allele_response(response_type, req_dsets, variants) -> tuple:
     ds_responses = []
     exists = False
 
-    all_dsets = current_app.db["dataset"].find()
-    all_dsets = {ds["_id"]: ds for ds in all_dsets}
+    all_dsets = current_app.dataset_registry.datasets(current_app.query_db)
 
     if len(req_dsets) == 0:  # if query didn't specify any dataset
         # Use all datasets present in this beacon
@@ -540,7 +915,10 @@ def create_ds_allele_response(response_type, req_dsets, variants) -> tuple:
             LOG.info(f"Provided dataset {ds} could not be found in database")
             continue
 
-        ds_response = DatasetAlleleResponse(all_dsets[ds], variants).__dict__
+        counts = None
+        if ds_counts is not None:
+            counts = ds_counts.get(ds, (0, 0, 0))
+        ds_response = DatasetAlleleResponse(all_dsets[ds], variants, counts).__dict__
 
         # collect responses according to the type of response requested
         if (
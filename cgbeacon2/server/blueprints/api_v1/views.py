@@ -4,10 +4,18 @@ import logging
 import os
 
 from cgbeacon2.__version__ import __version__
-from cgbeacon2.constants import CHROMOSOMES, INVALID_TOKEN_AUTH
+from cgbeacon2.constants import BATCH_TOO_LARGE, CHROMOSOMES, INVALID_BATCH, INVALID_TOKEN_AUTH
 from cgbeacon2.models import Beacon
 from cgbeacon2.utils.add import add_dataset as add_dataset_util
 from cgbeacon2.utils.auth import authlevel, validate_token
+from cgbeacon2.utils.jobs import JOB_STATUS_FIELDS, create_job
+from cgbeacon2.utils.metrics import (
+    QUERY_STAGE_SECONDS,
+    REGISTRY,
+    finish_request_metrics,
+    start_request_metrics,
+    timed,
+)
 from cgbeacon2.utils.parse import validate_add_params
 from cgbeacon2.utils.update import update_event
 from flask import (
@@ -20,14 +28,13 @@ from flask import (
     request,
     send_from_directory,
 )
-from flask_executor import Executor
 from flask_negotiate import consumes
 
 from .controllers import (
-    add_variants_task,
+    cached_dispatch_query,
+    create_allele_queries,
     create_allele_query,
-    delete_variants_task,
-    dispatch_query,
+    dispatch_batch_query,
     stats,
     validate_add_data,
     validate_delete_data,
@@ -44,6 +51,29 @@ api1_bp = Blueprint(
 )
 
 
+@api1_bp.before_request
+def before_request() -> None:
+    """Start collecting the metrics of a request"""
+    start_request_metrics()
+
+
+@api1_bp.after_request
+def after_request(response) -> Response:
+    """Save the metrics of a request"""
+    finish_request_metrics(request.endpoint, response.status_code)
+    return response
+
+
+@api1_bp.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    """Return the metrics of this server process in Prometheus text format
+
+    Example:
+        curl -X GET 'http://localhost:5000/metrics'
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 @api1_bp.route("/apiv1.0/img/<filename>")
 def send_img(filename) -> Response:
     """Serve images to be displayed in web pages"""
@@ -67,7 +97,7 @@ def info() -> Response:
         curl -X GET 'http://localhost:5000/'
     """
     beacon_config = current_app.config.get("BEACON_OBJ")
-    beacon = Beacon(beacon_config, current_app.db)
+    beacon = Beacon(beacon_config, current_app.query_db, current_app.dataset_registry)
 
     resp = jsonify(beacon.info())
     resp.status_code = 200
@@ -84,8 +114,7 @@ def query_form() -> str:
     http://127.0.0.1:5000/apiv1.0/query_form
     """
 
-    all_dsets = current_app.db["dataset"].find()
-    all_dsets = [ds for ds in all_dsets]
+    all_dsets = list(current_app.dataset_registry.datasets(current_app.query_db).values())
     resp_obj = {}
 
     if request.method == "POST":
@@ -99,7 +128,12 @@ def query_form() -> str:
             # query database (it should return a datasetAlleleResponses object)
             response_type = customer_query.get("includeDatasetResponses", "NONE")
             query_datasets = customer_query.get("datasetIds", [])
-            exists, ds_allele_responses = dispatch_query(mongo_query, response_type, query_datasets)
+            exists, ds_allele_responses = cached_dispatch_query(
+                mongo_query,
+                response_type,
+                query_datasets,
+                assembly=customer_query.get("assemblyId"),
+            )
             resp_obj["exists"] = exists
             resp_obj["error"] = {"errorCode": 200}
             resp_obj["datasetAlleleResponses"] = ds_allele_responses
@@ -202,8 +236,8 @@ def add_dataset() -> Response:
 def add() -> Response:
     """
     Endpoint used to load variants into the database.
-    It is accepting json data from POST requests. If request params are OK returns 200 (success).
-    Then start a Thread that will save variants to database.
+    It is accepting json data from POST requests. If request params are OK returns 202 (accepted)
+    and the id of a job that will save variants to database.
 
     Example:
     ########### POST request ###########
@@ -237,13 +271,12 @@ def add() -> Response:
         resp.status_code = 422
         return resp
 
-    # Start loading variants thread
-    executor = Executor()
-    executor.init_app(current_app)
-    executor.submit(add_variants_task, request)
+    # Queue a job that will load the variants
+    job_id = create_job(current_app.db, "add", request.json)
+    current_app.job_pool.wake_up()
 
     # Return success response
-    resp = jsonify({"message": "Saving variants to Beacon"})
+    resp = jsonify({"message": "Saving variants to Beacon", "job_id": job_id})
     resp.status_code = 202
     return resp
 
@@ -252,8 +285,8 @@ def add() -> Response:
 @api1_bp.route("/apiv1.0/delete", methods=["DELETE"])
 def delete() -> Response:
     """
-    Endpoint accepting json data from POST requests. If request params are OK returns 200 (success).
-    Then start a Thread that will delete variants from database.
+    Endpoint accepting json data from POST requests. If request params are OK returns 202 (accepted)
+    and the id of a job that will delete variants from database.
     ########### POST request ###########
     curl -X DELETE \
     -H 'Content-Type: application/json' \
@@ -276,17 +309,44 @@ def delete() -> Response:
         resp.status_code = 422
         return resp
 
-    # Start deleting variants thread
-    executor = Executor()
-    executor.init_app(current_app)
-    executor.submit(delete_variants_task, request)
+    # Queue a job that will delete the variants
+    job_id = create_job(current_app.db, "delete", request.json)
+    current_app.job_pool.wake_up()
 
     # Return success response
-    resp = jsonify({"message": "Deleting variants from Beacon"})
+    resp = jsonify({"message": "Deleting variants from Beacon", "job_id": job_id})
     resp.status_code = 202
     return resp
 
 
+@api1_bp.route("/apiv1.0/jobs/<job_id>", methods=["GET"])
+def job_status(job_id) -> Response:
+    """Return the status of a job created by an add or a delete request
+
+    Example:
+    curl -X GET -H 'X-Auth-Token: DEMO' http://localhost:5000/apiv1.0/jobs/<job_id>
+    """
+    resp = None
+    # Check request auth token
+    valid_token = validate_token(request, current_app.db)
+    if valid_token is False:
+        resp = jsonify({"message": INVALID_TOKEN_AUTH["errorMessage"]})
+        resp.status_code = INVALID_TOKEN_AUTH["errorCode"]
+        return resp
+
+    job = current_app.db["job"].find_one({"_id": job_id})
+    if job is None:
+        resp = jsonify({"message": f"Job {job_id} was not found"})
+        resp.status_code = 404
+        return resp
+
+    job_obj = {field: job.get(field) for field in JOB_STATUS_FIELDS}
+    job_obj["job_id"] = job_id
+    resp = jsonify(job_obj)
+    resp.status_code = 200
+    return resp
+
+
 @api1_bp.route("/apiv1.0/query", methods=["GET", "POST"])
 def query() -> Response:
     """Create a query from params provided in the request and return a response with eventual results, or errors
@@ -308,14 +368,16 @@ def query() -> Response:
     """
 
     beacon_config = current_app.config.get("BEACON_OBJ")
-    beacon_obj = Beacon(beacon_config, current_app.db)
+    with timed(QUERY_STAGE_SECONDS, "beacon"):
+        beacon_obj = Beacon(beacon_config, current_app.query_db, current_app.dataset_registry)
 
     resp_obj = {}
     resp_status = 200
 
     # Check request headers to define user access level
     # Public access only has auth_levels = ([], False)
-    auth_levels = authlevel(request, current_app.config.get("ELIXIR_OAUTH2"))
+    with timed(QUERY_STAGE_SECONDS, "auth"):
+        auth_levels = authlevel(request, current_app.config.get("ELIXIR_OAUTH2"))
 
     if isinstance(auth_levels, dict):  # an error must have occurred, otherwise it's a tuple
         resp = jsonify(auth_levels)
@@ -338,8 +400,12 @@ def query() -> Response:
     # query database (it should return a datasetAlleleResponses object)
     response_type = customer_query.get("includeDatasetResponses", "NONE")
     query_datasets = customer_query.get("datasetIds", [])
-    exists, ds_allele_responses = dispatch_query(
-        mongo_query, response_type, query_datasets, auth_levels
+    exists, ds_allele_responses = cached_dispatch_query(
+        mongo_query,
+        response_type,
+        query_datasets,
+        auth_levels,
+        assembly=customer_query.get("assemblyId"),
     )
 
     resp_obj["exists"] = exists
@@ -348,3 +414,69 @@ def query() -> Response:
     resp = jsonify(resp_obj)
     resp.status_code = resp_status
     return resp
+
+
+@consumes("application/json")
+@api1_bp.route("/apiv1.0/query/batch", methods=["POST"])
+def query_batch() -> Response:
+    """Query many alleles with one request and return a response for each of them, in the same order
+
+    Example:
+    curl -X POST \
+    -H 'Content-Type: application/json' \
+    -d '{"alleleRequests": [
+    {"referenceName": "1", "start": 156146085, "end": 156146086, "referenceBases": "C",
+    "alternateBases": "A", "assemblyId": "GRCh37"},
+    {"referenceName": "1", "start": 156146089, "end": 156146090, "referenceBases": "G",
+    "alternateBases": "T", "assemblyId": "GRCh37", "includeDatasetResponses": "HIT"}]}' \
+    http://localhost:5000/apiv1.0/query/batch
+    """
+    beacon_config = current_app.config.get("BEACON_OBJ")
+    with timed(QUERY_STAGE_SECONDS, "beacon"):
+        beacon_obj = Beacon(beacon_config, current_app.query_db, current_app.dataset_registry)
+
+    resp_obj = {"beaconId": beacon_obj.id, "apiVersion": beacon_obj.apiVersion}
+
+    # Auth levels are computed once for all the alleles in the batch
+    with timed(QUERY_STAGE_SECONDS, "auth"):
+        auth_levels = authlevel(request, current_app.config.get("ELIXIR_OAUTH2"))
+
+    if isinstance(auth_levels, dict):  # an error must have occurred, otherwise it's a tuple
+        resp = jsonify(auth_levels)
+        resp.status_code = auth_levels.get("errorCode", 403)
+        return resp
+
+    data = request.get_json(silent=True)
+    allele_requests = data.get("alleleRequests") if isinstance(data, dict) else data
+    error = None
+    if not isinstance(allele_requests, list) or len(allele_requests) == 0:
+        error = INVALID_BATCH
+    else:
+        max_size = current_app.config.get("QUERY_BATCH_MAX_SIZE", 1000)
+        if len(allele_requests) > max_size:
+            error = dict(BATCH_TOO_LARGE)
+            error["errorMessage"] = f"{BATCH_TOO_LARGE['errorMessage']} (maximum {max_size})"
+
+    if error:
+        resp_obj["error"] = error
+        resp = jsonify(resp_obj)
+        resp.status_code = error["errorCode"]
+        return resp
+
+    queries = create_allele_queries(allele_requests)
+    results = dispatch_batch_query(queries, auth_levels)
+
+    allele_responses = []
+    for (customer_query, _, error), result in zip(queries, results):
+        allele_resp = {"alleleRequest": customer_query, "error": error}
+        if result is None:
+            allele_resp["exists"] = None
+            allele_resp["datasetAlleleResponses"] = []
+        else:
+            allele_resp["exists"], allele_resp["datasetAlleleResponses"] = result
+        allele_responses.append(allele_resp)
+
+    resp_obj["alleleResponses"] = allele_responses
+    resp = jsonify(resp_obj)
+    resp.status_code = 200
+    return resp
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+
+from cgbeacon2.server.blueprints.api_v1.controllers import add_variants_task, delete_variants_task
+from cgbeacon2.utils.jobs import (
+    JobHeartbeat,
+    claim_job,
+    finish_job,
+    requeue_stale_jobs,
+    update_job_progress,
+)
+
+LOG = logging.getLogger(__name__)
+
+
+def run_job(database, job, heartbeat_interval=30) -> None:
+    """Run an add or delete variants job and save its outcome to the job collection
+
+    Accepts:
+        database(pymongo.database.Database)
+        job(dict): a job object
+        heartbeat_interval(int): seconds between updates of the running job
+    """
+    try:
+        with JobHeartbeat(database, job, heartbeat_interval):
+            if job["type"] == "add":
+                added = add_variants_task(
+                    job["params"],
+                    progress_callback=lambda n: update_job_progress(database, job["_id"], n),
+                )
+                result = {"added": added}
+            else:
+                updated, removed = delete_variants_task(job["params"])
+                result = {"updated": updated, "removed": removed}
+    except Exception as ex:
+        LOG.exception(f"Job {job['_id']} failed")
+        finish_job(database, job, error=str(ex))
+        return
+    finish_job(database, job, result=result)
+
+
+class JobWorkerPool:
+    """A bounded pool of threads running the add and delete variants jobs saved in the job collection"""
+
+    def __init__(
+        self, app, n_workers=1, poll_interval=5, job_timeout=300, heartbeat_interval=30
+    ) -> None:
+        self.app = app
+        self.n_workers = n_workers
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._wake_up = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the worker threads, if not already running"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.n_workers):
+                worker_id = f"{os.uname().nodename}-{os.getpid()}-{i}"
+                thread = threading.Thread(target=self._work, args=(worker_id,), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake_up(self) -> None:
+        """Start the pool if needed and notify workers that a new job was queued"""
+        self.start()
+        self._wake_up.set()
+
+    def join(self) -> None:
+        """Wait for the worker threads to terminate"""
+        for thread in self._threads:
+            while thread.is_alive():
+                # a timeout keeps the main thread responsive to KeyboardInterrupt
+                thread.join(timeout=1)
+
+    def stop(self) -> None:
+        """Stop the worker threads once they have finished their current job"""
+        self._stop.set()
+        self._wake_up.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self, worker_id) -> None:
+        """Claim and run queued jobs until the pool is stopped"""
+        with self.app.app_context():
+            while self._stop.is_set() is False:
+                database = self.app.db
+                job = claim_job(database, worker_id)
+                if job is not None:
+                    run_job(database, job, self.heartbeat_interval)
+                    continue
+
+                requeue_stale_jobs(database, self.job_timeout)
+                self._wake_up.wait(self.poll_interval)
+                self._wake_up.clear()
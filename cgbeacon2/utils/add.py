@@ -1,12 +1,27 @@
 # -*- coding: utf-8 -*-
 import datetime
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
 from typing import Tuple, Union
 
-from cgbeacon2.constants import CHROMOSOMES
+import numpy
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE, CHROMOSOMES
 from cgbeacon2.models.variant import Variant
-from cgbeacon2.utils.parse import bnd_mate_name, sv_end, variant_called
+from cgbeacon2.utils.bloom import open_bloom_filter
+from cgbeacon2.utils.metrics import LOAD_STAGE_SECONDS, timed
+from cgbeacon2.utils.parse import bnd_mate_name, filter_variants, sv_end, variant_carriers
+from cgbeacon2.utils.sample_index import (
+    ALLELE_COUNTS,
+    carriers_allele_count,
+    dataset_sample_indices,
+)
+from cgbeacon2.utils.variant_key import MD5_KEY
+from cyvcf2 import VCF
 from progress.bar import Bar
+from progress.spinner import Spinner
+from pymongo import MongoClient, UpdateOne
 from pymongo.results import InsertOneResult
 
 LOG = logging.getLogger(__name__)
@@ -127,8 +142,22 @@ def add_dataset(database, dataset_dict, update=False) -> Union[None, InsertOneRe
     return ds_collection.insert_one(dataset_dict)
 
 
-def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants) -> int:
-    """Build variant objects from a cyvcf2 VCF iterator
+def add_variants(
+    database,
+    vcf_obj,
+    samples,
+    assembly,
+    dataset_id,
+    nr_variants=None,
+    batch_size=BULK_WRITE_BATCH_SIZE,
+    progress_callback=None,
+    region=None,
+    show_progress=True,
+    intervals=None,
+    bloom_filter_dir=None,
+    key_format=MD5_KEY,
+) -> int:
+    """Build variant objects from a cyvcf2 VCF iterator and save them to database in batches
 
     Accepts:
         database(pymongo.database.Database)
@@ -136,24 +165,57 @@ def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants)
         samples(set): set of samples to add variants for
         assembly(str): chromosome build
         dataset_id(str): dataset id
-        nr_variant(int): number of variants contained in VCF file
+        nr_variants(int): number of variants contained in VCF file, if known from the VCF index
+        batch_size(int): number of variants sent to the database with each bulk write
+        progress_callback(function): called with the number of variants saved after each bulk write
+        region(str): parse only variants in this region (i.e. a chromosome). Requires an indexed VCF
+        show_progress(bool): if False, don't print loading progress
+        intervals(IntervalIndex): parse only variants overlapping these genomic intervals
+        bloom_filter_dir(str): directory of the variant Bloom filters, updated before saving variants
+        key_format(str): format of the _id of variants, "md5" or "compact"
     Returns:
-        inserted_vars, samples(tuple): (int,list)
+        inserted_vars(int): number of variants inserted or updated
 
     """
     LOG.info("Parsing variants..\n")
 
     # Collect position to check genotypes for (only samples provided by user)
-    gt_positions = []
-    for i, sample in enumerate(vcf_obj.samples):
-        if sample in samples:
-            gt_positions.append(i)
+    gt_positions = numpy.array(
+        [i for i, sample in enumerate(vcf_obj.samples) if sample in samples], dtype=numpy.intp
+    )
 
     vcf_samples = vcf_obj.samples
+    # Samples are saved in variants using their index in the sample dictionary of the dataset
+    sample_indices = dataset_sample_indices(
+        database, dataset_id, [vcf_samples[position] for position in gt_positions]
+    )
+    gt_indices = numpy.array(
+        [sample_indices[vcf_samples[position]] for position in gt_positions], dtype=numpy.int64
+    )
+    bloom_filter = open_bloom_filter(bloom_filter_dir, assembly, writable=True)
 
     inserted_vars = 0
-    with Bar("Processing", max=nr_variants) as bar:
-        for vcf_variant in vcf_obj:
+    variants_batch = []
+    # Show a progress bar when the number of variants is known, otherwise a spinner
+    progress_kwargs = {} if show_progress else {"file": None}
+    if nr_variants:
+        progress = Bar("Processing", max=nr_variants, **progress_kwargs)
+    else:
+        progress = Spinner("Processing ", **progress_kwargs)
+
+    # Time spent checking sample genotypes and saving variants, used to compute parsing time
+    carriers_seconds = 0
+    write_seconds = 0
+    load_start = time.perf_counter()
+
+    vcf_variants = vcf_obj
+    if region:
+        vcf_variants = vcf_obj(region)
+    elif intervals is not None:
+        vcf_variants = filter_variants(vcf_obj, intervals)
+    with progress as bar:
+        for vcf_variant in vcf_variants:
+            bar.next()  # progress counts all VCF records, including skipped ones
             chrom = vcf_variant.CHROM.replace("chr", "")
             if chrom not in CHROMOSOMES:
                 LOG.warning(
@@ -162,9 +224,11 @@ def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants)
                 continue
 
             # Check if variant was called in provided samples
-            sample_calls = variant_called(vcf_samples, gt_positions, vcf_variant.gt_types)
+            carriers_start = time.perf_counter()
+            carriers = variant_carriers(gt_indices, gt_positions, vcf_variant.gt_types)
+            carriers_seconds += time.perf_counter() - carriers_start
 
-            if sample_calls == {}:
+            if not carriers:
                 continue  # variant was not called in samples of interest
 
             parsed_variant = dict(
@@ -181,20 +245,154 @@ def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants)
             else:
                 parsed_variant["variant_type"] = vcf_variant.var_type.upper()
 
-            dataset_dict = {dataset_id: {"samples": sample_calls}}
+            dataset_dict = {dataset_id: carriers}
             # Create standard variant object with specific _id
-            variant = Variant(parsed_variant, dataset_dict, assembly)
+            variant = Variant(parsed_variant, dataset_dict, assembly, key_format)
+            variants_batch.append(variant)
+
+            # Load buffered variants into database or update existing ones with new samples and dataset
+            if len(variants_batch) >= batch_size:
+                write_start = time.perf_counter()
+                inserted_vars += _save_batch(
+                    database, variants_batch, dataset_id, progress_callback, bloom_filter
+                )
+                write_seconds += time.perf_counter() - write_start
+                variants_batch = []
 
-            # Load variant into database or update an existing one with new samples and dataset
-            result = add_variant(database=database, variant=variant, dataset_id=dataset_id)
-            if result is not None:
-                inserted_vars += 1
+    if variants_batch:
+        write_start = time.perf_counter()
+        inserted_vars += _save_batch(
+            database, variants_batch, dataset_id, progress_callback, bloom_filter
+        )
+        write_seconds += time.perf_counter() - write_start
+    if bloom_filter is not None:
+        bloom_filter.close()
 
-            bar.next()
+    LOAD_STAGE_SECONDS.observe(
+        time.perf_counter() - load_start - carriers_seconds - write_seconds, stage="parse"
+    )
+    LOAD_STAGE_SECONDS.observe(carriers_seconds, stage="variant_carriers")
+    LOAD_STAGE_SECONDS.observe(write_seconds, stage="db_write")
 
     return inserted_vars
 
 
+def add_variants_parallel(
+    database_uri,
+    database_name,
+    vcf_file,
+    contigs,
+    samples,
+    assembly,
+    dataset_id,
+    processes,
+    batch_size=BULK_WRITE_BATCH_SIZE,
+    progress_callback=None,
+    client_settings=None,
+    bloom_filter_dir=None,
+    key_format=MD5_KEY,
+) -> int:
+    """Save the variants of an indexed VCF file using a pool of processes, each one loading a chromosome
+
+    Accepts:
+        database_uri(str): MongoDB connection string
+        database_name(str): name of the database
+        vcf_file(str): path to an indexed VCF file
+        contigs(list): chromosomes to load variants from
+        samples(set): set of samples to add variants for
+        assembly(str): chromosome build
+        dataset_id(str): dataset id
+        processes(int): maximum number of processes used to load variants
+        batch_size(int): number of variants sent to the database with each bulk write
+        progress_callback(function): called with the number of variants saved for each chromosome
+        client_settings(dict): keyword arguments of the MongoDB client of each process
+        bloom_filter_dir(str): directory of the variant Bloom filters, updated before saving variants
+        key_format(str): format of the _id of variants, "md5" or "compact"
+    Returns:
+        inserted_vars(int): number of variants inserted or updated
+    """
+    inserted_vars = 0
+    # A pymongo client is not fork-safe, so each process is spawned and connects to the database
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn")) as executor:
+        futures = {
+            executor.submit(
+                add_contig_variants,
+                database_uri,
+                database_name,
+                vcf_file,
+                contig,
+                samples,
+                assembly,
+                dataset_id,
+                batch_size,
+                client_settings,
+                bloom_filter_dir,
+                key_format,
+            ): contig
+            for contig in contigs
+        }
+        for future in as_completed(futures):
+            contig_vars = future.result()
+            LOG.info(f"Chromosome {futures[future]}: {contig_vars} variants inserted or updated")
+            if progress_callback:
+                progress_callback(contig_vars)
+            inserted_vars += contig_vars
+
+    return inserted_vars
+
+
+def add_contig_variants(
+    database_uri,
+    database_name,
+    vcf_file,
+    contig,
+    samples,
+    assembly,
+    dataset_id,
+    batch_size,
+    client_settings=None,
+    bloom_filter_dir=None,
+    key_format=MD5_KEY,
+) -> int:
+    """Save the variants of one chromosome of an indexed VCF file. Run in a separate process by add_variants_parallel
+
+    Returns:
+        inserted_vars(int): number of variants inserted or updated
+    """
+    client = MongoClient(database_uri, **(client_settings or {}))
+    try:
+        return add_variants(
+            database=client[database_name],
+            vcf_obj=VCF(vcf_file, samples=list(samples)),
+            samples=samples,
+            assembly=assembly,
+            dataset_id=dataset_id,
+            batch_size=batch_size,
+            region=contig,
+            show_progress=False,
+            bloom_filter_dir=bloom_filter_dir,
+            key_format=key_format,
+        )
+    finally:
+        client.close()
+
+
+def _save_batch(database, variants, dataset_id, progress_callback=None, bloom_filter=None) -> int:
+    """Save a batch of variants and report the number of processed variants to an optional callback.
+    Variant keys are added to the Bloom filter first, so that queries never miss a saved variant,
+    and the filter can't be rebuilt until the variants are saved
+    """
+    if bloom_filter is None:
+        saved = add_variants_batch(database, variants, dataset_id)
+    else:
+        with bloom_filter.updating():
+            bloom_filter.add(variant._id for variant in variants)
+            saved = add_variants_batch(database, variants, dataset_id)
+    if progress_callback:
+        progress_callback(len(variants))
+    return saved
+
+
 def _set_parsed_sv(chrom, vcf_variant, parsed_variant) -> None:
     """Set parsed_variant key/values when vcf variant is a structural variant
 
@@ -221,54 +419,100 @@ def _set_parsed_sv(chrom, vcf_variant, parsed_variant) -> None:
         parsed_variant["mate_name"] = bnd_mate_name(alt, chrom)
 
 
-def add_variant(database, variant, dataset_id) -> Union[int, InsertOneResult]:
-    """Check if a variant is already in database and update it, otherwise add a new one
+def add_variants_batch(database, variants, dataset_id) -> int:
+    """Save a batch of variants with one unordered bulk write.
+    New variants are inserted, while pre-existing variants are updated with the samples of
+    the dataset which are not already saved for them. Sample and call counters of the dataset
+    saved in the variants, and variant and allele counts of the dataset, are increased accordingly.
 
     Accepts:
         database(pymongo.database.Database)
-        variant(cgbeacon2.models.Variant)
+        variants(list): list of cgbeacon2.models.Variant objects
         dataset_id(str): current dataset in use
 
     Returns:
-        result.inserted_id or updated variant allele_count
-
+        n_saved(int): number of variants inserted or updated
     """
-    # check if variant already exists
-    old_variant = database["variant"].find_one({"_id": variant._id})
-    current_samples = variant.datasetIds[dataset_id][
-        "samples"
-    ]  # {sample1: allele_count, sample2:allele_count}
-    if old_variant is None:  # if it doesn't exist
-        # insert variant into database
-        variant.call_count = cumulative_allele_count(current_samples)
-        result = database["variant"].insert_one(variant.__dict__)
-        return result.inserted_id
-
-    # update pre-existing variant
-    updated_datasets = old_variant.get("datasetIds", {})  # dictionary where dataset ids are keys
-    allele_count = 0
-    if dataset_id in updated_datasets:  # variant was already found in this dataset
-        updated_samples = updated_datasets[dataset_id].get("samples", {})
-        for sample, value in current_samples.items():
-            if sample not in updated_samples:
-                updated_samples[sample] = value
-                allele_count += value["allele_count"]
-        updated_datasets[dataset_id] = updated_samples
-    else:
-        updated_datasets[dataset_id] = {"samples": current_samples}
-        allele_count = cumulative_allele_count(current_samples)
-
-    if allele_count > 0:  # changes in sample, allele count dictionary must be saved
-        database["variant"].find_one_and_update(
-            {"_id": old_variant["_id"]},
-            {
-                "$set": {
-                    "datasetIds": updated_datasets,  # this is actually updated now
-                    "call_count": old_variant["call_count"] + allele_count,
-                }
-            },
+    ds_key = ".".join(["datasetIds", dataset_id])
+
+    # Merge samples of variants with the same _id (i.e. same variant repeated in VCF file)
+    batch_variants = {}
+    batch_carriers = {}
+    for variant in variants:
+        # {"het": [0, 4], "hom_alt": [2]}
+        current_carriers = variant.datasetIds[dataset_id]
+        if variant._id not in batch_variants:
+            batch_variants[variant._id] = variant
+            batch_carriers[variant._id] = {}  # sample index -> genotype
+        for genotype in ALLELE_COUNTS:
+            for sample_index in current_carriers.get(genotype, []):
+                batch_carriers[variant._id].setdefault(sample_index, genotype)
+
+    # Collect with one query the samples already saved for the variants of this batch
+    saved_carriers = {}
+    saved_variants = database["variant"].find(
+        {"_id": {"$in": list(batch_variants)}},
+        {".".join([ds_key, genotype]): 1 for genotype in ALLELE_COUNTS},
+    )
+    for saved_variant in saved_variants:
+        saved_ds = saved_variant.get("datasetIds", {}).get(dataset_id, {})
+        saved_carriers[saved_variant["_id"]] = {
+            sample_index
+            for genotype in ALLELE_COUNTS
+            for sample_index in saved_ds.get(genotype, [])
+        }
+
+    requests = []
+    n_dataset_variants = 0  # variants with no previous calls for this dataset
+    n_dataset_alleles = 0
+    for variant_id, variant in batch_variants.items():
+        new_carriers = {genotype: [] for genotype in ALLELE_COUNTS}
+        for sample_index, genotype in batch_carriers[variant_id].items():
+            if sample_index not in saved_carriers.get(variant_id, set()):
+                new_carriers[genotype].append(sample_index)
+        n_samples = sum(len(indices) for indices in new_carriers.values())
+        allele_count = carriers_allele_count(new_carriers)
+        if variant_id in saved_carriers and n_samples == 0:
+            continue  # variant is already saved for these samples
+
+        if not saved_carriers.get(variant_id):
+            n_dataset_variants += 1
+        n_dataset_alleles += allele_count
+
+        variant_fields = {
+            key: value
+            for key, value in variant.__dict__.items()
+            if key not in ["_id", "datasetIds", "call_count"]
+        }
+        requests.append(
+            UpdateOne(
+                {"_id": variant_id},
+                {
+                    "$setOnInsert": variant_fields,
+                    "$addToSet": {
+                        ".".join([ds_key, genotype]): {"$each": indices}
+                        for genotype, indices in new_carriers.items()
+                        if indices
+                    },
+                    "$inc": {
+                        "call_count": allele_count,
+                        ".".join([ds_key, "sample_count"]): n_samples,
+                        ".".join([ds_key, "call_count"]): allele_count,
+                    },
+                },
+                upsert=True,
+            )
         )
-        return allele_count
+
+    if not requests:
+        return 0
+
+    result = database["variant"].bulk_write(requests, ordered=False)
+    database["dataset"].update_one(
+        {"_id": dataset_id},
+        {"$inc": {"variant_count": n_dataset_variants, "allele_count": n_dataset_alleles}},
+    )
+    return result.upserted_count + result.modified_count
 
 
 def cumulative_allele_count(samples_obj) -> int:
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import hashlib
 import logging
+import re
+import threading
+import time
 from typing import Union
 
 import jwt  # https://github.com/jpadilla/pyjwt
@@ -25,6 +30,27 @@ from cgbeacon2.constants import (
 
 LOG = logging.getLogger(__name__)
 GA4GH_SCOPES = ["openid", "ga4gh_passport_v1"]
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+# Seconds a JWK set is cached when the JWK server response has no Cache-Control max-age
+JWKS_DEFAULT_TTL = 300
+# Seconds the auth level computed from the passports of a token is cached
+PASSPORTS_DEFAULT_TTL = 60
+# Seconds the passports collected by prefetch_auth_data are kept, waiting to be used by authlevel
+USERINFO_TTL = 10
+
+JWKS_CACHE = {}  # {jwk server url: (expiry time, JWK set)}
+PASSPORTS_CACHE = {}  # {token sha256 digest: (expiry time, auth level)}
+USERINFO_CACHE = {}  # {token sha256 digest: (expiry time, passports)}
+CACHE_LOCK = threading.Lock()
+
+
+def clear_auth_caches() -> None:
+    """Remove all cached JWK sets, passports and passport-based auth levels"""
+    with CACHE_LOCK:
+        JWKS_CACHE.clear()
+        PASSPORTS_CACHE.clear()
+        USERINFO_CACHE.clear()
 
 
 def validate_token(request, database) -> bool:
@@ -85,7 +111,7 @@ def authlevel(request, oauth2_settings) -> Union[tuple, dict]:
     if token == "":
         return MISSING_TOKEN
 
-    public_key = elixir_key(oauth2_settings["server"])
+    public_key = elixir_key(oauth2_settings["server"], token_kid(token))
     if public_key == MISSING_PUBLIC_KEY:
         return MISSING_PUBLIC_KEY
 
@@ -99,6 +125,12 @@ def authlevel(request, oauth2_settings) -> Union[tuple, dict]:
         LOG.info("Auth Token validated.")
         LOG.info(f'Identified as {decoded_token["sub"]} user by {decoded_token["iss"]}.')
 
+        # Return the auth level computed for the same token by a recent request, if available
+        token_digest = _token_digest(token)
+        cached_auth_level = _cache_get(PASSPORTS_CACHE, token_digest)
+        if cached_auth_level is not None:
+            return cached_auth_level
+
         # retrieve Elixir AAI passports associated to the user described by the auth token
         all_passports = ga4gh_passports(decoded_token, token, oauth2_settings)
 
@@ -114,6 +146,11 @@ def authlevel(request, oauth2_settings) -> Union[tuple, dict]:
         if auth_level == PASSPORTS_ERROR:
             return PASSPORTS_ERROR
 
+        # Cache auth level until token expires, or at most for the configured time
+        ttl = oauth2_settings.get("passports_ttl", PASSPORTS_DEFAULT_TTL)
+        expiry = min(time.time() + ttl, decoded_token["exp"])
+        _cache_set(PASSPORTS_CACHE, token_digest, auth_level, expiry)
+
     except MissingClaimError:
         return MISSING_TOKEN_CLAIMS
     except InvalidClaimError:
@@ -128,21 +165,179 @@ def authlevel(request, oauth2_settings) -> Union[tuple, dict]:
     return auth_level
 
 
-def elixir_key(server) -> Union[dict, list]:
-    """Retrieves Elixir AAI public key from Elixir JWK server
+def elixir_key(server, kid=None) -> Union[dict, list]:
+    """Retrieves Elixir AAI public key from Elixir JWK server.
+    JWK sets are cached according to the Cache-Control header of the server response,
+    and collected again whenever the requested key ID is not present in the cached set (key rotation).
 
     Accepts:
         server(str). HTTP address to an Elixir server providing public key
+        kid(str): ID of the key used to sign the token
 
     Returns:
         key(json) json content of the server response or Error
     """
+    jwks = _cache_get(JWKS_CACHE, server)
+    if jwks is not None and _jwks_has_kid(jwks, kid):
+        return jwks
+
     try:
         r = requests.get(server)
-        return r.json()
-
+        jwks = r.json()
     except Exception:
         return MISSING_PUBLIC_KEY
+    if r.ok is False or _jwks_keys(jwks) is None:  # Do not cache error responses
+        return MISSING_PUBLIC_KEY
+
+    expiry = time.time() + jwks_max_age(r.headers.get("Cache-Control"))
+    _cache_set(JWKS_CACHE, server, jwks, expiry)
+    return jwks
+
+
+async def prefetch_auth_data(authorization, oauth2_settings, http_client) -> None:
+    """Collect with an async HTTP client the JWK sets and GA4GH passports needed to compute the
+    auth level of a token, so that authlevel can then compute it from cached data without
+    blocking on HTTP requests. Errors are ignored here and reported later by authlevel.
+
+    Accepts:
+        authorization(str): Authorization header of the request
+        oauth2_settings(dict) Elixir AAI Oauth2 settings (server, issuers, userinfo)
+        http_client(httpx.AsyncClient)
+    """
+    try:
+        scheme, token = authorization.split(" ")
+    except (AttributeError, ValueError):
+        return
+    if scheme != "Bearer" or token == "":
+        return
+
+    await _prefetch_elixir_key(http_client, oauth2_settings["server"], token_kid(token))
+
+    token_digest = _token_digest(token)
+    if _cache_get(PASSPORTS_CACHE, token_digest) is not None:
+        return
+    try:
+        token_scopes = jwt.decode(token, options={"verify_signature": False})["scope"].split(" ")
+    except Exception:
+        return
+    if not all(scope in token_scopes for scope in GA4GH_SCOPES):
+        return
+
+    try:
+        resp = await http_client.get(
+            oauth2_settings.get("userinfo"), headers={"Authorization": f"Bearer {token}"}
+        )
+        passports = resp.json().get("ga4gh_passport_v1")
+    except Exception:
+        return
+    if passports is None:
+        return
+    _cache_set(USERINFO_CACHE, token_digest, passports, time.time() + USERINFO_TTL)
+
+    # Collect the keys used to sign passports concurrently
+    passport_keys = set()
+    for passport in passports:
+        try:
+            header = jwt.get_unverified_header(passport)
+        except Exception:
+            continue
+        passport_keys.add((header.get("jku"), header.get("kid")))
+    await asyncio.gather(
+        *[_prefetch_elixir_key(http_client, jku, kid) for jku, kid in passport_keys]
+    )
+
+
+async def _prefetch_elixir_key(http_client, server, kid) -> None:
+    """Save to cache the JWK set of a server, if it's not cached already or it doesn't contain the key ID"""
+    jwks = _cache_get(JWKS_CACHE, server)
+    if jwks is not None and _jwks_has_kid(jwks, kid):
+        return
+    try:
+        r = await http_client.get(server)
+        jwks = r.json()
+    except Exception:
+        return
+    if r.is_success is False or _jwks_keys(jwks) is None:
+        return
+    expiry = time.time() + jwks_max_age(r.headers.get("Cache-Control"))
+    _cache_set(JWKS_CACHE, server, jwks, expiry)
+
+
+def jwks_max_age(cache_control) -> int:
+    """Return the number of seconds a JWK set can be cached according to a Cache-Control header
+
+    Accepts:
+        cache_control(str): value of the Cache-Control header, i.e. "public, max-age=3600"
+
+    Returns:
+        max_age(int)
+    """
+    if cache_control is None:
+        return JWKS_DEFAULT_TTL
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = MAX_AGE_PATTERN.search(cache_control)
+    if match:
+        return int(match.group(1))
+    return JWKS_DEFAULT_TTL
+
+
+def token_kid(token) -> Union[None, str]:
+    """Return the ID of the key used to sign a JWT, as specified in the token header
+
+    Accepts:
+        token(str)
+
+    Returns:
+        kid(str) or None
+    """
+    try:
+        return jwt.get_unverified_header(token).get("kid")
+    except Exception:
+        return None
+
+
+def _token_digest(token) -> str:
+    """Return the sha256 digest of a token, used as cache key"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _jwks_keys(jwks) -> Union[None, list]:
+    """Return the keys of a JWK set, or None if the JWK set doesn't contain any key"""
+    if not isinstance(jwks, dict) or not isinstance(jwks.get("keys"), list) or not jwks["keys"]:
+        return None
+    return jwks["keys"]
+
+
+def _jwks_has_kid(jwks, kid) -> bool:
+    """Check if a JWK set contains a key with a given key ID, or any key if key ID is None"""
+    keys = _jwks_keys(jwks)
+    if keys is None:
+        return False
+    if kid is None:
+        return True
+    return any(isinstance(key, dict) and key.get("kid") == kid for key in keys)
+
+
+def _cache_get(cache, key):
+    """Return a cached value if present and not expired, otherwise None"""
+    with CACHE_LOCK:
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        expiry, value = cached
+        if expiry <= time.time():
+            cache.pop(key)
+            return None
+        return value
+
+
+def _cache_set(cache, key, value, expiry) -> None:
+    """Save a value to cache, if not already expired"""
+    if expiry <= time.time():
+        return
+    with CACHE_LOCK:
+        cache[key] = (expiry, value)
 
 
 def claims(oauth2_settings) -> dict:
@@ -280,7 +475,7 @@ def validate_passport(passport) -> Union[None, dict]:
     claims_options = {"aud": {"essential": False}}
     try:
         # obtain public key for this passport
-        public_key = elixir_key(header.get("jku"))
+        public_key = elixir_key(header.get("jku"), header.get("kid"))
         # Try decoding the token using the public key
         decoded_passport = jjwt.decode(token, public_key, claims_options=claims_options)
         # And validating the signature
@@ -355,6 +550,11 @@ def ga4gh_userdata(token, elixir_oidc) -> Union[list, dict]:
         passport_info(list)
 
     """
+    # Passports might have been collected already by prefetch_auth_data
+    passport_info = _cache_get(USERINFO_CACHE, _token_digest(token))
+    if passport_info is not None:
+        return passport_info
+
     LOG.info("Sending a request to Elixir AAI to get userinfo associated to token")
     headers = {"Authorization": f"Bearer {token}"}
     passport_info = None
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Union
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b"CGBLOOM1"
+# magic, number of bits, number of hash functions, capacity, keys added, keys removed from database
+HEADER = struct.Struct("<8sQIQQQ")
+HEADER_SIZE = 64  # bits are saved after a fixed-size header
+COUNT_OFFSET = 28  # offset of the "keys added" and "keys removed" fields of the header
+UINT64_MASK = (1 << 64) - 1
+
+
+def bloom_filter_path(directory, assembly) -> str:
+    """Return the path of the file containing the filter of the variants of a genome assembly"""
+    return os.path.join(directory, f"variants_{assembly}.bloom")
+
+
+def _lock_path(path) -> str:
+    """Return the path of the lock file held while a filter is rebuilt, or while keys are added to it"""
+    return f"{path}.lock"
+
+
+def _hash_pair(key) -> tuple:
+    """Return two 64-bit hashes of a variant key, combined to compute the bits of the key"""
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    digest = hashlib.blake2b(bytes(key), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+def filter_size(capacity, error_rate) -> tuple:
+    """Return number of bits and hash functions of a filter with the given capacity and false positive rate
+
+    Accepts:
+        capacity(int): expected number of keys
+        error_rate(float): false positive rate when the filter contains `capacity` keys
+
+    Returns:
+        n_bits, n_hashes(tuple)
+    """
+    capacity = max(capacity, 1)
+    n_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    n_bits += -n_bits % 8
+    n_hashes = max(1, round(n_bits / capacity * math.log(2)))
+    return n_bits, n_hashes
+
+
+class BloomFilter:
+    """A Bloom filter of variant _id keys saved in a memory-mapped file.
+
+    The filter answers "definitely absent" for keys which were never added, and "maybe present"
+    otherwise. The file is shared by all processes opening it: updates are serialized with a
+    file lock and become immediately visible to readers. Keys can't be removed from a Bloom filter,
+    so variants removed from the database remain false positives until the filter is rebuilt.
+    """
+
+    def __init__(self, path, writable=False) -> None:
+        self.path = path
+        self.writable = writable
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self) -> None:
+        self._file = open(self.path, "r+b" if self.writable else "rb")
+        self._mmap = mmap.mmap(
+            self._file.fileno(),
+            0,
+            access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ,
+        )
+        magic, self.n_bits, self.n_hashes, self.capacity, _, _ = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a variant Bloom filter file")
+        self.inode = os.fstat(self._file.fileno()).st_ino
+
+    @contextmanager
+    def updating(self):
+        """Hold a shared lock on the filter while keys are added and the corresponding variants are saved.
+        Filters are rebuilt holding an exclusive lock, so that a rebuild can't miss variants whose keys
+        were added to the filter it replaces. A filter replaced by a rebuild is reopened first.
+        """
+        with open(_lock_path(self.path), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH)
+            try:
+                if os.stat(self.path).st_ino != self.inode:
+                    LOG.info(f"Reopening rebuilt variant Bloom filter {self.path}")
+                    self.close()
+                    self._open()
+                yield self
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @property
+    def count(self) -> int:
+        """Number of keys added to the filter"""
+        return HEADER.unpack_from(self._mmap)[4]
+
+    @property
+    def removed(self) -> int:
+        """Number of keys removed from the database after being added to the filter"""
+        return HEADER.unpack_from(self._mmap)[5]
+
+    def _positions(self, key) -> list:
+        h1, h2 = _hash_pair(key)
+        return [((h1 + i * h2) & UINT64_MASK) % self.n_bits for i in range(self.n_hashes)]
+
+    def __contains__(self, key) -> bool:
+        bits = self._mmap
+        for position in self._positions(key):
+            if not bits[HEADER_SIZE + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, keys) -> None:
+        """Add variant keys to the filter
+
+        Accepts:
+            keys(iterable): variant _id values
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        hashes = numpy.array([_hash_pair(key) for key in keys], dtype=numpy.uint64)
+        rounds = numpy.arange(self.n_hashes, dtype=numpy.uint64)
+        # (h1 + i * h2) mod n_bits, with 64-bit wrap-around as in _positions
+        with numpy.errstate(over="ignore"):
+            positions = (hashes[:, :1] + rounds * hashes[:, 1:]).ravel()
+        positions = (positions % numpy.uint64(self.n_bits)).astype(numpy.int64)
+
+        bits = numpy.frombuffer(self._mmap, dtype=numpy.uint8, offset=HEADER_SIZE)
+        with self._lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                numpy.bitwise_or.at(
+                    bits, positions >> 3, (1 << (positions & 7)).astype(numpy.uint8)
+                )
+                self._increase_counts(added=len(keys))
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        if self.count > self.capacity:
+            LOG.warning(
+                f"Bloom filter {self.path} contains more keys than its capacity ({self.capacity}). Rebuild it with 'beacon index bloom'"
+            )
+
+    def mark_removed(self, n_removed) -> None:
+        """Register that keys were removed from the database, to report when a rebuild is useful"""
+        with self._lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._increase_counts(removed=n_removed)
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _increase_counts(self, added=0, removed=0) -> None:
+        count, n_removed = struct.unpack_from("<QQ", self._mmap, COUNT_OFFSET)
+        struct.pack_into("<QQ", self._mmap, COUNT_OFFSET, count + added, n_removed + removed)
+        self._mmap.flush()
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+
+def create_bloom_filter(path, keys, capacity, error_rate=0.001, batch_size=100000) -> int:
+    """Create a Bloom filter file containing the provided keys.
+    The filter is written to a temporary file which then replaces any pre-existing file, so that
+    processes using the old filter reopen the new one. Keys are read and the file is replaced
+    holding an exclusive lock, which makes variant loaders wait (see BloomFilter.updating).
+
+    Accepts:
+        path(str): path of the filter file
+        keys(iterable): variant _id values
+        capacity(int): expected number of keys, including keys added later on
+        error_rate(float): false positive rate when the filter contains `capacity` keys
+        batch_size(int): number of keys added at the time
+
+    Returns:
+        n_keys(int): number of keys added to the filter
+    """
+    n_bits, n_hashes = filter_size(capacity, error_rate)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(_lock_path(path), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            with open(tmp_path, "wb") as bloom_file:
+                bloom_file.write(HEADER.pack(MAGIC, n_bits, n_hashes, capacity, 0, 0))
+                bloom_file.truncate(HEADER_SIZE + n_bits // 8)
+
+            bloom_filter = BloomFilter(tmp_path, writable=True)
+            try:
+                batch = []
+                for key in keys:
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        bloom_filter.add(batch)
+                        batch = []
+                bloom_filter.add(batch)
+                n_keys = bloom_filter.count
+            finally:
+                bloom_filter.close()
+
+            os.replace(tmp_path, path)
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    return n_keys
+
+
+def open_bloom_filter(directory, assembly, writable=False) -> Union[None, BloomFilter]:
+    """Open the filter of the variants of a genome assembly, if filters are enabled and the file exists
+
+    Accepts:
+        directory(str): directory containing filter files, BLOOM_FILTER_DIR config parameter
+        assembly(str): GRCh37 or GRCh38
+        writable(bool): if True, keys can be added to the filter
+
+    Returns:
+        bloom_filter(BloomFilter) or None
+    """
+    if not directory:
+        return None
+    path = bloom_filter_path(directory, assembly)
+    if not os.path.isfile(path):
+        return None
+    return BloomFilter(path, writable=writable)
+
+
+class BloomFilterRegistry:
+    """Read-only Bloom filters of the variants of each genome assembly, shared by the query handlers of a process.
+
+    At most once every `ttl` seconds the registry checks whether a filter file was created or
+    replaced (i.e. rebuilt with 'beacon index bloom') and reopens it.
+    """
+
+    def __init__(self, directory, ttl=10) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._filters = {}  # assembly -> (BloomFilter or None, time of last check)
+
+    def might_contain(self, assembly, key) -> bool:
+        """Return False if the variant key is definitely not saved in database, otherwise True
+
+        Accepts:
+            assembly(str): GRCh37 or GRCh38
+            key(str): variant _id
+        """
+        bloom_filter = self._filter(assembly)
+        if bloom_filter is None:
+            return True
+        return key in bloom_filter
+
+    def _filter(self, assembly) -> Union[None, BloomFilter]:
+        now = time.monotonic()
+        bloom_filter, checked = self._filters.get(assembly, (None, None))
+        if checked is not None and now - checked < self.ttl:
+            return bloom_filter
+
+        with self._lock:
+            path = bloom_filter_path(self.directory, assembly)
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                inode = None
+            if bloom_filter is not None and bloom_filter.inode != inode:
+                bloom_filter = None  # replaced file, closed when no longer in use by other threads
+            if bloom_filter is None and inode is not None:
+                LOG.info(f"Opening variant Bloom filter {path}")
+                bloom_filter = BloomFilter(path)
+            self._filters[assembly] = (bloom_filter, now)
+        return bloom_filter
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+import pymongo
+
+LOG = logging.getLogger(__name__)
+
+AUTH_LEVELS = ["public", "registered", "controlled"]
+
+
+class DatasetRegistry:
+    """In-process cache of the datasets of a beacon database.
+
+    Datasets are read from the database on first access. After that, at most once every `ttl`
+    seconds the registry checks the latest document of the event collection (written by
+    utils.update.update_event whenever datasets or variants are changed) and reloads the
+    datasets only if a new event was registered in the meantime.
+    """
+
+    def __init__(self, ttl=10) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._database = None
+        self._checked = None  # time of the last check against the event collection
+        self._last_event_id = None
+        self._datasets = {}
+        self._datasets_by_level = {level: {} for level in AUTH_LEVELS}
+        self._first_event_date = None
+        self._last_event_date = None
+
+    def invalidate(self) -> None:
+        """Force reloading datasets on next access"""
+        with self._lock:
+            self._database = None
+
+    def datasets(self, database) -> dict:
+        """Return all datasets in database
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            datasets(dict): dataset ids as keys and dataset objects as values
+        """
+        self._refresh(database)
+        return self._datasets
+
+    def datasets_by_level(self, database) -> dict:
+        """Return all datasets in database, by access level
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            datasets_by_level(dict): the keys are "public", "registered", "controlled"
+        """
+        self._refresh(database)
+        return self._datasets_by_level
+
+    def event_dates(self, database) -> tuple:
+        """Return the creation date of the first and of the last event saved in database
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            first_event_date, last_event_date(tuple): datetime.datetime objects or None
+        """
+        self._refresh(database)
+        return self._first_event_date, self._last_event_date
+
+    def last_event_id(self, database):
+        """Return the id of the last event saved in database, which changes whenever datasets or variants are modified
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            last_event_id(bson.ObjectId or None)
+        """
+        self._refresh(database)
+        return self._last_event_id
+
+    def _latest_event(self, database, ordering=pymongo.DESCENDING) -> dict:
+        """Return the first or the last event saved in database, None if there are no events"""
+        for event in database["event"].find().sort([("created", ordering)]).limit(1):
+            return event
+
+    def _refresh(self, database) -> None:
+        """Reload datasets from database if the cached ones are outdated"""
+        if database is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if database is self._database and now - self._checked < self.ttl:
+                return
+
+            last_event = self._latest_event(database) or {}
+            if database is self._database and last_event.get("_id") == self._last_event_id:
+                self._checked = now
+                return
+
+            LOG.info("Loading datasets from database")
+            self._datasets = {ds["_id"]: ds for ds in database["dataset"].find()}
+            self._datasets_by_level = {level: {} for level in AUTH_LEVELS}
+            for ds_id, ds in self._datasets.items():
+                self._datasets_by_level[ds["authlevel"]][ds_id] = ds
+
+            first_event = self._latest_event(database, pymongo.ASCENDING) or {}
+            self._first_event_date = first_event.get("created")
+            self._last_event_date = last_event.get("created")
+            self._last_event_id = last_event.get("_id")
+            self._database = database
+            self._checked = now
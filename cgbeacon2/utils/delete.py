@@ -2,6 +2,10 @@
 import logging
 from typing import Union
 
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE
+from cgbeacon2.utils.bloom import open_bloom_filter
+from cgbeacon2.utils.sample_index import ALLELE_COUNTS, saved_sample_indices
+
 LOG = logging.getLogger(__name__)
 
 
@@ -44,79 +48,154 @@ def delete_dataset(database, id) -> Union[int, None]:
     return result.deleted_count
 
 
-def delete_variants(database, ds_id, samples) -> tuple:
-    """Delete variants for one or more samples
+def delete_variants(database, ds_id, samples, bloom_filter_dir=None) -> tuple:
+    """Delete variants for one or more samples.
+    Sample calls are removed from all variants with one pipeline update, which recomputes the
+    dataset counters from the remaining calls. Then variants with no remaining samples in the
+    dataset are removed from the dataset (and from the database, if they are not found in any other dataset).
 
     Accepts:
         database(pymongo.database.Database)
         ds_id(str): dataset id
         samples(tuple): name of samples in this dataset
+        bloom_filter_dir(str): directory of the variant Bloom filters, which count removed variants
 
     Returns:
         n_updated, n_removed(tuple): number of variants updated/removed from database
     """
-    n_updated = 0
-    n_removed = 0
-    query = {"$or": []}
-
-    sample_list = list(samples)
-    for sample in sample_list:
-        nested_doc_id = ".".join(["datasetIds", ds_id, "samples", sample])
-        query["$or"].append({nested_doc_id: {"$exists": True}})
-
-    results = database["variant"].find(query)
-    for res in results:
-        updated, removed = delete_variant(database, ds_id, res, sample_list)
-        if updated is True:
-            n_updated += 1
-        if removed is True:
-            n_removed += 1
-
-    return n_updated, n_removed
-
-
-def delete_variant(database, dataset_id, variant, samples) -> tuple:
-    """Delete one variant from database or just update the samples having it
-
-    Accepts:
-        database(pymongo.database.Database)
-        dataset_id(str): dataset id
-        variant(dict): one variant
-        samples(list) : list of samples to remove this variant for
-
-    Returns:
-        (updated, removed)(tuple of bool): if variant was updated or removed
-
-    """
-    updated = False
-    removed = False
-
-    # {sample1:{allele_count:2}, sample2:{allele_count:1}, ..}
-    dataset_samples = variant["datasetIds"][dataset_id].get("samples", {})
-
-    remove_allele_count = 0
-    for sample in samples:  # loop over the samples to remove
-        if sample in dataset_samples:
-            remove_allele_count += dataset_samples[sample]["allele_count"]
-            dataset_samples.pop(sample)
-
-    # If there are still samples in database with this variant
-    # Keep variant and update the list of samples
-    if dataset_samples != {}:
-        results = database["variant"].find_one_and_update(
-            {"_id": variant["_id"]},
+    variant_collection = database["variant"]
+    ds_key = ".".join(["datasetIds", ds_id])
+    # Samples are saved in variants using their index in the sample dictionary of the dataset
+    sample_indices = saved_sample_indices(database, ds_id, samples)
+    if not sample_indices:
+        return 0, 0
+
+    query = {
+        "$or": [
+            {".".join([ds_key, genotype]): {"$in": sample_indices}} for genotype in ALLELE_COUNTS
+        ]
+    }
+    calls = {genotype: _sample_calls(ds_key, genotype) for genotype in ALLELE_COUNTS}
+    # Set difference between the saved calls and the removed samples, keeping the order of the calls.
+    # Written with $filter since mongomock, used in tests, doesn't implement $setDifference
+    kept_calls = {
+        genotype: {
+            "$filter": {
+                "input": genotype_calls,
+                "as": "sample",
+                "cond": {"$eq": [{"$in": ["$$sample", sample_indices]}, False]},
+            }
+        }
+        for genotype, genotype_calls in calls.items()
+    }
+    removed_alleles = {
+        "$add": [
+            {
+                "$multiply": [
+                    allele_count,
+                    {
+                        "$subtract": [
+                            {"$size": calls[genotype]},
+                            {"$size": kept_calls[genotype]},
+                        ]
+                    },
+                ]
+            }
+            for genotype, allele_count in ALLELE_COUNTS.items()
+        ]
+    }
+
+    stats = list(
+        variant_collection.aggregate(
+            [
+                {"$match": query},
+                {
+                    "$group": {
+                        "_id": None,
+                        "n_variants": {"$sum": 1},
+                        "n_removed_alleles": {"$sum": removed_alleles},
+                    }
+                },
+            ]
+        )
+    )
+    if not stats:
+        return 0, 0
+    n_variants = stats[0]["n_variants"]
+    n_removed_alleles = stats[0]["n_removed_alleles"]
+
+    # Remove sample calls and decrease the call count of the variants, then recompute the dataset counters
+    ds_call_count = {
+        "$add": [
+            {"$multiply": [allele_count, {"$size": calls[genotype]}]}
+            for genotype, allele_count in ALLELE_COUNTS.items()
+        ]
+    }
+    variant_collection.update_many(
+        query,
+        [
+            {
+                "$set": {
+                    "call_count": {"$subtract": ["$call_count", removed_alleles]},
+                    **{  # genotypes without calls are not added to the variant
+                        ".".join([ds_key, genotype]): {
+                            "$cond": [
+                                {"$isArray": "$" + ".".join([ds_key, genotype])},
+                                kept_calls[genotype],
+                                "$$REMOVE",
+                            ]
+                        }
+                        for genotype in ALLELE_COUNTS
+                    },
+                }
+            },
             {
                 "$set": {
-                    ".".join(["datasetIds", dataset_id, "samples"]): dataset_samples,
-                    "call_count": variant["call_count"] - remove_allele_count,
+                    ".".join([ds_key, "sample_count"]): {
+                        "$add": [{"$size": calls[genotype]} for genotype in ALLELE_COUNTS]
+                    },
+                    ".".join([ds_key, "call_count"]): ds_call_count,
                 }
             },
+        ],
+    )
+
+    # Remove the dataset from variants with no remaining samples (query served by the datasetIds index)
+    removed_ids = [
+        variant["_id"]
+        for variant in variant_collection.find(
+            {".".join([ds_key, "sample_count"]): {"$lte": 0}}, {"_id": 1}
+        )
+    ]
+    n_removed = 0
+    n_deleted = 0
+    for start in range(0, len(removed_ids), BULK_WRITE_BATCH_SIZE):
+        batch_ids = removed_ids[start : start + BULK_WRITE_BATCH_SIZE]
+        n_removed += variant_collection.update_many(
+            {"_id": {"$in": batch_ids}}, {"$unset": {ds_key: ""}}
+        ).modified_count
+        # And delete those which are not found in any other dataset
+        n_deleted += variant_collection.delete_many(
+            {"_id": {"$in": batch_ids}, "datasetIds": {}}
+        ).deleted_count
+    if n_deleted:
+        # Keys can't be removed from a Bloom filter, only counted to report when a rebuild is useful
+        dataset = database["dataset"].find_one({"_id": ds_id}, {"assembly_id": 1}) or {}
+        bloom_filter = open_bloom_filter(
+            bloom_filter_dir, dataset.get("assembly_id"), writable=True
         )
-        if results is not None:
-            updated = True
-    else:  # No samples in database with this variant, remove it
-        results = database["variant"].find_one_and_delete({"_id": variant["_id"]})
-        if results is not None:
-            removed = True
-
-    return updated, removed
+        if bloom_filter is not None:
+            bloom_filter.mark_removed(n_deleted)
+            bloom_filter.close()
+
+    # Decrease variant and allele counts of the dataset
+    database["dataset"].update_one(
+        {"_id": ds_id},
+        {"$inc": {"variant_count": -n_removed, "allele_count": -n_removed_alleles}},
+    )
+    return n_variants - n_removed, n_removed
+
+
+def _sample_calls(ds_key, genotype) -> dict:
+    """Return the expression of the list of samples of a dataset with a genotype, empty if the variant has no such calls"""
+    return {"$ifNull": ["$" + ".".join([ds_key, genotype]), []]}
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from cgbeacon2.constants import INDEXES
+from pymongo.errors import OperationFailure
+
+LOG = logging.getLogger(__name__)
+
+
+def create_indexes(database, rebuild=False) -> list:
+    """Create the indexes used by the beacon queries on the database collections
+
+    Accepts:
+        database(pymongo.database.Database)
+        rebuild(bool): if True, drop and re-create pre-existing indexes
+
+    Returns:
+        created(list): names of the indexes created
+    """
+    created = []
+    for collection, indexes in INDEXES.items():
+        if rebuild:
+            LOG.info(f"Dropping indexes of collection '{collection}'")
+            database[collection].drop_indexes()
+        LOG.info(f"Creating indexes for collection '{collection}'")
+        created += database[collection].create_indexes(indexes)
+
+    return created
+
+
+def missing_indexes(database) -> dict:
+    """Return the indexes that are expected but not present in the database
+
+    Accepts:
+        database(pymongo.database.Database)
+
+    Returns:
+        missing(dict): collection names as keys and lists of missing index names as values
+    """
+    missing = {}
+    for collection, indexes in INDEXES.items():
+        existing = database[collection].index_information()
+        collection_missing = [
+            index.document["name"] for index in indexes if index.document["name"] not in existing
+        ]
+        if collection_missing:
+            missing[collection] = collection_missing
+
+    return missing
+
+
+def unused_indexes(database) -> dict:
+    """Return the indexes that were never used by a query since the database server was started
+
+    Accepts:
+        database(pymongo.database.Database)
+
+    Returns:
+        unused(dict): collection names as keys and lists of unused index names as values
+    """
+    unused = {}
+    for collection in INDEXES:
+        try:
+            stats = database[collection].aggregate([{"$indexStats": {}}])
+            collection_unused = [
+                stat["name"]
+                for stat in stats
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0
+            ]
+        except (OperationFailure, NotImplementedError) as err:
+            LOG.warning(f"Could not collect index stats for collection '{collection}':{err}")
+            continue
+        if collection_unused:
+            unused[collection] = collection_unused
+
+    return unused
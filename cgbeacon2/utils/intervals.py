@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+
+def _chrom_name(chrom) -> str:
+    """Return a chromosome name without the 'chr' prefix"""
+    chrom = str(chrom)
+    return chrom[3:] if chrom.lower().startswith("chr") else chrom
+
+
+class IntervalIndex:
+    """In-memory index of merged genomic intervals, used to filter VCF variants by gene panels.
+
+    Intervals use BED coordinates (0-based start, end excluded). Overlapping and book-ended
+    intervals are merged, like `bedtools merge` does.
+    """
+
+    def __init__(self, intervals=()) -> None:
+        by_chrom = {}
+        for chrom, start, end in intervals:
+            by_chrom.setdefault(_chrom_name(chrom), []).append((int(start), int(end)))
+
+        self._starts = {}
+        self._ends = {}
+        for chrom, chrom_intervals in by_chrom.items():
+            merged = []
+            for start, end in sorted(chrom_intervals):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            coords = numpy.array(merged, dtype=numpy.int64)
+            self._starts[chrom] = coords[:, 0]
+            self._ends[chrom] = coords[:, 1]
+
+    @classmethod
+    def from_bed_files(cls, bed_files):
+        """Create an interval index from the first 3 columns of one or more BED files
+
+        Accepts:
+            bed_files(list): paths to BED files
+
+        Returns:
+            interval_index(IntervalIndex)
+        """
+
+        def bed_intervals():
+            for bed_file in bed_files:
+                with open(bed_file, "r") as bed_lines:
+                    for line in bed_lines:
+                        if line.startswith(("#", "track", "browser")) or not line.strip():
+                            continue
+                        yield line.split("\t")[:3]
+
+        return cls(bed_intervals())
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts in self._starts.values())
+
+    def __iter__(self):
+        """Yield merged intervals as (chrom, start, end) tuples"""
+        for chrom, starts in self._starts.items():
+            for start, end in zip(starts.tolist(), self._ends[chrom].tolist()):
+                yield chrom, start, end
+
+    def overlaps(self, chrom, start, end) -> bool:
+        """Check if a genomic feature overlaps with any interval of the index
+
+        Accepts:
+            chrom(str): chromosome name, with or without 'chr' prefix
+            start(int): 0-based start coordinate
+            end(int): end coordinate (excluded)
+
+        Returns:
+            bool: True if the feature overlaps an interval
+        """
+        starts = self._starts.get(_chrom_name(chrom))
+        if starts is None:
+            return False
+        # last interval starting before the end of the feature
+        position = numpy.searchsorted(starts, max(end, start + 1), side="left") - 1
+        return bool(position >= 0 and self._ends[_chrom_name(chrom)][position] > start)
+
+    def regions(self, contigs=None) -> list:
+        """Return the intervals as regions for tabix queries (1-based, end included)
+
+        Accepts:
+            contigs(list): names of the chromosomes in the VCF file. Intervals are returned using
+                the same naming, and only for these chromosomes
+
+        Returns:
+            regions(list): strings formatted as 'chrom:start-end'
+        """
+        contig_names = {_chrom_name(contig): contig for contig in contigs or []}
+        regions = []
+        for chrom, start, end in self:
+            if contigs is not None and chrom not in contig_names:
+                continue
+            regions.append(f"{contig_names.get(chrom, chrom)}:{start + 1}-{end}")
+        return regions
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import threading
+from typing import Union
+from uuid import uuid4
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+LOG = logging.getLogger(__name__)
+
+# Fields of a job document returned by the job status endpoint
+JOB_STATUS_FIELDS = [
+    "type",
+    "dataset_id",
+    "status",
+    "progress",
+    "result",
+    "error",
+    "created",
+    "started",
+    "finished",
+]
+
+
+def create_job(database, job_type, params) -> str:
+    """Save a new job to the job collection, waiting to be run by a worker
+
+    Accepts:
+        database(pymongo.database.Database)
+        job_type(str): "add" or "delete"
+        params(dict): data of the add or delete request
+
+    Returns:
+        job_id(str)
+    """
+    now = datetime.datetime.now()
+    job_obj = dict(
+        _id=str(uuid4()),
+        type=job_type,
+        dataset_id=params.get("dataset_id"),
+        params=params,
+        status="queued",
+        progress={"variants": 0},
+        created=now,
+        updated=now,
+    )
+    return database["job"].insert_one(job_obj).inserted_id
+
+
+def claim_job(database, worker_id) -> Union[None, dict]:
+    """Assign to a worker the oldest queued job for a dataset which is not locked by another job.
+    Jobs for the same dataset are run one at the time, using a lock document saved in the job_lock collection.
+
+    Accepts:
+        database(pymongo.database.Database)
+        worker_id(str)
+
+    Returns:
+        job(dict): the claimed job, or None if there are no jobs to run
+    """
+    locked_datasets = database["job_lock"].distinct("_id")
+    queued_jobs = (
+        database["job"]
+        .find({"status": "queued", "dataset_id": {"$nin": locked_datasets}})
+        .sort([("created", ASCENDING)])
+    )
+    for job in queued_jobs:
+        try:
+            database["job_lock"].insert_one({"_id": job["dataset_id"], "job_id": job["_id"]})
+        except DuplicateKeyError:  # another worker locked the dataset in the meantime
+            continue
+
+        now = datetime.datetime.now()
+        claimed = database["job"].find_one_and_update(
+            {"_id": job["_id"], "status": "queued"},
+            {"$set": {"status": "running", "worker": worker_id, "started": now, "updated": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if claimed is None:  # job was claimed by another worker
+            database["job_lock"].delete_one({"_id": job["dataset_id"], "job_id": job["_id"]})
+            continue
+
+        LOG.info(f"Worker {worker_id} is running job {job['_id']}")
+        return claimed
+
+
+def update_job_progress(database, job_id, n_variants) -> None:
+    """Increase the number of variants processed by a running job
+
+    Accepts:
+        database(pymongo.database.Database)
+        job_id(str)
+        n_variants(int): number of variants processed since last update
+    """
+    database["job"].update_one(
+        {"_id": job_id},
+        {
+            "$inc": {"progress.variants": n_variants},
+            "$set": {"updated": datetime.datetime.now()},
+        },
+    )
+
+
+def finish_job(database, job, result=None, error=None) -> bool:
+    """Save the outcome of a job and release the lock on its dataset, if the job is still owned by
+    the worker that claimed it (i.e. it wasn't queued again and claimed by another worker)
+
+    Accepts:
+        database(pymongo.database.Database)
+        job(dict): a job object
+        result(dict): job results, i.e. number of added variants
+        error(str): error message if job has failed
+
+    Returns:
+        bool: True if the outcome was saved
+    """
+    now = datetime.datetime.now()
+    updated = database["job"].update_one(
+        {"_id": job["_id"], "status": "running", "worker": job.get("worker")},
+        {
+            "$set": {
+                "status": "failed" if error else "completed",
+                "result": result,
+                "error": error,
+                "finished": now,
+                "updated": now,
+            }
+        },
+    )
+    if updated.matched_count == 0:
+        LOG.warning(f"Job {job['_id']} is no longer owned by worker {job.get('worker')}")
+        return False
+    database["job_lock"].delete_one({"_id": job["dataset_id"], "job_id": job["_id"]})
+    return True
+
+
+class JobHeartbeat:
+    """Context manager updating a running job from a background thread at regular intervals,
+    so that jobs are not considered stale while their worker is alive, whatever their progress updates
+    """
+
+    def __init__(self, database, job, interval=30) -> None:
+        self.database = database
+        self.job = job
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self) -> None:
+        while self._stop.wait(self.interval) is False:
+            updated = self.database["job"].update_one(
+                {"_id": self.job["_id"], "status": "running", "worker": self.job.get("worker")},
+                {"$set": {"updated": datetime.datetime.now()}},
+            )
+            if updated.matched_count == 0:
+                LOG.warning(f"Job {self.job['_id']} is no longer owned by this worker")
+                return
+
+
+def requeue_stale_jobs(database, timeout) -> int:
+    """Queue again running jobs whose heartbeat stopped for a given time (i.e. their worker was terminated)
+
+    Accepts:
+        database(pymongo.database.Database)
+        timeout(int): seconds since the last update of a running job. Must be longer than the heartbeat interval
+
+    Returns:
+        n_requeued(int): number of jobs queued again
+    """
+    limit = datetime.datetime.now() - datetime.timedelta(seconds=timeout)
+    stale_query = {"status": "running", "updated": {"$lt": limit}}
+    n_requeued = 0
+    for job in database["job"].find(stale_query):
+        LOG.warning(f"Job {job['_id']} was not updated since {job['updated']}, queuing it again")
+        result = database["job"].update_one(
+            {"_id": job["_id"], "status": "running"},
+            {
+                "$set": {"status": "queued", "updated": datetime.datetime.now()},
+                "$unset": {"worker": ""},
+            },
+        )
+        database["job_lock"].delete_one({"_id": job["dataset_id"], "job_id": job["_id"]})
+        n_requeued += result.modified_count
+
+    return n_requeued
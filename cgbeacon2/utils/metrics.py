@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the buckets of duration histograms
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# Upper bounds of the buckets of the histogram counting database commands sent for each request
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(labels) -> str:
+    """Format a list of (name, value) tuples as Prometheus labels"""
+    if not labels:
+        return ""
+    formatted = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        formatted.append(f'{name}="{value}"')
+    return "{" + ",".join(formatted) + "}"
+
+
+class Counter:
+    """A metric whose value can only increase, i.e. the number of database commands"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels) -> None:
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, **labels) -> float:
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> list:
+        """Return the samples of the metric as (name, labels, value) tuples"""
+        with self._lock:
+            return [
+                (self.name, list(zip(self.labelnames, label_values)), value)
+                for label_values, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    """A metric counting observations (i.e. durations) in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value, **labels) -> None:
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            values = self._values.setdefault(label_values, [[0] * len(self.buckets), 0, 0])
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    values[0][i] += 1
+            values[1] += value
+            values[2] += 1
+
+    def count(self, **labels) -> int:
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        return self._values.get(label_values, [None, 0, 0])[2]
+
+    def samples(self) -> list:
+        """Return the samples of the metric as (name, labels, value) tuples"""
+        samples = []
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, label_values))
+                for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                    samples.append(
+                        (f"{self.name}_bucket", labels + [("le", upper_bound)], bucket_count)
+                    )
+                samples.append((f"{self.name}_bucket", labels + [("le", "+Inf")], count))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Collection of the metrics of a server process, rendered using the Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return all metrics formatted as Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "beacon_request_duration_seconds",
+    "Time spent handling requests",
+    ["endpoint", "status"],
+)
+REQUEST_MONGO_ROUND_TRIPS = REGISTRY.histogram(
+    "beacon_request_mongo_round_trips",
+    "Number of database commands sent while handling a request",
+    ["endpoint"],
+    buckets=ROUND_TRIP_BUCKETS,
+)
+MONGO_COMMANDS = REGISTRY.counter(
+    "beacon_mongo_commands_total",
+    "Number of database commands sent",
+    ["command"],
+)
+QUERY_STAGE_SECONDS = REGISTRY.histogram(
+    "beacon_query_stage_duration_seconds",
+    "Time spent in the stages of allele queries",
+    ["stage"],
+)
+QUERY_CACHE_LOOKUPS = REGISTRY.counter(
+    "beacon_query_cache_lookups_total",
+    "Number of lookups in the query cache",
+    ["result"],
+)
+BLOOM_FILTER_LOOKUPS = REGISTRY.counter(
+    "beacon_bloom_filter_lookups_total",
+    "Number of exact variant queries checked against the variant Bloom filter",
+    ["result"],
+)
+LOAD_STAGE_SECONDS = REGISTRY.histogram(
+    "beacon_load_stage_duration_seconds",
+    "Time spent in the stages of loading variants from a VCF file",
+    ["stage"],
+)
+
+
+@contextmanager
+def timed(histogram, stage):
+    """Observe the time spent in a block of code into a histogram with a 'stage' label
+
+    Accepts:
+        histogram(Histogram)
+        stage(str): name of the timed stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, stage=stage)
+
+
+# Start time and number of database commands of the request handled by the current thread or asyncio task
+_request_state = ContextVar("request_metrics", default=None)
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Count the commands sent to the database, in total and for the request being handled"""
+
+    def started(self, event) -> None:
+        MONGO_COMMANDS.inc(command=event.command_name)
+        request_state = _request_state.get()
+        if request_state is not None:
+            request_state["round_trips"] += 1
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+
+def start_request_metrics() -> None:
+    """Start timing a request and counting its database commands"""
+    _request_state.set({"start": time.perf_counter(), "round_trips": 0})
+
+
+def finish_request_metrics(endpoint, status) -> None:
+    """Save the duration and the number of database commands of a request
+
+    Accepts:
+        endpoint(str): Flask endpoint name, i.e. "api_v1.query"
+        status(int): response status code
+    """
+    request_state = _request_state.get()
+    if request_state is None:
+        return
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - request_state["start"], endpoint=endpoint, status=status
+    )
+    REQUEST_MONGO_ROUND_TRIPS.observe(request_state["round_trips"], endpoint=endpoint)
+    _request_state.set(None)
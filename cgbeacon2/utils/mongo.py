@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from cgbeacon2.utils.metrics import MongoCommandCounter
+from pymongo import MongoClient
+
+LOG = logging.getLogger(__name__)
+
+QUERY_CLIENT = "query"  # client used to answer beacon queries
+LOADING_CLIENT = "loading"  # client used to save and remove data (CLI, add and delete jobs)
+
+
+def client_settings(config, profile) -> dict:
+    """Return the settings of a MongoDB client profile, combining the MONGO_CLIENT config parameter
+    with the parameter specific for the profile (MONGO_QUERY_CLIENT or MONGO_LOADING_CLIENT)
+
+    Accepts:
+        config(dict): app config
+        profile(str): QUERY_CLIENT or LOADING_CLIENT
+
+    Returns:
+        settings(dict): keyword arguments of pymongo.MongoClient, i.e. {"maxPoolSize": 100}
+    """
+    settings = dict(config.get("MONGO_CLIENT") or {})
+    settings.update(config.get(f"MONGO_{profile.upper()}_CLIENT") or {})
+    return settings
+
+
+def create_client(db_uri, settings=None) -> MongoClient:
+    """Create a MongoDB client whose commands are counted by the /metrics endpoint
+
+    Accepts:
+        db_uri(str): MongoDB connection string
+        settings(dict): keyword arguments of pymongo.MongoClient
+
+    Returns:
+        client(pymongo.MongoClient)
+    """
+    return MongoClient(db_uri, event_listeners=[MongoCommandCounter()], **(settings or {}))
@@ -1,16 +1,17 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
-import os
 import re
-from tempfile import NamedTemporaryFile
 from typing import Union
 
+import numpy
+from cgbeacon2.constants import CHROMOSOMES
 from cgbeacon2.resources import variants_add_schema_path
+from cgbeacon2.utils.intervals import IntervalIndex
+from cgbeacon2.utils.sample_index import HET, HOM_ALT
 from cyvcf2 import VCF
 from flask import current_app
 from jsonschema import ValidationError, validate
-from pybedtools.bedtool import BedTool
 
 BND_ALT_PATTERN = re.compile(r".*[\],\[](.*?):(.*?)[\],\[]")
 CHR_PATTERN = re.compile(r"(chr)?(.*)", re.IGNORECASE)
@@ -108,15 +109,14 @@ def sv_end(pos, alt, svend=None, svlen=None) -> int:
     return end - 1  # coordinate should be zero-based
 
 
-def compute_filter_intervals(req_data) -> Union[None, BedTool]:
+def compute_filter_intervals(req_data) -> Union[None, IntervalIndex]:
     """Compute filter intervals from a list of genes
 
     Accepts:
         req_data(dict): a dictionary with add request data
-        db()
 
     Returns:
-        filter_intervals(list) a lits of genomic intervals to filter VCF with
+        filter_intervals(IntervalIndex): genomic intervals to filter VCF with
     """
     db = current_app.db
     hgnc_ids = None
@@ -126,14 +126,14 @@ def compute_filter_intervals(req_data) -> Union[None, BedTool]:
         hgnc_ids = req_data["genes"]["ids"]
     else:
         ensembl_ids = req_data["genes"]["ids"]
-    filter_intervals = genes_to_bedtool(db["gene"], hgnc_ids, ensembl_ids, assembly)
+    filter_intervals = genes_to_intervals(db["gene"], hgnc_ids, ensembl_ids, assembly)
     return filter_intervals
 
 
-def genes_to_bedtool(
+def genes_to_intervals(
     gene_collection, hgnc_ids=None, ensembl_ids=None, build="GRCh37"
-) -> Union[None, BedTool]:
-    """Create a Bedtool object with gene coordinates from a list of genes contained in the database
+) -> Union[None, IntervalIndex]:
+    """Create an interval index with gene coordinates from a list of genes contained in the database
 
     Accepts:
         hgnc_ids(list): a list of hgnc genes ids
@@ -142,7 +142,7 @@ def genes_to_bedtool(
         build(str): genome build, GRCh37 or GRCh38
 
     Returns:
-        bt(pybedtools.bedtool.BedTool): a BedTool object containing gene intervals
+        intervals(IntervalIndex): an interval index containing gene intervals
     """
     if not (hgnc_ids or ensembl_ids):
         return None  # No gene was specified to filter VCF file with
@@ -153,133 +153,140 @@ def genes_to_bedtool(
     elif ensembl_ids:  # either HGNC or ENSEMBL IDs, not both in the query dictionary
         query["ensembl_id"] = {"$in": ensembl_ids}
     # Query database for genes coordinates
-    results = gene_collection.find(query)
-    # Create a string containing gene intervals to initialize a Bedtool object with
-    bedtool_string = ""
-    for gene in results:
-        bedtool_string += (
-            "\t".join([gene["chromosome"], str(gene["start"]), str(gene["end"])]) + "\n"
-        )
-    if bedtool_string == "":
+    results = gene_collection.find(query, {"_id": 0, "chromosome": 1, "start": 1, "end": 1})
+    intervals = IntervalIndex((gene["chromosome"], gene["start"], gene["end"]) for gene in results)
+    if len(intervals) == 0:
         return None
-    bt = BedTool(bedtool_string, from_string=True)
-    return bt
+    return intervals
 
 
-def extract_variants(vcf_file, samples=None, filter=None) -> Union[None, VCF]:
+def extract_variants(vcf_file, samples=None) -> Union[None, VCF]:
     """Parse a VCF file and return its variants as cyvcf2.VCF objects
 
     Accepts:
         vcf_file(str): path to VCF file
         samples(set): samples to extract variants for
-        filter(BcfTool object)
     """
     vcf_obj = None
     try:
-        if filter is not None:
-            # filter VCF using one or more panels
-            intersections = _compute_intersections(vcf_file, filter)
-            temp_intersections_file = NamedTemporaryFile("w+t", dir=os.getcwd())
-            intersections.saveas(temp_intersections_file.name)
-
-            vcf_obj = VCF(temp_intersections_file.name, samples=list(samples))
-
-            # remove temporary file:
-            temp_intersections_file.close()
-        else:
-            vcf_obj = VCF(vcf_file, samples=list(samples))
-
+        vcf_obj = VCF(vcf_file, samples=list(samples))
     except Exception as err:
         LOG.error(f"Error while creating VCF iterator from variant file:{err}")
 
     return vcf_obj
 
 
-def _compute_intersections(vcf_file, filter) -> BedTool:
-    """Create a temporary file with the gene panel intervals
+def filter_variants(vcf_obj, intervals):
+    """Yield the variants of a VCF file overlapping the given genomic intervals.
+    Indexed VCF files are queried by region, otherwise variants are filtered while reading the file.
 
     Accepts:
-        vcf_file(str): path to the VCF file
-        filter(BcfTool object)
+        vcf_obj(cyvcf2.VCF): a VCF object
+        intervals(IntervalIndex): genomic intervals to filter VCF with
 
-    Returns:
-        intersections(BedTool)
+    Yields:
+        vcf_variant(cyvcf2.Variant)
     """
+    LOG.info(f"Extracting variants from {len(intervals)} genomic intervals")
+    if count_indexed_variants(vcf_obj) is None:
+        for vcf_variant in vcf_obj:
+            if intervals.overlaps(vcf_variant.CHROM, vcf_variant.start, vcf_variant.end):
+                yield vcf_variant
+        return
+
+    prev_chrom, prev_end = None, None
+    for region in intervals.regions(contigs=vcf_obj.seqnames):
+        chrom, coords = region.rsplit(":", 1)
+        for vcf_variant in vcf_obj(region):
+            # Variants overlapping the previous interval were already returned by the previous query
+            if chrom == prev_chrom and vcf_variant.start < prev_end:
+                continue
+            yield vcf_variant
+        prev_chrom, prev_end = chrom, int(coords.split("-")[1])
+
+
+def count_indexed_variants(vcf_obj) -> Union[None, int]:
+    """Return the number of variants of a VCF object using the tabix/CSI index of the VCF file
 
-    vcf_bed = BedTool(vcf_file)
-    LOG.info(
-        "Extracting %s intervals from the %s total entries of the VCF file.",
-        filter.count(),
-        vcf_bed.count(),
-    )
-    intersections = vcf_bed.intersect(filter, header=True)
-    intersected_vars = intersections.count()
-    LOG.info("Number of variants found in the intervals:%s", intersected_vars)
+    Accepts:
+        vcf_obj(cyvcf2.VCF): a VCF object
 
-    return intersections
+    Returns:
+        nr_variants(int): number of variants, or None if VCF file is not indexed
+    """
+    try:
+        return vcf_obj.num_records
+    except ValueError:  # raised by cyvcf2 when VCF file is not indexed
+        return None
 
 
-def count_variants(vcf_obj) -> int:
-    """Count how many variants are contained in a VCF object
+def indexed_contigs(vcf_file) -> list:
+    """Return the canonical chromosomes of an indexed VCF file, which can be queried by region
 
     Accepts:
-        vcf_obj(cyvcf2.VCF): a VCF object
+        vcf_file(str): path to VCF file
 
     Returns:
-        nr_variants(int): number of variants
+        contigs(list): chromosome names as they are written in the VCF, empty if VCF file is not indexed
     """
-    nr_variants = 0
-    for vcf_variant in vcf_obj:
-        nr_variants += 1
-
-    return nr_variants
+    vcf_obj = VCF(vcf_file)
+    try:
+        if count_indexed_variants(vcf_obj) is None:
+            return []
+        return [contig for contig in vcf_obj.seqnames if contig.replace("chr", "") in CHROMOSOMES]
+    finally:
+        vcf_obj.close()
 
 
-def merge_intervals(panels) -> BedTool:
-    """Create genomic intervals to filter VCF files starting from the provided panel file(s)
+def vcf_has_variants(vcf_file) -> bool:
+    """Check if a VCF file contains at least one variant, without parsing the whole file
 
     Accepts:
-        panels(list) : path to one or more panel bed files
+        vcf_file(str): path to VCF file
 
     Returns:
-        merged_panels(Temp BED File): a temporary file with merged panel intervals
-
+        bool: True if VCF file contains variants. Raises an error if VCF file can't be read
     """
-    merged_panels = BedTool(panels[0])
-    if len(panels) > 1:
-        merged_panels = merged_panels.cat(*panels[1:])
-
-    return merged_panels
+    vcf_obj = VCF(vcf_file)
+    try:
+        nr_variants = count_indexed_variants(vcf_obj)
+        if nr_variants is None:  # read only the first variant of the file
+            nr_variants = 0 if next(vcf_obj, None) is None else 1
+    finally:
+        vcf_obj.close()
+    return nr_variants > 0
 
 
-def variant_called(vcf_samples, gt_positions, g_types) -> dict:
-    """Return a list of samples where variant was called
+def merge_intervals(panels) -> IntervalIndex:
+    """Create genomic intervals to filter VCF files starting from the provided panel file(s)
 
     Accepts:
-        vcf_samples(list): list of samples contained in VCF, ordered
-        gt_positions(list): list of positions to check GT for, i.e [0,2]: (check first and third sample)
-        g_types(list): list of GTypes, one for each sample, ordered.
+        panels(list) : path to one or more panel bed files
 
     Returns:
-        samples_with_call(dict): a dictionary of samples having the specific variant call with the allele count.
-            Example: {sample1:1, sample2:2}
-    """
+        merged_panels(IntervalIndex): merged panel intervals
 
-    samples_with_call = {}
-    allele_count = 0
+    """
+    return IntervalIndex.from_bed_files(panels)
 
-    for i, g_type in enumerate(g_types):
-        if i not in gt_positions:  # this sampple should not be considered, skip
-            continue
 
-        if g_type in [1, 3]:
-            # gt_types is array of 0,1,2,3==HOM_REF, HET, UNKNOWN, HOM_ALT
-            # Collect only samples with HET or HOM_ALT calls
-            if g_type == 1:
-                allele_count = 1  # HET
-            else:
-                allele_count = 2  # HOM_ALT
+def variant_carriers(sample_indices, gt_positions, g_types) -> dict:
+    """Return the dataset indices of the samples where a variant was called, by genotype
 
-            samples_with_call[vcf_samples[i]] = {"allele_count": allele_count}
+    Accepts:
+        sample_indices(numpy.ndarray): dataset indices of the samples at gt_positions
+        gt_positions(numpy.ndarray): positions to check GT for, i.e [0,2]: (check first and third sample)
+        g_types(numpy.ndarray): GTypes, one for each sample, ordered (cyvcf2.Variant.gt_types)
 
-    return samples_with_call
+    Returns:
+        carriers(dict): indices of samples with HET and HOM_ALT calls, without empty lists.
+            Example: {"het": [0, 4], "hom_alt": [2]}
+    """
+    # gt_types is array of 0,1,2,3==HOM_REF, HET, UNKNOWN, HOM_ALT
+    sample_gts = g_types[gt_positions]
+    carriers = {}
+    for genotype, gt_type in [(HET, 1), (HOM_ALT, 3)]:
+        indices = sample_indices[sample_gts == gt_type]
+        if indices.size:
+            carriers[genotype] = indices.tolist()
+    return carriers
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Union
+
+LOG = logging.getLogger(__name__)
+
+
+class LRUCacheBackend:
+    """In-process cache backend, discarding the least recently used entries when full"""
+
+    def __init__(self, maxsize=10000) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key) -> Union[None, str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCacheBackend:
+    """Cache backend shared by all server processes, saving entries to a Redis server.
+    Requires the redis Python package."""
+
+    def __init__(self, url, ttl=3600, prefix="cgbeacon2:query:") -> None:
+        import redis  # optional dependency, only required when this backend is used
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key) -> Union[None, str]:
+        value = self._client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value) -> None:
+        self._client.set(self.prefix + key, value, ex=self.ttl)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(match=self.prefix + "*"):
+            self._client.delete(key)
+
+
+CACHE_BACKENDS = {"lru": LRUCacheBackend, "redis": RedisCacheBackend}
+
+
+class QueryCache:
+    """Cache of the results of allele queries.
+
+    Cache keys contain the id of the last event registered in the database (see
+    utils.update.update_event), so results cached before datasets or variants were modified
+    are not used anymore.
+    """
+
+    def __init__(self, backend) -> None:
+        self.backend = backend
+
+    def key(self, mongo_query, response_type, datasets, auth_levels, last_event_id) -> str:
+        """Create the cache key of a query
+
+        Accepts:
+            mongo_query(dict): database query
+            response_type(str): ALL, HIT, MISS or NONE
+            datasets(list): dataset ids from request "datasetIds" field
+            auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+            last_event_id(bson.ObjectId): id of the last event saved in database
+
+        Returns:
+            key(str)
+        """
+        query_obj = dict(
+            query=mongo_query,
+            response_type=response_type,
+            datasets=sorted(set(datasets)),
+            auth_datasets=sorted(set(auth_levels[0])),
+            bona_fide=auth_levels[1],
+            event=str(last_event_id),
+        )
+        query_str = json.dumps(query_obj, sort_keys=True, default=str)
+        return hashlib.sha256(query_str.encode("utf-8")).hexdigest()
+
+    def get(self, key) -> Union[None, tuple]:
+        """Return the cached results of a query, or None"""
+        try:
+            value = self.backend.get(key)
+        except Exception as ex:  # a shared cache being unavailable shouldn't break queries
+            LOG.warning(f"Error reading from query cache:{ex}")
+            return None
+        if value is None:
+            return None
+        exists, ds_allele_responses = json.loads(value)
+        return exists, ds_allele_responses
+
+    def set(self, key, results) -> None:
+        """Save the results of a query"""
+        try:
+            self.backend.set(key, json.dumps(results))
+        except Exception as ex:
+            LOG.warning(f"Error saving to query cache:{ex}")
+
+
+def create_query_cache(cache_settings) -> Union[None, QueryCache]:
+    """Create a query cache from the QUERY_CACHE app config parameter
+
+    Accepts:
+        cache_settings(dict): i.e. {"backend": "lru", "maxsize": 10000} or
+            {"backend": "redis", "url": "redis://localhost:6379/0", "ttl": 3600}
+
+    Returns:
+        query_cache(QueryCache): None if the cache is not configured
+    """
+    if not cache_settings:
+        return None
+    settings = dict(cache_settings)
+    backend_name = settings.pop("backend", "lru")
+    if backend_name not in CACHE_BACKENDS:
+        LOG.warning(f"Unknown query cache backend '{backend_name}', query cache is disabled")
+        return None
+    try:
+        backend = CACHE_BACKENDS[backend_name](**settings)
+    except ImportError as ex:
+        LOG.warning(f"{ex}, query cache is disabled. Install it with: pip install cgbeacon2[redis]")
+        return None
+    LOG.info(f"Using a '{backend_name}' query cache")
+    return QueryCache(backend)
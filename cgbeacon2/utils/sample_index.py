@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from pymongo import ReturnDocument
+
+LOG = logging.getLogger(__name__)
+
+# Keys of the lists of sample indices saved for each dataset of a variant
+HET = "het"  # samples with a heterozygous call (allele count 1)
+HOM_ALT = "hom_alt"  # samples with a homozygous alternative call (allele count 2)
+ALLELE_COUNTS = {HET: 1, HOM_ALT: 2}
+
+
+def dataset_sample_indices(database, dataset_id, samples) -> dict:
+    """Return the integer indices of samples in the sample dictionary of a dataset.
+    Samples not yet present in the dictionary are added to it.
+
+    Accepts:
+        database(pymongo.database.Database)
+        dataset_id(str)
+        samples(iterable): sample names
+
+    Returns:
+        sample_indices(dict): sample names as keys and indices as values. Example: {"sample1": 0}
+    """
+    ds_collection = database["dataset"]
+    dataset = ds_collection.find_one({"_id": dataset_id}, {"sample_index": 1})
+    if dataset is None:
+        raise ValueError(f"Couldn't find any dataset with id '{dataset_id}' in the database")
+    sample_index = dataset.get("sample_index", {})
+
+    new_samples = [sample for sample in dict.fromkeys(samples) if sample not in sample_index]
+    for sample in new_samples:
+        # Reserve an index, then save it only if the sample wasn't added by another process meanwhile
+        next_index = ds_collection.find_one_and_update(
+            {"_id": dataset_id},
+            {"$inc": {"next_sample_index": 1}},
+            projection={"next_sample_index": 1},
+            return_document=ReturnDocument.BEFORE,
+        ).get("next_sample_index", 0)
+        ds_collection.update_one(
+            {"_id": dataset_id, ".".join(["sample_index", sample]): {"$exists": False}},
+            {"$set": {".".join(["sample_index", sample]): next_index}},
+        )
+    if new_samples:
+        LOG.info(
+            f"Added {len(new_samples)} samples to the sample dictionary of dataset {dataset_id}"
+        )
+        sample_index = ds_collection.find_one({"_id": dataset_id}, {"sample_index": 1})[
+            "sample_index"
+        ]
+
+    return {sample: sample_index[sample] for sample in samples}
+
+
+def saved_sample_indices(database, dataset_id, samples) -> list:
+    """Return the indices of the samples present in the sample dictionary of a dataset
+
+    Accepts:
+        database(pymongo.database.Database)
+        dataset_id(str)
+        samples(iterable): sample names
+
+    Returns:
+        indices(list): indices of the samples found in the dictionary
+    """
+    dataset = database["dataset"].find_one({"_id": dataset_id}, {"sample_index": 1}) or {}
+    sample_index = dataset.get("sample_index", {})
+    return [sample_index[sample] for sample in samples if sample in sample_index]
+
+
+def carriers_allele_count(carriers) -> int:
+    """Return the number of alternative alleles of the samples of a dataset carrying a variant
+
+    Accepts:
+        carriers(dict): sample indices by genotype. Example: {"het": [0, 4], "hom_alt": [2]}
+
+    Returns:
+        allele_count(int): example: 4
+    """
+    return sum(len(carriers.get(gt, [])) * count for gt, count in ALLELE_COUNTS.items())
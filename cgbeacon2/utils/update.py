@@ -1,37 +1,83 @@
 # -*- coding: utf-8 -*-
 import datetime
 import logging
-
+from itertools import islice
+
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE, INDEXES
+from cgbeacon2.utils.add import cumulative_allele_count
+from cgbeacon2.utils.bloom import open_bloom_filter
+from cgbeacon2.utils.metrics import LOAD_STAGE_SECONDS, timed
+from cgbeacon2.utils.sample_index import (
+    HET,
+    HOM_ALT,
+    carriers_allele_count,
+    dataset_sample_indices,
+)
+from cgbeacon2.utils.variant_key import compact_key
 from flask.cli import current_app
+from pymongo import ReplaceOne, UpdateOne
 from pymongo.results import InsertOneResult
 
-from .delete import delete_genes
-
 LOG = logging.getLogger(__name__)
 
+GENE_STAGING_COLLECTION = "gene_staging"
+
 
-def update_genes(gene_lines, build="GRCh37") -> list:
-    """Update database genes using Ensembl Biomart service
+def update_genes(gene_lines, build="GRCh37", batch_size=BULK_WRITE_BATCH_SIZE) -> int:
+    """Replace the genes of a genome build with genes parsed from Ensembl Biomart lines.
+    Genes are inserted in batches into a staging collection, together with the genes of the other
+    genome builds. The staging collection is then indexed and renamed over the gene collection,
+    so that queries filtering by genes never see a partially populated collection.
 
     Accepts:
-        gene_lines(types.GeneratorType)
+        gene_lines(iterable): lines from Ensembl Biomart or from a Biomart TSV file
+        build(str): GRCh37 or GRCh38
+        batch_size(int): number of genes inserted into the database at the time
 
     Returns:
-        inserted_ids(int): number of genes inserted
+        n_inserted(int): number of genes inserted
+    """
+    database = current_app.db
+    staging_collection = database[GENE_STAGING_COLLECTION]
+    staging_collection.drop()  # leftover from an interrupted update
+
+    n_inserted = _insert_in_batches(
+        staging_collection, parse_gene_lines(gene_lines, build), batch_size
+    )
+    if n_inserted == 0:
+        LOG.warning(f"No genes found for build {build}, gene collection was not updated")
+        staging_collection.drop()
+        return 0
+
+    # Keep the genes of the other genome builds
+    _insert_in_batches(
+        staging_collection, database["gene"].find({"build": {"$ne": build}}), batch_size
+    )
+    staging_collection.create_indexes(INDEXES["gene"])
+    staging_collection.rename("gene", dropTarget=True)
+    return n_inserted
+
+
+def parse_gene_lines(gene_lines, build):
+    """Parse the lines returned by Ensembl Biomart into gene objects
+
+    Accepts:
+        gene_lines(iterable): tab-separated lines with ensembl_gene_id, hgnc_id, hgnc_symbol,
+            chromosome_name, start_position, end_position
+        build(str): GRCh37 or GRCh38
+
+    Yields:
+        gene_obj(dict)
     """
-    gene_collection = current_app.db["gene"]
-    delete_genes(gene_collection, build)
-    gene_objects = []
     for line in gene_lines:
-        hgnc_id = None
         hgnc_symbol = None
-        parsed_line = line.rstrip().split("\t")
+        parsed_line = line.rstrip("\r\n").split("\t")
 
         if len(parsed_line) != 6:
             continue  # it's probably the last line (success message)
 
-        # No HGNC ID, do not insert gene into database
-        if parsed_line[1] == "":
+        # No HGNC ID or header line, do not insert gene into database
+        if parsed_line[1] == "" or parsed_line[4].isdigit() is False:
             continue
         if "HGNC:" in parsed_line[1]:
             parsed_line[1] = parsed_line[1].split(":")[1]
@@ -39,7 +85,7 @@ def update_genes(gene_lines, build="GRCh37") -> list:
         if parsed_line[2] != "":
             hgnc_symbol = parsed_line[2]
 
-        gene_obj = dict(
+        yield dict(
             ensembl_id=parsed_line[0],
             hgnc_id=hgnc_id,
             symbol=hgnc_symbol,
@@ -48,11 +94,24 @@ def update_genes(gene_lines, build="GRCh37") -> list:
             start=int(parsed_line[4]),
             end=int(parsed_line[5]),
         )
-        # gene_collection.insert_one(gene_obj)
-        gene_objects.append(gene_obj)
 
-    result = gene_collection.insert_many(gene_objects)
-    return result.inserted_ids
+
+def _insert_in_batches(collection, documents, batch_size) -> int:
+    """Insert documents from an iterable into a collection, batch_size documents at the time"""
+    n_inserted = 0
+    for batch in _batches(documents, batch_size):
+        n_inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    return n_inserted
+
+
+def _batches(items, batch_size):
+    """Yield lists of batch_size items from an iterable"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 def update_event(database, dataset_id, updated_collection, add) -> InsertOneResult.inserted_id:
@@ -81,7 +140,8 @@ def update_event(database, dataset_id, updated_collection, add) -> InsertOneResu
 
 
 def update_dataset(database, dataset_id, samples, add) -> None:
-    """Update dataset object in dataset collection after adding or removing variants
+    """Update dataset object in dataset collection after adding or removing variants.
+    Dataset variant and allele counts are kept up to date by the functions saving and removing variants.
 
     Accepts:
         database(pymongo.database.Database)
@@ -89,31 +149,24 @@ def update_dataset(database, dataset_id, samples, add) -> None:
         samples(list): list of samples to be added to/removed from dataset
         add(bool): whether the samples should be added or removed from dataset
     """
-    dataset_obj = database["dataset"].find_one({"_id": dataset_id})
-
-    # update list of samples for this dataset
-    updated_samples = update_dataset_samples(dataset_obj, samples, add)
-
-    # update variants count for this dataset
-    n_variants = update_dataset_variant_count(database, dataset_id)
+    with timed(LOAD_STAGE_SECONDS, "update_dataset"):
+        dataset_obj = database["dataset"].find_one({"_id": dataset_id})
 
-    # Update number of allele calls for this dataset
-    n_alleles = update_dataset_allele_count(database, dataset_id, list(updated_samples))
+        # update list of samples for this dataset
+        updated_samples = update_dataset_samples(dataset_obj, samples, add)
 
-    result = database["dataset"].find_one_and_update(
-        {"_id": dataset_id},
-        {
-            "$set": {
-                "samples": list(updated_samples),
-                "variant_count": n_variants,
-                "allele_count": n_alleles,
-                "updated": datetime.datetime.now(),
-            }
-        },
-    )
+        database["dataset"].find_one_and_update(
+            {"_id": dataset_id},
+            {
+                "$set": {
+                    "samples": list(updated_samples),
+                    "updated": datetime.datetime.now(),
+                }
+            },
+        )
 
-    # register an event for this update
-    update_event(database, dataset_id, "variant", add)
+        # register an event for this update
+        update_event(database, dataset_id, "variant", add)
 
 
 def update_dataset_samples(dataset_obj, samples, add=True) -> set:
@@ -139,79 +192,269 @@ def update_dataset_samples(dataset_obj, samples, add=True) -> set:
     return datasets_samples
 
 
-def update_dataset_variant_count(database, dataset_id) -> int:
-    """Count how many variants there are for a dataset and update dataset object with this number
+def compute_datasets_stats(database, dataset_ids) -> dict:
+    """Count variants and allele calls of one or more datasets with one pass over the variant collection
 
     Accepts:
         database(pymongo.database.Database)
-        dataset_id(str): id of dataset to be updated
+        dataset_ids(list): ids of the datasets to count variants and allele calls for
 
     Returns:
-        n_variants(int): the number of variants with calls for this dataset
+        datasets_stats(dict): dataset ids as keys and dictionaries with keys "variant_count"
+            and "allele_count" as values
     """
+    datasets_stats = {ds_id: {"variant_count": 0, "allele_count": 0} for ds_id in dataset_ids}
+    pipe = [
+        {
+            "$match": {
+                "$or": [
+                    {".".join(["datasetIds", ds_id]): {"$exists": True}} for ds_id in dataset_ids
+                ]
+            }
+        },
+        {"$project": {"_id": 0, "datasets": {"$objectToArray": "$datasetIds"}}},
+        {"$unwind": "$datasets"},
+        {"$match": {"datasets.k": {"$in": list(dataset_ids)}}},
+        {
+            "$project": {
+                "dataset": "$datasets.k",
+                "alleles": {
+                    "$add": [
+                        {"$size": {"$ifNull": [f"$datasets.v.{HET}", []]}},
+                        {"$multiply": [2, {"$size": {"$ifNull": [f"$datasets.v.{HOM_ALT}", []]}}]},
+                    ]
+                },
+            }
+        },
+        {
+            "$group": {
+                "_id": "$dataset",
+                "variant_count": {"$sum": 1},
+                "allele_count": {"$sum": "$alleles"},
+            }
+        },
+    ]
+    for res in database["variant"].aggregate(pipeline=pipe, allowDiskUse=True):
+        datasets_stats[res["_id"]] = {
+            "variant_count": res["variant_count"],
+            "allele_count": res["allele_count"],
+        }
 
-    variant_collection = database["variant"]
-    # Get all variants present with calls for this dataset
-    query = {".".join(["datasetIds", dataset_id]): {"$exists": True}}
-    n_variants = sum(1 for i in variant_collection.find(query))
-
-    LOG.info(f"Updated dataset contains {n_variants} variants")
-    return n_variants
+    return datasets_stats
 
 
-def update_dataset_allele_count(database, dataset_id, samples) -> int:
-    """Count how many allele calls are present for a dataset and update dataset object with this number
+def update_variant_counters(database, dataset_ids, batch_size=BULK_WRITE_BATCH_SIZE) -> int:
+    """Save the sample and call counters of datasets in variants lacking them (saved by previous software versions)
 
     Accepts:
         database(pymongo.database.Database)
-        dataset_id(str): id of dataset to be updated
-        samples(list): list of dataset samples
+        dataset_ids(list): ids of the datasets to save counters for
+        batch_size(int): number of variants sent to the database with each bulk write
 
     Returns:
-        updated_dataset(obj): the updated dataset
+        n_updated(int): number of variants updated
     """
-    allele_count = 0
-    variant_collection = database["variant"]
-
-    n_beacon_datasets = sum(1 for i in database["dataset"].find())
-
-    # If beacon contains only one dataset, then allele count is the sum of allele count for each variant
-    if n_beacon_datasets == 1:
-        pipe = [{"$group": {"_id": None, "alleles": {"$sum": "$call_count"}}}]
-        aggregate_res = variant_collection.aggregate(pipeline=pipe)
-        for res in aggregate_res:
-            allele_count += res.get("alleles")
+    n_updated = 0
+    for ds_id in dataset_ids:
+        ds_key = ".".join(["datasetIds", ds_id])
+        variants = database["variant"].find(
+            {ds_key: {"$exists": True}, ".".join([ds_key, "sample_count"]): {"$exists": False}},
+            {".".join([ds_key, key]): 1 for key in ["samples", HET, HOM_ALT]},
+        )
+        requests = []
+        for variant in variants:
+            dataset_obj = variant["datasetIds"][ds_id]
+            if "samples" in dataset_obj:  # samples not compacted yet
+                samples = dataset_obj["samples"]
+                sample_count = len(samples)
+                call_count = cumulative_allele_count(samples)
+            else:
+                sample_count = len(dataset_obj.get(HET, [])) + len(dataset_obj.get(HOM_ALT, []))
+                call_count = carriers_allele_count(dataset_obj)
+            counters = {
+                ".".join([ds_key, "sample_count"]): sample_count,
+                ".".join([ds_key, "call_count"]): call_count,
+            }
+            requests.append(UpdateOne({"_id": variant["_id"]}, {"$set": counters}))
+            if len(requests) >= batch_size:
+                n_updated += database["variant"].bulk_write(requests, ordered=False).modified_count
+                requests = []
+        if requests:
+            n_updated += database["variant"].bulk_write(requests, ordered=False).modified_count
+        LOG.info(f"Counters of dataset '{ds_id}' saved in variants")
+    return n_updated
 
-    # Else count calls for each sample of this dataset in variant collection and sum them up
-    else:
-        allele_count = _samples_calls(variant_collection, dataset_id, samples)
 
-    return allele_count
+def compact_variant_samples(database, dataset_ids, batch_size=BULK_WRITE_BATCH_SIZE) -> int:
+    """Replace the sample maps saved in variants by previous software versions
+    ({samples: {sample1: {allele_count: 1}}}) with lists of sample indices by genotype
+    ({het: [0]}), adding the samples to the sample dictionary of the datasets
 
+    Accepts:
+        database(pymongo.database.Database)
+        dataset_ids(list): ids of the datasets to compact samples for
+        batch_size(int): number of variants sent to the database with each bulk write
 
-def _samples_calls(variant_collection, dataset_id, samples) -> int:
-    """Count all allele calls for a dataset in variants collection
+    Returns:
+        n_updated(int): number of variants updated
+    """
+    n_updated = 0
+    for ds_id in dataset_ids:
+        ds_key = ".".join(["datasetIds", ds_id])
+        variants = database["variant"].find(
+            {".".join([ds_key, "samples"]): {"$exists": True}}, {".".join([ds_key, "samples"]): 1}
+        )
+        for batch in _batches(variants, batch_size):
+            batch_samples = [variant["datasetIds"][ds_id]["samples"] for variant in batch]
+            sample_indices = dataset_sample_indices(
+                database, ds_id, [sample for samples in batch_samples for sample in samples]
+            )
+            requests = []
+            for variant, samples in zip(batch, batch_samples):
+                carriers = {HET: [], HOM_ALT: []}
+                for sample, value in samples.items():
+                    genotype = HOM_ALT if value["allele_count"] == 2 else HET
+                    carriers[genotype].append(sample_indices[sample])
+                update = {
+                    ".".join([ds_key, genotype]): indices
+                    for genotype, indices in carriers.items()
+                    if indices
+                }
+                update[".".join([ds_key, "sample_count"])] = len(samples)
+                update[".".join([ds_key, "call_count"])] = cumulative_allele_count(samples)
+                requests.append(
+                    UpdateOne(
+                        {"_id": variant["_id"]},
+                        {"$set": update, "$unset": {".".join([ds_key, "samples"]): ""}},
+                    )
+                )
+            n_updated += database["variant"].bulk_write(requests, ordered=False).modified_count
+        LOG.info(f"Samples of dataset '{ds_id}' compacted in variants")
+    return n_updated
+
+
+def update_allele_lengths(database, batch_size=BULK_WRITE_BATCH_SIZE) -> int:
+    """Save the length of reference and alternate bases in variants saved by previous software versions
 
     Accepts:
-        variant_collection(pymongo.database.Database.Collection)
-        dataset_id(str): id of dataset to be updated
-        samples(list): list of dataset samples
+        database(pymongo.database.Database)
+        batch_size(int): number of variants sent to the database with each bulk write
+
     Returns:
-        allele_count(int)
+        n_updated(int): number of variants updated
     """
-    allele_count = 0
-
-    for sample in samples:
-        pipe = [
-            {
-                "$group": {
-                    "_id": None,
-                    "alleles": {"$sum": f"$datasetIds.{dataset_id}.samples.{sample}.allele_count"},
-                }
-            }
+    n_updated = 0
+    variants = database["variant"].find(
+        {"referenceLength": {"$exists": False}}, {"referenceBases": 1, "alternateBases": 1}
+    )
+    for batch in _batches(variants, batch_size):
+        requests = [
+            UpdateOne(
+                {"_id": variant["_id"]},
+                {
+                    "$set": {
+                        "referenceLength": len(variant["referenceBases"]),
+                        "alternateLength": len(variant["alternateBases"]),
+                    }
+                },
+            )
+            for variant in batch
         ]
-        aggregate_res = variant_collection.aggregate(pipeline=pipe)
-        for res in aggregate_res:
-            allele_count += res.get("alleles")
+        n_updated += database["variant"].bulk_write(requests, ordered=False).modified_count
+    return n_updated
+
+
+def update_variant_keys(database, batch_size=BULK_WRITE_BATCH_SIZE, bloom_filter_dir=None) -> int:
+    """Convert the md5 _id of variants saved by previous versions or with the md5 key format to compact keys.
+    Variants are saved with their compact key before the documents with md5 keys are removed,
+    so that the conversion can be interrupted and restarted. Variants already saved with a compact
+    key (i.e. loaded after changing the key format) are merged with the converted ones.
+    Variants should not be added or removed while keys are converted.
+
+    Accepts:
+        database(pymongo.database.Database)
+        batch_size(int): number of variants converted with each bulk write
+        bloom_filter_dir(str): directory of the variant Bloom filters, updated with the compact keys
 
-    return allele_count
+    Returns:
+        n_converted(int): number of variants converted
+    """
+    variant_collection = database["variant"]
+    n_converted = 0
+    for batch in _batches(variant_collection.find({"_id": {"$type": "string"}}), batch_size):
+        new_variants = {}
+        for variant in batch:
+            new_variant = dict(variant)
+            new_variant["_id"] = compact_key(
+                variant["referenceName"],
+                variant["start"],
+                variant["end"],
+                variant["referenceBases"],
+                variant["alternateBases"],
+                variant["assemblyId"],
+            )
+            if new_variant["_id"] in new_variants:
+                new_variant = _merge_variants(new_variants[new_variant["_id"]], new_variant)
+            new_variants[new_variant["_id"]] = new_variant
+        for saved_variant in variant_collection.find({"_id": {"$in": list(new_variants)}}):
+            new_variants[saved_variant["_id"]] = _merge_variants(
+                saved_variant, new_variants[saved_variant["_id"]]
+            )
+
+        variant_collection.bulk_write(
+            [
+                ReplaceOne({"_id": key}, new_variant, upsert=True)
+                for key, new_variant in new_variants.items()
+            ],
+            ordered=False,
+        )
+        _add_bloom_filter_keys(bloom_filter_dir, batch, new_variants.values())
+        variant_collection.delete_many({"_id": {"$in": [variant["_id"] for variant in batch]}})
+        n_converted += len(batch)
+        LOG.info(f"{n_converted} variants converted to compact keys")
+    return n_converted
+
+
+def _merge_variants(variant, other_variant) -> dict:
+    """Merge the datasets of two documents of the same variant saved with different keys"""
+    merged_datasets = dict(variant["datasetIds"])
+    call_count = variant.get("call_count", 0) + other_variant.get("call_count", 0)
+    for ds_id, other_ds in other_variant["datasetIds"].items():
+        saved_ds = merged_datasets.get(ds_id)
+        if saved_ds is None:
+            merged_datasets[ds_id] = other_ds
+            continue
+        if "samples" in saved_ds or "samples" in other_ds:
+            raise ValueError(
+                "Variants contain sample names, run 'beacon update compact-samples' before converting variant keys"
+            )
+        merged_ds = {}
+        for genotype in [HET, HOM_ALT]:
+            indices = set(saved_ds.get(genotype, [])) | set(other_ds.get(genotype, []))
+            if indices:
+                merged_ds[genotype] = sorted(indices)
+        merged_ds["sample_count"] = len(merged_ds.get(HET, [])) + len(merged_ds.get(HOM_ALT, []))
+        merged_ds["call_count"] = carriers_allele_count(merged_ds)
+        merged_datasets[ds_id] = merged_ds
+        # Calls of samples saved in both documents are counted once
+        call_count -= saved_ds["call_count"] + other_ds["call_count"] - merged_ds["call_count"]
+
+    return dict(variant, datasetIds=merged_datasets, call_count=call_count)
+
+
+def _add_bloom_filter_keys(bloom_filter_dir, converted_variants, new_variants) -> None:
+    """Add the compact keys of converted variants to the Bloom filters of their genome assembly,
+    and count their md5 keys as removed"""
+    n_removed = {}
+    for variant in converted_variants:
+        n_removed[variant["assemblyId"]] = n_removed.get(variant["assemblyId"], 0) + 1
+    for assembly, n_assembly_removed in n_removed.items():
+        bloom_filter = open_bloom_filter(bloom_filter_dir, assembly, writable=True)
+        if bloom_filter is None:
+            continue
+        with bloom_filter.updating():
+            bloom_filter.add(
+                variant["_id"] for variant in new_variants if variant["assemblyId"] == assembly
+            )
+            bloom_filter.mark_removed(n_assembly_removed)
+        bloom_filter.close()
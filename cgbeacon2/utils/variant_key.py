@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import struct
+from typing import Union
+
+from cgbeacon2.constants import CHROMOSOMES
+from cgbeacon2.utils.md5 import md5_key
+
+# 32-character hex string, variants randomly scattered in the _id index
+MD5_KEY = "md5"
+# binary key, variants sorted by assembly, chromosome and start in the _id index
+COMPACT_KEY = "compact"
+KEY_FORMATS = [MD5_KEY, COMPACT_KEY]
+
+ASSEMBLY_CODES = {"GRCh37": 1, "GRCh38": 2}
+CHROMOSOME_CODES = {chrom: code for code, chrom in enumerate(CHROMOSOMES, 1)}
+# assembly, chromosome and start, big-endian so that keys sort by genomic position
+KEY_PREFIX = struct.Struct(">BBI")
+HASH_SIZE = 8  # bytes of the hash of end, reference and alternate bases
+MAX_START = 2**32 - 1
+
+
+def _key_prefix(assembly, chrom, start) -> bytes:
+    """Return the position prefix of a compact key. Raises ValueError for unknown assemblies and chromosomes"""
+    if assembly not in ASSEMBLY_CODES or chrom not in CHROMOSOME_CODES:
+        raise ValueError(f"Can't create a compact variant key for {assembly} chromosome {chrom}")
+    start = int(start)
+    if not 0 <= start <= MAX_START:
+        raise ValueError(f"Can't create a compact variant key for start position {start}")
+    return KEY_PREFIX.pack(ASSEMBLY_CODES[assembly], CHROMOSOME_CODES[chrom], start)
+
+
+def compact_key(chrom, start, end, ref, alt, assembly) -> bytes:
+    """Generate a binary key representing uniquely the variant, saved as BinData in database.
+    Keys start with the packed genome assembly, chromosome and start of the variant, so that
+    neighbouring variants are neighbours in the _id index, followed by a short hash of end,
+    reference and alternate bases.
+
+    Accepts:
+        chrom(str): chromosome
+        start(int): variant start
+        end(int): variant end
+        ref(str): references bases
+        alt(str): alternative bases
+        assembly(str) genome assembly (GRCh37 or GRCh38)
+
+    Returns:
+        compact_key(bytes): 14-byte key
+    """
+    digest = hashlib.blake2b(
+        " ".join([str(int(end)), str(ref), str(alt)]).encode("utf-8"), digest_size=HASH_SIZE
+    ).digest()
+    return _key_prefix(assembly, chrom, start) + digest
+
+
+def variant_key(chrom, start, end, ref, alt, assembly, key_format=MD5_KEY) -> Union[str, bytes]:
+    """Generate the _id of a variant using the md5 or the compact key format
+
+    Returns:
+        key(str or bytes): md5_key or compact_key
+    """
+    if key_format == COMPACT_KEY:
+        return compact_key(chrom, start, end, ref, alt, assembly)
+    return md5_key(chrom, start, end, ref, alt, assembly)
+
+
+def compact_key_range(assembly, chrom, start=None) -> Union[None, dict]:
+    """Return the bounds of the compact keys of the variants of a chromosome, optionally within a start range
+
+    Accepts:
+        assembly(str): GRCh37 or GRCh38
+        chrom(str): chromosome
+        start(int or dict): exact start or range query on start, i.e. {"$gte": 100, "$lte": 200}
+
+    Returns:
+        key_range(dict): {"$gte": lowest key, "$lte": highest key}, or None for unknown assemblies and chromosomes
+    """
+    start_range = start if isinstance(start, dict) else {"$gte": start, "$lte": start}
+    start_min = max(start_range.get("$gte") or 0, 0)
+    start_max = min(
+        MAX_START if start_range.get("$lte") is None else start_range["$lte"], MAX_START
+    )
+    try:
+        return {
+            "$gte": _key_prefix(assembly, chrom, start_min) + b"\x00" * HASH_SIZE,
+            "$lte": _key_prefix(assembly, chrom, start_max) + b"\xff" * HASH_SIZE,
+        }
+    except ValueError:
+        return None
@@ -85,6 +85,9 @@ setup(
     keywords=KEYWORDS,
     packages=find_packages(),
     install_requires=REQUIRED,
+    extras_require={
+        "redis": ["redis"],  # query cache shared by all server processes
+    },
     include_package_data=True,
     license=LICENSE,
     classifiers=[
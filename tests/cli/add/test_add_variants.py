@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+import gzip
+import pickle
+from concurrent.futures import Future
+
 from cgbeacon2.cli.commands import cli
+from cgbeacon2.utils import add as add_utils
 from cgbeacon2.resources import (
     panel1_path,
     panel2_path,
@@ -8,6 +13,30 @@ from cgbeacon2.resources import (
     test_snv_vcf_path,
     test_sv_vcf_path,
 )
+from cgbeacon2.utils.bloom import bloom_filter_path, create_bloom_filter, open_bloom_filter
+from cgbeacon2.utils.variant_key import compact_key
+from tests.conftest import INDEXED_SV_VCF_PATH
+
+
+class PicklingExecutor:
+    """A stub process pool running the submitted calls in the test process, after pickling them like a process pool does"""
+
+    def __init__(self, max_workers=None, mp_context=None) -> None:
+        self.max_workers = max_workers
+        self.n_calls = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def submit(self, fn, *args):
+        fn, args = pickle.loads(pickle.dumps((fn, args)))
+        self.n_calls += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
 
 
 def test_add_variants_no_dataset(mock_app):
@@ -66,6 +95,42 @@ def test_add_variants_empty_vcf(mock_app, public_dataset, database):
     assert "Provided VCF file doesn't contain any variant" in result.output
 
 
+def test_add_variants_unreadable_vcf(mock_app, public_dataset, database, tmp_path):
+    """Test the cli command to add variants when the variants of the VCF file can't be read"""
+
+    runner = mock_app.test_cli_runner()
+
+    # Having a database containing a dataset
+    database["dataset"].insert_one(public_dataset)
+    # And a VCF file with a valid header and a malformed variant
+    with gzip.open(test_snv_vcf_path, "rt") as vcf_handle:
+        header = [line for line in vcf_handle if line.startswith("#")]
+    vcf_path = tmp_path / "malformed.vcf"
+    vcf_path.write_text(
+        "".join(header) + "1\tnot_a_position\t.\tA\tT\t.\t.\t.\tGT\t0/1\t0/1\t0/1\n"
+    )
+
+    # When invoking the add variants with this VCF file
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            public_dataset["_id"],
+            "--vcf",
+            str(vcf_path),
+            "--sample",
+            "ADM1059A2",
+        ],
+    )
+
+    # Then the command should return error
+    assert result.exit_code == 1
+    # And a specific error message
+    assert "Error while reading VCF file" in result.output
+
+
 def test_add_variants_wrong_samples(mock_app, public_dataset, database):
     """Test the cli command to add variants providing samples that are not in the VCF file"""
 
@@ -134,7 +199,10 @@ def test_add_variants_snv(mock_app, public_dataset, database):
     assert isinstance(test_variant["referenceBases"], str)
     assert isinstance(test_variant["alternateBases"], str)
     assert test_variant["assemblyId"] == "GRCh37"
-    assert sample in test_variant["datasetIds"][dataset["_id"]]["samples"]
+    # With the index of the sample in the sample dictionary of the dataset
+    sample_index = database["dataset"].find_one()["sample_index"][sample]
+    saved_ds = test_variant["datasetIds"][dataset["_id"]]
+    assert sample_index in saved_ds.get("het", []) + saved_ds.get("hom_alt", [])
 
     # And one event should have been saved for the updated variant collection
     saved_events = sum(1 for i in database["event"].find({"updated_collection": "variant"}))
@@ -347,13 +415,9 @@ def test_add_same_variant_different_datasets(
     hit_dset2 = {".".join(["datasetIds", registered_dataset["_id"]]): {"$exists": True}}
     test_variant = database["variant"].find_one({"$and": [hit_dset1, hit_dset2]})
 
-    # Variant should countain callCount for each sample
-    callCount1 = test_variant["datasetIds"][public_dataset["_id"]]["samples"][samples[0]][
-        "allele_count"
-    ]
-    callCount2 = test_variant["datasetIds"][registered_dataset["_id"]]["samples"][samples[1]][
-        "allele_count"
-    ]
+    # Variant should countain callCount for each dataset
+    callCount1 = test_variant["datasetIds"][public_dataset["_id"]]["call_count"]
+    callCount2 = test_variant["datasetIds"][registered_dataset["_id"]]["call_count"]
 
     # And a cumulative call count as well
     assert test_variant["call_count"] == callCount1 + callCount2
@@ -491,3 +555,280 @@ def test_add_snv_sv_variants(mock_app, public_dataset, database):
     # THEN more variants should have been added to the database
     new_saved_vars = sum(1 for i in database["variant"].find())
     assert new_saved_vars > saved_snvs
+
+
+def test_add_variants_small_batch_size(mock_app, public_dataset, database):
+    """Test adding the same SV variants using different bulk write batch sizes"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a database containing a dataset
+    dataset = public_dataset
+    database["dataset"].insert_one(dataset)
+
+    sample = "ADM1059A1"
+
+    # WHEN variants are added in batches of 2 variants
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            dataset["_id"],
+            "--vcf",
+            test_sv_vcf_path,
+            "--sample",
+            sample,
+            "--batch-size",
+            2,
+        ],
+    )
+    assert result.exit_code == 0
+    saved_vars = list(database["variant"].find())
+    assert f"{len(saved_vars)} variants loaded into the database" in result.output
+
+    # THEN loading again the same variants with the default batch size
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            dataset["_id"],
+            "--vcf",
+            test_sv_vcf_path,
+            "--sample",
+            sample,
+        ],
+    )
+    # Should not save or update any variant
+    assert "0 variants loaded into the database" in result.output
+    assert sum(1 for i in database["variant"].find()) == len(saved_vars)
+    # AND the dataset should contain the right number of variants and calls
+    dataset_obj = database["dataset"].find_one()
+    assert dataset_obj["variant_count"] == len(saved_vars)
+    assert dataset_obj["allele_count"] == sum(var["call_count"] for var in saved_vars)
+
+
+def test_add_variants_processes_not_indexed(mock_app, public_dataset, database):
+    """Test the add variants command with more than one process and a VCF file with no index"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a database containing a dataset
+    dataset = public_dataset
+    database["dataset"].insert_one(dataset)
+
+    # WHEN variants from a VCF file without index are added using 2 processes
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            dataset["_id"],
+            "--vcf",
+            test_sv_vcf_path,
+            "--sample",
+            "ADM1059A1",
+            "--processes",
+            2,
+        ],
+    )
+    # THEN the command should load variants using one process
+    assert result.exit_code == 0
+    assert "Loading variants using one process" in result.output
+    saved_vars = list(database["variant"].find())
+    assert saved_vars
+    assert f"{len(saved_vars)} variants loaded into the database" in result.output
+
+
+def test_add_variants_bloom_filter(mock_app, public_dataset, database, tmp_path):
+    """Test that the cli command adding variants updates the variant Bloom filter"""
+
+    mock_app.config["BLOOM_FILTER_DIR"] = str(tmp_path)
+    runner = mock_app.test_cli_runner()
+
+    # Having a database containing a dataset
+    database["dataset"].insert_one(public_dataset)
+    # And an empty variant Bloom filter
+    create_bloom_filter(bloom_filter_path(str(tmp_path), "GRCh37"), [], capacity=1000)
+
+    # When invoking the add variants command
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            public_dataset["_id"],
+            "--vcf",
+            test_snv_vcf_path,
+            "--sample",
+            "ADM1059A1",
+        ],
+    )
+    assert result.exit_code == 0
+
+    # Then the keys of all saved variants should be added to the filter
+    bloom_filter = open_bloom_filter(str(tmp_path), "GRCh37")
+    variant_ids = [variant["_id"] for variant in database["variant"].find()]
+    assert variant_ids
+    assert all(variant_id in bloom_filter for variant_id in variant_ids)
+    assert bloom_filter.count == len(variant_ids)
+    bloom_filter.close()
+
+
+def test_add_variants_compact_keys(mock_app, public_dataset, database):
+    """Test the cli command to add variants using the compact key format"""
+
+    runner = mock_app.test_cli_runner()
+    mock_app.config["VARIANT_KEY_FORMAT"] = "compact"
+
+    # Having a database containing a dataset
+    database["dataset"].insert_one(public_dataset)
+
+    # When invoking the add variants from a VCF file
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            public_dataset["_id"],
+            "--vcf",
+            test_snv_vcf_path,
+            "--sample",
+            "ADM1059A1",
+        ],
+    )
+    assert result.exit_code == 0
+
+    # Then variants should be saved with compact keys matching their coordinates
+    saved_vars = list(database["variant"].find())
+    assert saved_vars
+    for variant in saved_vars:
+        assert variant["_id"] == compact_key(
+            variant["referenceName"],
+            variant["start"],
+            variant["end"],
+            variant["referenceBases"],
+            variant["alternateBases"],
+            variant["assemblyId"],
+        )
+
+
+def test_add_variants_indexed_progress(mock_app, public_dataset, database, monkeypatch):
+    """Test that the progress bar of the add variants command counts the variants of an indexed VCF file"""
+
+    runner = mock_app.test_cli_runner()
+    database["dataset"].insert_one(public_dataset)
+    # GIVEN a progress bar recording the number of variants to process
+    progress_bars = []
+
+    class ProgressBar(add_utils.Bar):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            progress_bars.append(self)
+
+    monkeypatch.setattr(add_utils, "Bar", ProgressBar)
+
+    # WHEN variants of an indexed VCF file are added
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            public_dataset["_id"],
+            "--vcf",
+            INDEXED_SV_VCF_PATH,
+            "--sample",
+            "ADM1059A1",
+        ],
+    )
+    assert result.exit_code == 0
+
+    # THEN the progress bar should count all the records of the VCF file
+    assert len(progress_bars) == 1
+    with gzip.open(INDEXED_SV_VCF_PATH, "rt") as vcf_handle:
+        n_records = sum(1 for line in vcf_handle if not line.startswith("#"))
+    assert progress_bars[0].max == n_records
+    assert progress_bars[0].index == n_records
+
+
+def test_add_variants_processes_indexed(mock_app, public_dataset, database, tmp_path, monkeypatch):
+    """Test that loading an indexed VCF file with one process for each chromosome saves the same variants and dataset counters as loading it with one process"""
+
+    mock_app.config["BLOOM_FILTER_DIR"] = str(tmp_path)
+    create_bloom_filter(bloom_filter_path(str(tmp_path), "GRCh37"), [], capacity=1000)
+    runner = mock_app.test_cli_runner()
+    # GIVEN a process pool running chromosome loaders in the test process
+    executors = []
+
+    def process_pool(max_workers=None, mp_context=None):
+        executors.append(PicklingExecutor(max_workers, mp_context))
+        return executors[-1]
+
+    monkeypatch.setattr(add_utils, "ProcessPoolExecutor", process_pool)
+    # AND loaders connecting to the test database
+    monkeypatch.setitem(mock_app.config, "DB_NAME", database.name)
+    clients = []
+
+    def mongo_client(database_uri, **client_settings):
+        clients.append((database_uri, client_settings))
+        return database.client
+
+    monkeypatch.setattr(add_utils, "MongoClient", mongo_client)
+
+    loaded = {}
+    for processes in [1, 2]:
+        # GIVEN a database containing a dataset and no variants
+        database["variant"].drop()
+        database["dataset"].drop()
+        database["dataset"].insert_one(dict(public_dataset))
+
+        # WHEN variants of 2 samples of an indexed VCF file are added
+        result = runner.invoke(
+            cli,
+            [
+                "add",
+                "variants",
+                "--ds",
+                public_dataset["_id"],
+                "--vcf",
+                INDEXED_SV_VCF_PATH,
+                "--sample",
+                "ADM1059A1",
+                "--sample",
+                "ADM1059A2",
+                "--processes",
+                processes,
+            ],
+        )
+        assert result.exit_code == 0
+        variants = list(database["variant"].find().sort("_id"))
+        assert f"{len(variants)} variants loaded into the database" in result.output
+        dataset = database["dataset"].find_one()
+        loaded[processes] = (
+            variants,
+            dataset["variant_count"],
+            dataset["allele_count"],
+            dataset["sample_index"],
+        )
+
+    # THEN variants should have been loaded by one loader for each chromosome of the VCF file
+    assert len(executors) == 1
+    assert executors[0].max_workers == 2
+    assert executors[0].n_calls == len(clients) > 1
+    # AND each loader should connect to the database using the loading client settings
+    assert all(database_uri == mock_app.config["DB_URI"] for database_uri, _ in clients)
+    assert all(settings.get("w") == "majority" for _, settings in clients)
+    # AND the same variants and dataset counters should be saved as with one process
+    assert loaded[1][0]
+    assert loaded[2] == loaded[1]
+    # AND variants should be added to the Bloom filter
+    bloom_filter = open_bloom_filter(str(tmp_path), "GRCh37")
+    assert all(variant["_id"] in bloom_filter for variant in loaded[2][0])
+    bloom_filter.close()
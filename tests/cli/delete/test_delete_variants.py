@@ -83,19 +83,15 @@ def test_delete_variants(mock_app, public_dataset, database):
     assert initial_vars > 0
 
     # There should be variants called for both samples in database
-    condition = {"$exists": True}
-    test_variant = database["variant"].find_one(
-        {
-            "$and": [
-                {".".join(["datasetIds", dataset["_id"], "samples", sample]): condition},
-                {".".join(["datasetIds", dataset["_id"], "samples", sample2]): condition},
-            ]
-        }
-    )
+    sample_index = database["dataset"].find_one()["sample_index"]
+    ds_key = ".".join(["datasetIds", dataset["_id"]])
+    test_variant = database["variant"].find_one({".".join([ds_key, "sample_count"]): 2})
     assert test_variant is not None
-    samples = test_variant["datasetIds"][dataset["_id"]]["samples"]
+    saved_ds = test_variant["datasetIds"][dataset["_id"]]
+    carriers = saved_ds.get("het", []) + saved_ds.get("hom_alt", [])
+    assert sorted(carriers) == sorted([sample_index[sample], sample_index[sample2]])
     # Whose allele count contribute to the general variant call count
-    cumulative_allele_count = samples[sample]["allele_count"] + samples[sample2]["allele_count"]
+    cumulative_allele_count = len(saved_ds.get("het", [])) + 2 * len(saved_ds.get("hom_alt", []))
     assert test_variant["call_count"] == cumulative_allele_count
 
     # When one of the samples is removed using the command line
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.cli.commands import cli
+from cgbeacon2.constants import INDEXES
+from cgbeacon2.utils.bloom import open_bloom_filter
+
+
+def test_index_report_missing(mock_app):
+    """Test the cli command that reports missing indexes on an empty database"""
+
+    runner = mock_app.test_cli_runner()
+
+    # WHEN invoking the index report command on a database without indexes
+    result = runner.invoke(cli, ["index", "report"])
+
+    # THEN the command should report the missing indexes of every collection
+    assert result.exit_code == 0
+    for collection in INDEXES:
+        assert f"Missing indexes for collection '{collection}'" in result.output
+
+
+def test_index_create(mock_app, database):
+    """Test the cli command that creates database indexes"""
+
+    runner = mock_app.test_cli_runner()
+
+    # WHEN invoking the index create command
+    result = runner.invoke(cli, ["index", "create"])
+    assert result.exit_code == 0
+
+    # THEN all expected indexes should be available in the database
+    for collection, indexes in INDEXES.items():
+        existing = database[collection].index_information()
+        for index in indexes:
+            assert index.document["name"] in existing
+
+    # AND the report command should not find missing indexes
+    result = runner.invoke(cli, ["index", "report"])
+    assert "No missing indexes" in result.output
+
+
+def test_index_rebuild(mock_app, database):
+    """Test the cli command that drops and re-creates database indexes"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a database with a custom index
+    database["variant"].create_index("referenceBases", name="custom")
+
+    # WHEN invoking the index rebuild command
+    result = runner.invoke(cli, ["index", "rebuild"], input="y")
+    assert result.exit_code == 0
+
+    # THEN the custom index should be dropped and the expected indexes created
+    existing = database["variant"].index_information()
+    assert "custom" not in existing
+    for index in INDEXES["variant"]:
+        assert index.document["name"] in existing
+
+
+def test_index_bloom_not_configured(mock_app):
+    """Test the cli command that creates variant Bloom filters when no filter directory is configured"""
+
+    runner = mock_app.test_cli_runner()
+
+    # WHEN invoking the index bloom command without the BLOOM_FILTER_DIR config parameter
+    result = runner.invoke(cli, ["index", "bloom"])
+
+    # THEN the command should abort
+    assert result.exit_code == 1
+    assert "BLOOM_FILTER_DIR" in result.output
+
+
+def test_index_bloom(mock_app, database, test_snv, tmp_path):
+    """Test the cli command that creates the Bloom filters of the variant keys"""
+
+    mock_app.config["BLOOM_FILTER_DIR"] = str(tmp_path / "bloom")
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a database with a variant
+    database["variant"].insert_one(test_snv)
+
+    # WHEN invoking the index bloom command
+    result = runner.invoke(cli, ["index", "bloom", "--capacity", "1000"])
+
+    # THEN a filter should be created for the assembly of the variant
+    assert result.exit_code == 0
+    assert "created with 1 variants, capacity:1000" in result.output
+    bloom_filter = open_bloom_filter(mock_app.config["BLOOM_FILTER_DIR"], "GRCh37")
+    assert test_snv["_id"] in bloom_filter
+    bloom_filter.close()
+
+    # AND the filter should be described by the index report command
+    result = runner.invoke(cli, ["index", "report"])
+    assert "1 variants added (capacity:1000), 0 removed from database" in result.output
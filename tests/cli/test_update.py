@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import responses  # for the sake of mocking it
 from cgbeacon2.cli.commands import cli
+from cgbeacon2.resources import test_sv_vcf_path
 from cgbeacon2.utils.ensembl_biomart import BIOMART_38
+from cgbeacon2.utils.variant_key import compact_key
 
 # Example of query runned on the EnsemblBiomartClient
 XML_QUERY = """%3C?xml%20version=%221.0%22%20encoding=%22UTF-8%22?%3E%0A%3C!DOCTYPE%20Query%3E%0A%3CQuery%20%20virtualSchemaName%20=%20%22default%22%20formatter%20=%20%22TSV%22%20header%20=%20%220%22%20uniqueRows%20=%20%220%22%20count%20=%20%22%22%20datasetConfigVersion%20=%20%220.6%22%20completionStamp%20=%20%221%22%3E%0A%0A%09%3CDataset%20name%20=%20%22hsapiens_gene_ensembl%22%20interface%20=%20%22default%22%20%3E%0A%09%09%3CFilter%20name%20=%20%22chromosome_name%22%20value%20=%20%221,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,X,Y,MT%22/%3E%0A%09%09%3CAttribute%20name%20=%20%22ensembl_gene_id%22%20/%3E%0A%09%09%3CAttribute%20name%20=%20%22hgnc_id%22%20/%3E%0A%09%09%3CAttribute%20name%20=%20%22hgnc_symbol%22%20/%3E%0A%09%09%3CAttribute%20name%20=%20%22chromosome_name%22%20/%3E%0A%09%09%3CAttribute%20name%20=%20%22start_position%22%20/%3E%0A%09%09%3CAttribute%20name%20=%20%22end_position%22%20/%3E%0A%09%3C/Dataset%3E%0A%3C/Query%3E"""
@@ -38,3 +40,242 @@ def test_update_genes_build_38(mock_app, database):
     assert f"Number of inserted genes for build {build}: 3" in result.output
     genes = list(database["gene"].find())
     assert len(genes) == 3
+
+
+def test_update_genes_from_file(mock_app, database, tmp_path):
+    """Test the cli command that updates the genes of a genome build using a local Biomart TSV file"""
+
+    # GIVEN a database with one gene for build GRCh37 and one gene for build GRCh38
+    database["gene"].insert_many(
+        [
+            {"ensembl_id": "ENSG00000128513", "hgnc_id": 17284, "build": "GRCh37"},
+            {"ensembl_id": "ENSG00000171314", "hgnc_id": 8888, "build": "GRCh38"},
+        ]
+    )
+    # AND a Biomart TSV file with a header line and 2 genes with HGNC ID
+    gene_file = tmp_path / "genes.tsv"
+    gene_file.write_text(
+        "Gene stable ID\tHGNC ID\tHGNC symbol\tChromosome\tGene start (bp)\tGene end (bp)\n"
+        "ENSG00000171314\tHGNC:8888\tPGAM1\t10\t99185917\t99193198\n"
+        "ENSG00000121236\tHGNC:16277\tTRIM6\t11\t5617339\t5634188\n"
+        "ENSG00000232218\t\t\t22\t32386668\t32386868\n"
+    )
+
+    runner = mock_app.test_cli_runner()
+
+    # WHEN invoking the update genes command for build GRCh37 using the file
+    result = runner.invoke(cli, ["update", "genes", "-build", "GRCh37", "--file", str(gene_file)])
+
+    # THEN the GRCh37 genes should be replaced by the genes in the file
+    assert result.exit_code == 0
+    assert "Number of inserted genes for build GRCh37: 2" in result.output
+    grch37_genes = {gene["hgnc_id"] for gene in database["gene"].find({"build": "GRCh37"})}
+    assert grch37_genes == {8888, 16277}
+    # AND the GRCh38 gene should still be in the database
+    assert database["gene"].count_documents({"build": "GRCh38"}) == 1
+    # AND the staging collection should be gone
+    assert "gene_staging" not in database.list_collection_names()
+
+
+def test_update_genes_empty_file(mock_app, database, tmp_path):
+    """Test that genes are not removed when the provided Biomart file contains no genes"""
+
+    # GIVEN a database with one gene
+    database["gene"].insert_one(
+        {"ensembl_id": "ENSG00000128513", "hgnc_id": 17284, "build": "GRCh37"}
+    )
+    # AND an empty Biomart file
+    gene_file = tmp_path / "genes.tsv"
+    gene_file.write_text("")
+
+    # WHEN invoking the update genes command using the file
+    runner = mock_app.test_cli_runner()
+    result = runner.invoke(cli, ["update", "genes", "--file", str(gene_file)])
+
+    # THEN no genes should be inserted and the old gene should be kept
+    assert "Number of inserted genes for build GRCh37: 0" in result.output
+    assert database["gene"].count_documents({}) == 1
+
+
+def test_update_stats_recompute(mock_app, public_dataset, database):
+    """Test the cli command that recomputes the variant and allele counts of a dataset"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a dataset with variants loaded from a VCF file
+    database["dataset"].insert_one(public_dataset)
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "--ds",
+            public_dataset["_id"],
+            "--vcf",
+            test_sv_vcf_path,
+            "--sample",
+            "ADM1059A1",
+        ],
+    )
+    assert result.exit_code == 0
+
+    # THEN the dataset counts should be up to date
+    saved_vars = list(database["variant"].find())
+    dataset = database["dataset"].find_one()
+    assert dataset["variant_count"] == len(saved_vars)
+    assert dataset["allele_count"] == sum(var["call_count"] for var in saved_vars)
+
+    # WHEN dataset counts are altered
+    database["dataset"].update_one(
+        {"_id": public_dataset["_id"]}, {"$set": {"variant_count": 0, "allele_count": 0}}
+    )
+    # AND the update stats command is invoked with the recompute option
+    result = runner.invoke(cli, ["update", "stats", "--recompute"])
+    assert result.exit_code == 0
+    assert "stats updated" in result.output
+
+    # THEN the dataset counts should be fixed
+    dataset = database["dataset"].find_one()
+    assert dataset["variant_count"] == len(saved_vars)
+    assert dataset["allele_count"] == sum(var["call_count"] for var in saved_vars)
+
+    # AND recomputing again should not update the dataset
+    result = runner.invoke(cli, ["update", "stats", "--recompute"])
+    assert "stats updated" not in result.output
+
+
+def test_update_stats_no_datasets(mock_app, database):
+    """Test the cli command that shows dataset stats when there are no datasets"""
+
+    runner = mock_app.test_cli_runner()
+    result = runner.invoke(cli, ["update", "stats"])
+    assert "Couldn't find any dataset in the database" in result.output
+
+
+def test_update_variant_counters(mock_app, public_dataset, database, test_snv):
+    """Test the cli command that saves dataset counters in variants saved without them"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a dataset with a variant saved without dataset counters
+    database["dataset"].insert_one(public_dataset)
+    test_snv["datasetIds"] = {
+        public_dataset["_id"]: {
+            "samples": {"ADM1059A1": {"allele_count": 2}, "ADM1059A2": {"allele_count": 1}}
+        }
+    }
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the update variant-counters command is invoked
+    result = runner.invoke(cli, ["update", "variant-counters"])
+    assert result.exit_code == 0
+    assert "Dataset counters saved in 1 variants" in result.output
+
+    # THEN the variant should contain the sample and call counters of the dataset
+    saved_ds = database["variant"].find_one()["datasetIds"][public_dataset["_id"]]
+    assert saved_ds["sample_count"] == 2
+    assert saved_ds["call_count"] == 3
+
+    # AND invoking the command again should not update any variant
+    result = runner.invoke(cli, ["update", "variant-counters"])
+    assert "Dataset counters saved in 0 variants" in result.output
+
+
+def test_update_compact_samples(mock_app, public_dataset, database, test_snv):
+    """Test the cli command that replaces sample names saved in variants with sample indices"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a dataset with a variant saved with sample names
+    database["dataset"].insert_one(public_dataset)
+    test_snv["datasetIds"] = {
+        public_dataset["_id"]: {
+            "samples": {"ADM1059A1": {"allele_count": 2}, "ADM1059A2": {"allele_count": 1}}
+        }
+    }
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the update compact-samples command is invoked
+    result = runner.invoke(cli, ["update", "compact-samples"])
+    assert result.exit_code == 0
+    assert "Samples compacted in 1 variants" in result.output
+
+    # THEN the samples should be added to the sample dictionary of the dataset
+    sample_index = database["dataset"].find_one()["sample_index"]
+    assert sorted(sample_index.values()) == [0, 1]
+
+    # AND the variant should contain sample indices by genotype and the dataset counters
+    saved_ds = database["variant"].find_one()["datasetIds"][public_dataset["_id"]]
+    assert "samples" not in saved_ds
+    assert saved_ds["hom_alt"] == [sample_index["ADM1059A1"]]
+    assert saved_ds["het"] == [sample_index["ADM1059A2"]]
+    assert saved_ds["sample_count"] == 2
+    assert saved_ds["call_count"] == 3
+
+    # AND invoking the command again should not update any variant
+    result = runner.invoke(cli, ["update", "compact-samples"])
+    assert "Samples compacted in 0 variants" in result.output
+
+
+def test_update_variant_keys_md5_format(mock_app):
+    """Test the cli command that converts variant keys when the app uses md5 keys"""
+
+    runner = mock_app.test_cli_runner()
+
+    # WHEN the update variant-keys command is invoked without the compact key format
+    result = runner.invoke(cli, ["update", "variant-keys"])
+
+    # THEN it should abort
+    assert result.exit_code != 0
+    assert "Set VARIANT_KEY_FORMAT = 'compact'" in result.output
+
+
+def test_update_variant_keys(mock_app, database, test_snv, test_sv):
+    """Test the cli command that converts md5 variant keys to compact keys"""
+
+    runner = mock_app.test_cli_runner()
+    mock_app.config["VARIANT_KEY_FORMAT"] = "compact"
+
+    # GIVEN 2 variants saved with md5 keys
+    database["variant"].insert_many([dict(test_snv), test_sv])
+    # AND one of them also saved with a compact key, for a sample of another dataset
+    new_key = compact_key("1", 235878452, 235878453, "G", "GTTT", "GRCh37")
+    test_snv["_id"] = new_key
+    test_snv["datasetIds"] = {"other_ds": {"het": [0], "sample_count": 1, "call_count": 1}}
+    test_snv["call_count"] = 1
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the update variant-keys command is invoked
+    result = runner.invoke(cli, ["update", "variant-keys"])
+    assert result.exit_code == 0
+    assert "2 variants converted to compact keys" in result.output
+
+    # THEN all variants should have compact keys
+    variants = list(database["variant"].find())
+    assert len(variants) == 2
+    assert all(isinstance(variant["_id"], bytes) for variant in variants)
+    # AND the variant saved with both keys should contain the datasets of both documents
+    merged_variant = database["variant"].find_one({"_id": new_key})
+    assert set(merged_variant["datasetIds"]) == {"public_ds", "other_ds"}
+    assert merged_variant["call_count"] == 3
+
+
+def test_update_allele_lengths(mock_app, database, test_snv):
+    """Test the cli command that saves allele lengths in variants saved without them"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a variant saved without allele lengths
+    test_snv.pop("referenceLength")
+    test_snv.pop("alternateLength")
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the update allele-lengths command is invoked
+    result = runner.invoke(cli, ["update", "allele-lengths"])
+    assert result.exit_code == 0
+    assert "Allele lengths saved in 1 variants" in result.output
+
+    # THEN the variant should contain the length of its alleles
+    variant = database["variant"].find_one()
+    assert variant["referenceLength"] == 1
+    assert variant["alternateLength"] == 4
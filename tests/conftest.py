@@ -1,15 +1,23 @@
 # -*- coding: utf-8 -*-
+import os
 import time
 
 import mongomock
 import pytest
+import responses
 from authlib.jose import jwt
 from cgbeacon2.server import create_app
+from cgbeacon2.utils.auth import clear_auth_caches
 
 DATABASE_NAME = "testdb"
+JWKS_URL = "https://jwks.stub/oidc/jwk"
 GA4GH_SCOPES = ["openid", "ga4gh_passport_v1"]
 OAUTH2_ISSUER = "https://login.elixir-czech.org/oidc/"
 CLAIM_SUB = "someone@somewhere.se"
+# bgzipped copy of the demo SV VCF file, indexed with tabix
+INDEXED_SV_VCF_PATH = os.path.join(
+    os.path.dirname(__file__), "fixtures", "test_trio.SV.indexed.vcf.gz"
+)
 
 
 @pytest.fixture(scope="function")
@@ -49,6 +57,9 @@ def mock_app(database):
     """Create a test app to be used in the tests"""
     app = create_app()
     app.db = database
+    app.query_db = database
+    # run the jobs created by add and delete requests in the test process
+    app.job_pool.n_workers = 1
 
     # fix test oauth2 params for the mock app
     return app
@@ -82,9 +93,17 @@ def test_snv():
         "referenceBases": "G",
         "alternateBases": "GTTT",
         "assemblyId": "GRCh37",
-        "datasetIds": {"public_ds": {"samples": {"ADM1059A1": {"allele_count": 2}}}},
+        "datasetIds": {
+            "public_ds": {
+                "hom_alt": [0],
+                "sample_count": 1,
+                "call_count": 2,
+            }
+        },
         "call_count": 2,
     }
+    variant["referenceLength"] = len(variant["referenceBases"])
+    variant["alternateLength"] = len(variant["alternateBases"])
     return variant
 
 
@@ -100,9 +119,17 @@ def test_sv():
         "alternateBases": "GT",
         "variantType": "DEL",
         "assemblyId": "GRCh37",
-        "datasetIds": {"public_ds": {"samples": {"ADM1059A1": {"allele_count": 1}}}},
+        "datasetIds": {
+            "public_ds": {
+                "het": [0],
+                "sample_count": 1,
+                "call_count": 1,
+            }
+        },
         "call_count": 1,
     }
+    variant["referenceLength"] = len(variant["referenceBases"])
+    variant["alternateLength"] = len(variant["alternateBases"])
     return variant
 
 
@@ -119,9 +146,17 @@ def test_bnd_sv():
         "alternateBases": "A]2:321681]",
         "variantType": "BND",
         "assemblyId": "GRCh37",
-        "datasetIds": {"test_public": {"samples": {"ADM1059A1": {"allele_count": 1}}}},
+        "datasetIds": {
+            "test_public": {
+                "het": [0],
+                "sample_count": 1,
+                "call_count": 1,
+            }
+        },
         "call_count": 1,
     }
+    variant["referenceLength"] = len(variant["referenceBases"])
+    variant["alternateLength"] = len(variant["alternateBases"])
     return variant
 
 
@@ -242,6 +277,27 @@ def test_gene():
 # https://github.com/mpdavis/python-jose/blob/master/tests/test_jwt.py
 
 
+@pytest.fixture(autouse=True)
+def auth_caches():
+    """Make sure that JWK sets and auth levels cached by a test are not used by other tests"""
+    clear_auth_caches()
+    yield
+    clear_auth_caches()
+
+
+@pytest.fixture
+def jwks_server(pem):
+    """A stub JWK server returning a JWK set containing the test key, cacheable for 60 seconds"""
+    with responses.RequestsMock() as mock_server:
+        mock_server.add(
+            responses.GET,
+            JWKS_URL,
+            json={"keys": [pem]},
+            headers={"Cache-Control": "public, max-age=60"},
+        )
+        yield mock_server
+
+
 @pytest.fixture
 def mock_oauth2(pem):
     """Mock OAuth2 params for the mock app"""
@@ -5,6 +5,7 @@ from cgbeacon2.resources import test_snv_vcf_path
 
 API_ADD_DATASET = "/apiv1.0/add_dataset"
 API_ADD = "/apiv1.0/add"
+API_JOBS = "/apiv1.0/jobs"
 INVALID_TOKEN = "Invalid auth token error"
 PATH_TO_VCF = "path/to/vcf"
 
@@ -329,3 +330,56 @@ def test_variants_add_ensembl_genes(
     updated_dataset = database["dataset"].find_one()
     # And dataset should be updated with sample
     assert updated_dataset["samples"] == samples
+
+
+def test_variants_add_job_status(mock_app, public_dataset, database, api_user, api_req_headers):
+    """Test the endpoint returning the status of the job created by an add variants request"""
+    # GIVEN an authorized API user
+    database["user"].insert_one(api_user)
+    # GIVEN a database containing a public dataset
+    database["dataset"].insert_one(public_dataset)
+
+    # WHEN the add endpoint receives a POST request with valid data
+    data = {
+        "dataset_id": public_dataset["_id"],
+        "vcf_path": test_snv_vcf_path,
+        "assemblyId": "GRCh37",
+        "samples": ["ADM1059A1"],
+    }
+    response = mock_app.test_client().post(API_ADD, json=data, headers=api_req_headers)
+    # Then it should return a 202 (accepted) response with a job id
+    assert response.status_code == 202
+    job_id = json.loads(response.data)["job_id"]
+
+    # And given some time to load variants
+    time.sleep(3)
+
+    # THEN the job status endpoint should return the job as completed
+    response = mock_app.test_client().get(f"{API_JOBS}/{job_id}", headers=api_req_headers)
+    assert response.status_code == 200
+    job = json.loads(response.data)
+    assert job["job_id"] == job_id
+    assert job["type"] == "add"
+    assert job["status"] == "completed"
+    assert job["result"]["added"] > 0
+    assert job["progress"]["variants"] == job["result"]["added"]
+
+
+def test_job_status_not_found(mock_app, database, api_user, api_req_headers):
+    """Test the job status endpoint with the id of a job that doesn't exist"""
+    # GIVEN an authorized API user
+    database["user"].insert_one(api_user)
+
+    # WHEN the job status endpoint is interrogated with a non-existing job id
+    response = mock_app.test_client().get(f"{API_JOBS}/foo", headers=api_req_headers)
+    # THEN it should return not found
+    assert response.status_code == 404
+
+
+def test_job_status_wrong_auth_token(mock_app, database, api_req_headers):
+    """Test the job status endpoint with a request without a valid auth token"""
+    # WHEN the job status endpoint is interrogated with an invalid token
+    api_req_headers["X-Auth-Token"] = "FOO"
+    response = mock_app.test_client().get(f"{API_JOBS}/foo", headers=api_req_headers)
+    # THEN it should return not authorized
+    assert response.status_code == 403
@@ -432,3 +432,55 @@ def test_post_query_controlled_dataset_bona_fide_token(
     data = json.loads(response.data)
     # And the beacon response would be Found=Yes
     assert data["exists"] is True
+
+
+def test_post_query_passports_cached(
+    mock_app,
+    registered_dataset,
+    test_snv,
+    basic_query,
+    test_token,
+    mock_oauth2,
+    monkeypatch,
+    pem,
+    registered_access_passport_info,
+):
+    """Test that passports are not collected and validated again for the same token"""
+
+    userdata_calls = []
+
+    # Monkeypatch Elixir JWT server public key
+    def mock_public_server(*args, **kwargs):
+        return pem
+
+    def mock_ga4gh_userdata(*args, **kwargs):
+        userdata_calls.append(args)
+        return registered_access_passport_info
+
+    monkeypatch.setattr(auth, "elixir_key", mock_public_server)
+    monkeypatch.setattr(auth, "ga4gh_userdata", mock_ga4gh_userdata)
+
+    # Having a database containing a dataset with registered access protection
+    database = mock_app.db
+    registered_dataset["samples"] = ["ADM1059A1"]
+    database["dataset"].insert_one(registered_dataset)
+
+    # And a variant from the same dataset
+    test_snv["datasetIds"] = {registered_dataset["_id"]: {"samples": registered_dataset["samples"]}}
+    database["variant"].insert_one(test_snv)
+
+    headers = copy.deepcopy(HEADERS)
+    headers["Authorization"] = BEARER + test_token
+    mock_app.config["ELIXIR_OAUTH2"]["userinfo"] = mock_oauth2["userinfo"]
+
+    # When 2 POST requests with the same valid token are sent
+    for _ in range(2):
+        response = mock_app.test_client().post(
+            API_QUERY, headers=headers, data=json.dumps(basic_query)
+        )
+        # Both should find the variant in the registered dataset
+        assert response.status_code == 200
+        assert json.loads(response.data)["exists"] is True
+
+    # And the OIDC provider should be contacted only once
+    assert len(userdata_calls) == 1
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import json
+
+from cgbeacon2.constants import BATCH_TOO_LARGE, INVALID_BATCH, NO_MANDATORY_PARAMS
+
+HEADERS = {"Content-type": "application/json", "Accept": "application/json"}
+API_BATCH = "/apiv1.0/query/batch"
+
+SNV_QUERY = {
+    "referenceName": "1",
+    "start": 235878452,
+    "end": 235878453,
+    "referenceBases": "G",
+    "alternateBases": "GTTT",
+    "assemblyId": "GRCh37",
+}
+MISSING_SNV_QUERY = dict(SNV_QUERY, alternateBases="GT")
+RANGE_QUERY = {
+    "referenceName": "1",
+    "startMin": 235878400,
+    "startMax": 235878500,
+    "referenceBases": "G",
+    "alternateBases": "GTTT",
+    "assemblyId": "GRCh37",
+    "includeDatasetResponses": "HIT",
+}
+
+
+def test_query_batch(mock_app, test_snv, public_dataset):
+    """Test a batch query with exact, range and invalid allele requests"""
+
+    # Having a database with a variant and a dataset
+    database = mock_app.db
+    database["variant"].insert_one(test_snv)
+    database["dataset"].insert_one(public_dataset)
+
+    # GIVEN a batch of allele requests
+    allele_requests = [
+        dict(SNV_QUERY, includeDatasetResponses="ALL"),
+        MISSING_SNV_QUERY,
+        RANGE_QUERY,
+        {"referenceName": "1"},
+    ]
+
+    # WHEN the batch is sent to the server
+    response = mock_app.test_client().post(
+        API_BATCH, data=json.dumps({"alleleRequests": allele_requests}), headers=HEADERS
+    )
+
+    # THEN it should return a response for each allele, in the same order
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    allele_responses = data["alleleResponses"]
+    assert len(allele_responses) == 4
+
+    assert allele_responses[0]["exists"] is True
+    assert allele_responses[0]["alleleRequest"]["alternateBases"] == "GTTT"
+    assert allele_responses[0]["datasetAlleleResponses"][0]["datasetId"] == public_dataset["_id"]
+    assert allele_responses[0]["datasetAlleleResponses"][0]["callCount"] == 2
+
+    assert allele_responses[1]["exists"] is False
+    assert allele_responses[1]["datasetAlleleResponses"] == []
+
+    assert allele_responses[2]["exists"] is True
+    assert allele_responses[2]["datasetAlleleResponses"][0]["variantCount"] == 1
+
+    assert allele_responses[3]["exists"] is None
+    assert allele_responses[3]["error"] == NO_MANDATORY_PARAMS
+
+
+def test_query_batch_plain_list(mock_app, test_snv, public_dataset):
+    """Test a batch query sent as a list of allele requests"""
+
+    # Having a database with a variant and a dataset
+    database = mock_app.db
+    database["variant"].insert_one(test_snv)
+    database["dataset"].insert_one(public_dataset)
+
+    # WHEN a list of allele requests is sent to the server
+    response = mock_app.test_client().post(
+        API_BATCH, data=json.dumps([MISSING_SNV_QUERY, SNV_QUERY]), headers=HEADERS
+    )
+
+    # THEN it should return the responses for both alleles
+    data = json.loads(response.data)
+    assert [resp["exists"] for resp in data["alleleResponses"]] == [False, True]
+
+
+def test_query_batch_empty(mock_app):
+    """Test a batch query with no allele requests"""
+
+    # WHEN a batch query without allele requests is sent to the server
+    response = mock_app.test_client().post(
+        API_BATCH, data=json.dumps({"alleleRequests": []}), headers=HEADERS
+    )
+
+    # THEN it should return a bad request error
+    assert response.status_code == 400
+    assert json.loads(response.data)["error"] == INVALID_BATCH
+
+
+def test_query_batch_too_large(mock_app):
+    """Test a batch query with more allele requests than allowed"""
+
+    # GIVEN an app accepting at most 2 allele requests in a batch
+    mock_app.config["QUERY_BATCH_MAX_SIZE"] = 2
+
+    # WHEN a batch with 3 allele requests is sent to the server
+    response = mock_app.test_client().post(
+        API_BATCH, data=json.dumps({"alleleRequests": [SNV_QUERY] * 3}), headers=HEADERS
+    )
+
+    # THEN it should return an error
+    assert response.status_code == BATCH_TOO_LARGE["errorCode"]
+    assert "maximum 2" in json.loads(response.data)["error"]["errorMessage"]
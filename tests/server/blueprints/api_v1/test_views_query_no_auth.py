@@ -3,6 +3,14 @@ import json
 
 from cgbeacon2.cli.commands import cli
 from cgbeacon2.resources import test_bnd_vcf_path
+from cgbeacon2.utils.bloom import (
+    BloomFilterRegistry,
+    bloom_filter_path,
+    create_bloom_filter,
+    open_bloom_filter,
+)
+from cgbeacon2.utils.update import update_event
+from cgbeacon2.utils.variant_key import compact_key
 from flask import url_for
 
 HEADERS = {"Content-type": "application/json", "Accept": "application/json"}
@@ -165,6 +173,34 @@ def test_get_request_snv_regex(mock_app, test_snv, public_dataset):
         assert ds_level_result["exists"] is True
 
 
+def test_get_request_range_many_wildcards(mock_app, test_sv, public_dataset):
+    """Test running a range query when request contains a ref allele with many Ns"""
+
+    # GIVEN a dataset with a variant with a long ref allele:
+    database = mock_app.db
+    database["variant"].insert_one(test_sv)
+    database["dataset"].insert_one(public_dataset)
+
+    # GIVEN a range query with the ref allele bases replaced by Ns, except the first one
+    ref = test_sv["referenceBases"]
+    base_args = f"query?assemblyId={test_sv['assemblyId']}&referenceName={test_sv['referenceName']}"
+    range_args = f"startMin={test_sv['start'] - 10}&startMax={test_sv['start'] + 10}"
+    alt_arg = f"alternateBases={test_sv['alternateBases']}"
+    query_ref = ref[0] + "N" * (len(ref) - 1)
+    query_string = "&".join([base_args, f"referenceBases={query_ref}", range_args, alt_arg])
+
+    # THEN server response should return a match
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is True
+
+    # GIVEN the same query with a ref allele one base longer
+    query_string = "&".join([base_args, f"referenceBases={query_ref}N", range_args, alt_arg])
+
+    # THEN server response should not return a match
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is False
+
+
 def test_get_request_exact_position_snv_return_all(
     mock_app, test_snv, public_dataset, public_dataset_no_variants
 ):
@@ -318,6 +354,173 @@ def test_get_snv_query_variant_not_found(mock_app, public_dataset):
     assert data["exists"] is False
 
 
+def test_get_snv_query_hides_unauthorized_datasets(
+    mock_app, test_snv, public_dataset, registered_dataset
+):
+    """Test that exact and range queries without token don't return data from registered access datasets"""
+
+    # Having a database with a public and a registered access dataset
+    database = mock_app.db
+    database["dataset"].insert_many([public_dataset, registered_dataset])
+    # And a variant found in both datasets
+    test_snv["datasetIds"][registered_dataset["_id"]] = {
+        "samples": {"ADM1059A2": {"allele_count": 1}, "ADM1059A3": {"allele_count": 1}},
+        "sample_count": 2,
+        "call_count": 2,
+    }
+    database["variant"].insert_one(test_snv)
+
+    range_args = "startMin=235878400&startMax=235878500"
+    for query_string in [
+        "&".join([BASE_ARGS, COORDS_ARGS, ALT_ARG, "includeDatasetResponses=ALL"]),
+        "&".join([BASE_ARGS, range_args, ALT_ARG, "includeDatasetResponses=ALL"]),
+    ]:
+        # WHEN the variant is queried without a token
+        response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+        data = json.loads(response.data)
+
+        # THEN the variant should be found once in the public dataset
+        ds_responses = {resp["datasetId"]: resp for resp in data["datasetAlleleResponses"]}
+        assert ds_responses[public_dataset["_id"]]["exists"] is True
+        assert ds_responses[public_dataset["_id"]]["sampleCount"] == 1
+        assert ds_responses[public_dataset["_id"]]["variantCount"] == 1
+        # And no samples should be returned for the registered dataset
+        assert ds_responses[registered_dataset["_id"]]["exists"] is False
+        assert ds_responses[registered_dataset["_id"]]["sampleCount"] == 0
+
+
+def test_get_snv_query_cached(mock_app, test_snv, public_dataset):
+    """Test that query results are returned from the query cache until a new event is registered"""
+
+    # Having a database with a variant and a dataset
+    database = mock_app.db
+    database["variant"].insert_one(test_snv)
+    database["dataset"].insert_one(public_dataset)
+
+    # GIVEN a query for the variant
+    query_string = "&".join([BASE_ARGS, COORDS_ARGS, ALT_ARG])
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is True
+
+    # WHEN the variant is removed from the database without registering an event
+    database["variant"].delete_one({"_id": test_snv["_id"]})
+
+    # THEN the same query should return the cached results
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is True
+
+    # WHEN an event is registered
+    update_event(database, public_dataset["_id"], "variant", False)
+    mock_app.dataset_registry.invalidate()
+
+    # THEN the query should return the updated results
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is False
+
+
+def test_get_snv_query_bloom_filter(mock_app, test_snv, public_dataset, tmp_path):
+    """Test that exact queries for variants missing from the variant Bloom filter don't query the database"""
+
+    # Having a database with a variant and a dataset
+    database = mock_app.db
+    database["variant"].insert_one(test_snv)
+    database["dataset"].insert_one(public_dataset)
+    mock_app.query_cache = None
+
+    # GIVEN a Bloom filter which doesn't contain the variant
+    create_bloom_filter(bloom_filter_path(str(tmp_path), "GRCh37"), ["other_variant"], capacity=100)
+    mock_app.bloom_filters = BloomFilterRegistry(str(tmp_path))
+
+    # WHEN querying the variant
+    query_string = "&".join([BASE_ARGS, COORDS_ARGS, ALT_ARG, "includeDatasetResponses=ALL"])
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+
+    # THEN the variant should be reported as absent, without querying the database
+    data = json.loads(response.data)
+    assert data["exists"] is False
+    assert data["datasetAlleleResponses"][0]["exists"] is False
+
+    # WHEN the variant is added to the filter
+    bloom_filter = open_bloom_filter(str(tmp_path), "GRCh37", writable=True)
+    bloom_filter.add([test_snv["_id"]])
+    bloom_filter.close()
+
+    # THEN the query should find the variant in the database
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is True
+
+
+def test_get_snv_query_compact_key(mock_app, test_snv, public_dataset):
+    """Test exact queries for variants saved with compact keys, and with md5 keys while keys are converted"""
+
+    # Having a database with a dataset
+    database = mock_app.db
+    database["dataset"].insert_one(public_dataset)
+    mock_app.query_cache = None
+    # AND the compact key format
+    mock_app.config["VARIANT_KEY_FORMAT"] = "compact"
+
+    # GIVEN a variant saved with a md5 key
+    database["variant"].insert_one(test_snv)
+    query_string = "&".join([BASE_ARGS, COORDS_ARGS, ALT_ARG, "includeDatasetResponses=HIT"])
+
+    # THEN it should not be found with a compact key lookup
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is False
+
+    # WHEN legacy md5 keys are looked up as well
+    mock_app.config["LEGACY_VARIANT_KEYS"] = True
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    # THEN the variant should be found
+    assert json.loads(response.data)["exists"] is True
+
+    # GIVEN the variant saved with a compact key
+    mock_app.config["LEGACY_VARIANT_KEYS"] = False
+    database["variant"].delete_one({"_id": test_snv["_id"]})
+    test_snv["_id"] = compact_key("1", 235878452, 235878453, "G", "GTTT", "GRCh37")
+    database["variant"].insert_one(test_snv)
+
+    # THEN exact queries should find it
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    data = json.loads(response.data)
+    assert data["exists"] is True
+    assert data["datasetAlleleResponses"][0]["callCount"] == 2
+
+    # AND range queries bounded on the variant _id should find it
+    range_args = "startMin=235878400&startMax=235878500&alternateBases=GTTT"
+    query_string = "&".join([BASE_ARGS, range_args, "includeDatasetResponses=HIT"])
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is True
+    range_args = "startMin=235878453&startMax=235878500&alternateBases=GTTT"
+    query_string = "&".join([BASE_ARGS, range_args, "includeDatasetResponses=HIT"])
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is False
+
+
+def test_metrics(mock_app, test_snv, public_dataset):
+    """Test the endpoint returning query metrics"""
+
+    # Having a database with a variant and a dataset
+    database = mock_app.db
+    database["variant"].insert_one(test_snv)
+    database["dataset"].insert_one(public_dataset)
+
+    # GIVEN a query sent to the server
+    query_string = "&".join([BASE_ARGS, COORDS_ARGS, ALT_ARG])
+    mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+
+    # WHEN the metrics endpoint is used
+    response = mock_app.test_client().get("/metrics")
+
+    # THEN it should return the duration of the query stages
+    assert response.status_code == 200
+    metrics = response.data.decode("utf-8")
+    for stage in ["auth", "beacon", "mongo_query", "response"]:
+        assert f'beacon_query_stage_duration_seconds_count{{stage="{stage}"}}' in metrics
+    assert 'beacon_request_duration_seconds_count{endpoint="api_v1.query",status="200"}' in metrics
+    assert 'beacon_request_mongo_round_trips_count{endpoint="api_v1.query"}' in metrics
+
+
 ################## TESTS FOR HANDLING SV GET REQUESTS ################
 
 
@@ -561,3 +764,52 @@ def test_post_query_error(mock_app, test_snv, public_dataset):
     # that displays the error
     assert "alert alert-danger" in str(response.data)
     assert "Missing one or more mandatory parameters" in str(response.data)
+
+
+def test_get_request_range_query_dataset_counts(
+    mock_app, test_snv, public_dataset, public_dataset_no_variants, registered_dataset
+):
+    """Test a range query returning sample, call and variant counts aggregated by dataset"""
+
+    database = mock_app.db
+    # GIVEN a database with 2 public datasets and a registered dataset
+    for dataset in [public_dataset, public_dataset_no_variants, registered_dataset]:
+        database["dataset"].insert_one(dataset)
+
+    # AND 2 variants in the public dataset, one of them also present in the registered dataset
+    test_snv["datasetIds"][registered_dataset["_id"]] = {
+        "samples": {"ADM1059A3": {"allele_count": 1}},
+        "sample_count": 1,
+        "call_count": 1,
+    }
+    test_snv["call_count"] = 3
+    database["variant"].insert_one(test_snv)
+    other_snv = dict(test_snv)
+    other_snv["_id"] = "other_snv"
+    other_snv["start"] = test_snv["start"] + 1
+    other_snv["datasetIds"] = {
+        public_dataset["_id"]: {
+            "samples": {"ADM1059A1": {"allele_count": 1}, "ADM1059A2": {"allele_count": 1}},
+            "sample_count": 2,
+            "call_count": 2,
+        }
+    }
+    other_snv["call_count"] = 2
+    database["variant"].insert_one(other_snv)
+
+    # WHEN sending a range query returning all dataset responses
+    range_args = f"startMin={test_snv['start']}&startMax={test_snv['start'] + 5}"
+    query_string = "&".join([BASE_ARGS, range_args, ALT_ARG, "includeDatasetResponses=ALL"])
+    response = mock_app.test_client().get("".join([API_V1, query_string]), headers=HEADERS)
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data["exists"] is True
+
+    ds_responses = {resp["datasetId"]: resp for resp in data["datasetAlleleResponses"]}
+    # THEN the public dataset should contain the counts of both variants, for its samples only
+    assert ds_responses[public_dataset["_id"]]["sampleCount"] == 3
+    assert ds_responses[public_dataset["_id"]]["callCount"] == 4
+    assert ds_responses[public_dataset["_id"]]["variantCount"] == 2
+    # AND the other public dataset should not contain the variants
+    assert ds_responses[public_dataset_no_variants["_id"]]["exists"] is False
+    assert ds_responses[public_dataset_no_variants["_id"]]["variantCount"] == 0
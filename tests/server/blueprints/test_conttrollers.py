@@ -6,10 +6,31 @@ def test_add_coords_query_fuzzy_search():
     """test the function adding coordinates search to the allele database query"""
     mongo_query = {}
 
-    # GIVEN an alt allele with Ns
+    # GIVEN an alt allele with a few Ns
     alt = "TTANGN"
     add_coords_query(mongo_query, "alternateBases", alt)
-    assert mongo_query["alternateBases"] == {"$regex": alt.replace("N", ".")}
+    # THEN the query should contain all the sequences represented by the allele
+    assert len(mongo_query["alternateBases"]["$in"]) == 25
+    assert "TTAAGC" in mongo_query["alternateBases"]["$in"]
+    assert all(len(seq) == len(alt) for seq in mongo_query["alternateBases"]["$in"])
+
+
+def test_add_coords_query_fuzzy_search_regex():
+    """test the function adding coordinates search to the allele database query, with alleles with many Ns"""
+    mongo_query = {}
+
+    # GIVEN a ref allele with many Ns
+    ref = "GNNNNC"
+    add_coords_query(mongo_query, "referenceBases", ref)
+    # THEN the query should contain an anchored regex and the length of the allele
+    assert mongo_query["referenceBases"] == {"$regex": "^G....C$"}
+    assert mongo_query["referenceLength"] == 6
+
+    # GIVEN a ref allele consisting of a single N
+    mongo_query = {}
+    add_coords_query(mongo_query, "referenceBases", "N")
+    # THEN the query should match any ref allele
+    assert mongo_query == {}
 
 
 def test_overlapping_samples_overlap():
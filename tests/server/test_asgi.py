@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+from cgbeacon2.constants import NO_MANDATORY_PARAMS, WRONG_SCHEME
+from cgbeacon2.models.beacon import API_VERSION
+from cgbeacon2.server.asgi import create_asgi_app
+
+QUERY_ARGS = b"assemblyId=GRCh37&referenceName=1&referenceBases=G&alternateBases=GTTT"
+COORDS_ARGS = b"start=235878452&end=235878453"
+RANGE_ARGS = b"startMin=235878400&startMax=235878500"
+
+
+class AsyncCursor:
+    """A stub async cursor over a list of documents"""
+
+    def __init__(self, documents) -> None:
+        self.documents = list(documents)
+
+    async def to_list(self, length=None):
+        return self.documents[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.documents:
+            yield doc
+
+
+class AsyncCollection:
+    """A stub async collection, wrapping a mongomock collection and recording the queries it receives"""
+
+    def __init__(self, collection) -> None:
+        self.collection = collection
+        self.queries = []
+
+    async def find_one(self, query, projection=None):
+        self.queries.append(("find_one", query))
+        return self.collection.find_one(query, projection)
+
+    def find(self, query, projection=None):
+        self.queries.append(("find", query))
+        return AsyncCursor(self.collection.find(query, projection))
+
+    async def aggregate(self, pipeline):
+        self.queries.append(("aggregate", pipeline))
+        return AsyncCursor(self.collection.aggregate(pipeline))
+
+
+def async_query_app(mock_app):
+    """Return an ASGI app querying the variants of the mock app database with a stub async collection"""
+    asgi_app = create_asgi_app(mock_app)
+    asgi_app.db = {"variant": AsyncCollection(mock_app.db["variant"])}
+    return asgi_app
+
+
+def asgi_request(asgi_app, method, path, query_string=b"", body=b"", headers=None):
+    """Send a request to an ASGI app and return the response status code and data"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": headers or [(b"content-type", b"application/json")],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    return messages[0]["status"], json.loads(messages[1]["body"])
+
+
+def test_asgi_info(mock_app, public_dataset):
+    """Test the info endpoint of the async server"""
+
+    # GIVEN a database with a dataset
+    mock_app.db["dataset"].insert_one(public_dataset)
+    asgi_app = create_asgi_app(mock_app)
+
+    # WHEN the info endpoint is used
+    status, data = asgi_request(asgi_app, "GET", "/apiv1.0/info")
+
+    # THEN it should return beacon info
+    assert status == 200
+    assert data["id"] == mock_app.config["BEACON_OBJ"]["id"]
+    assert data["apiVersion"]
+
+
+def test_asgi_query_missing_params(mock_app):
+    """Test a query with missing mandatory params sent to the async server"""
+
+    asgi_app = create_asgi_app(mock_app)
+
+    # WHEN a query without referenceName is sent
+    status, data = asgi_request(
+        asgi_app,
+        "GET",
+        "/apiv1.0/query",
+        query_string=b"assemblyId=GRCh37&referenceBases=G&start=235878452",
+    )
+
+    # THEN it should return the same error as the Flask app
+    assert status == 400
+    assert data["error"] == NO_MANDATORY_PARAMS
+
+
+def test_asgi_query_wrong_auth_scheme(mock_app):
+    """Test a query with an auth token with the wrong scheme sent to the async server"""
+
+    asgi_app = create_asgi_app(mock_app)
+
+    # WHEN a query with a Basic auth header is sent
+    status, data = asgi_request(
+        asgi_app,
+        "POST",
+        "/apiv1.0/query",
+        body=b"{}",
+        headers=[(b"content-type", b"application/json"), (b"authorization", b"Basic foo")],
+    )
+
+    # THEN it should return an auth error
+    assert status == WRONG_SCHEME["errorCode"]
+    assert data == WRONG_SCHEME
+
+
+def test_asgi_not_found(mock_app):
+    """Test that endpoints modifying the database are not served by the async server"""
+
+    asgi_app = create_asgi_app(mock_app)
+
+    # WHEN the add endpoint is used
+    status, data = asgi_request(asgi_app, "POST", "/apiv1.0/add", body=b"{}")
+
+    # THEN the server should return not found
+    assert status == 404
+
+
+def test_asgi_registry_not_on_event_loop(mock_app, public_dataset, monkeypatch):
+    """Test that the dataset registry, which may query the database, is not used on the event loop"""
+
+    # GIVEN a database with a dataset
+    mock_app.db["dataset"].insert_one(public_dataset)
+    asgi_app = create_asgi_app(mock_app)
+    # AND a dataset registry recording if it's used from a thread running an event loop
+    on_event_loop = []
+    registry_refresh = mock_app.dataset_registry._refresh
+
+    def refresh(database):
+        try:
+            asyncio.get_running_loop()
+            on_event_loop.append(True)
+        except RuntimeError:
+            on_event_loop.append(False)
+        registry_refresh(database)
+
+    monkeypatch.setattr(mock_app.dataset_registry, "_refresh", refresh)
+
+    # WHEN the info endpoint is used
+    status, _ = asgi_request(asgi_app, "GET", "/apiv1.0/info")
+
+    # THEN the registry should have been used only in worker threads
+    assert status == 200
+    assert on_event_loop and not any(on_event_loop)
+
+
+def test_asgi_query_response_types(mock_app, test_snv, public_dataset, public_dataset_no_variants):
+    """Test the dataset responses returned by exact queries sent to the async server"""
+
+    # GIVEN a database with a variant found in one of two datasets
+    mock_app.db["variant"].insert_one(test_snv)
+    public_dataset["samples"] = ["ADM1059A1"]
+    mock_app.db["dataset"].insert_many([public_dataset, public_dataset_no_variants])
+    asgi_app = async_query_app(mock_app)
+
+    expected_datasets = {
+        "ALL": {public_dataset["_id"]: True, public_dataset_no_variants["_id"]: False},
+        "HIT": {public_dataset["_id"]: True},
+        "MISS": {public_dataset_no_variants["_id"]: False},
+    }
+    for response_type, expected in expected_datasets.items():
+        # WHEN the variant is queried with a dataset response type
+        query_string = b"&".join(
+            [QUERY_ARGS, COORDS_ARGS, f"includeDatasetResponses={response_type}".encode()]
+        )
+        status, data = asgi_request(asgi_app, "GET", "/apiv1.0/query", query_string=query_string)
+
+        # THEN the variant should be found
+        assert status == 200
+        assert data["exists"] is True
+        # AND the expected datasets should be returned
+        ds_responses = {
+            resp["datasetId"]: resp["exists"] for resp in data["datasetAlleleResponses"]
+        }
+        assert ds_responses == expected
+
+    # WHEN the variant is queried without dataset responses
+    status, data = asgi_request(
+        asgi_app, "GET", "/apiv1.0/query", query_string=b"&".join([QUERY_ARGS, COORDS_ARGS])
+    )
+    # THEN only the existence of the variant should be returned
+    assert data["exists"] is True
+    assert data["datasetAlleleResponses"] == []
+    # AND the response should contain the beacon id from the app config
+    assert data["beaconId"] == mock_app.config["BEACON_OBJ"]["id"]
+    assert data["apiVersion"] == API_VERSION
+    # AND variants should have been queried with the async collection
+    assert [query[0] for query in asgi_app.db["variant"].queries] == [
+        "find",
+        "find",
+        "find",
+        "find_one",
+    ]
+
+
+def test_asgi_range_query(mock_app, test_snv, public_dataset):
+    """Test a range query sent to the async server"""
+
+    # GIVEN a database with a variant
+    mock_app.db["variant"].insert_one(test_snv)
+    mock_app.db["dataset"].insert_one(public_dataset)
+    asgi_app = async_query_app(mock_app)
+
+    # WHEN variants are queried in a range of positions containing the variant
+    query_string = b"&".join([QUERY_ARGS, RANGE_ARGS, b"includeDatasetResponses=HIT"])
+    status, data = asgi_request(asgi_app, "GET", "/apiv1.0/query", query_string=query_string)
+
+    # THEN the variant should be found using an aggregation pipeline
+    assert status == 200
+    assert data["exists"] is True
+    assert asgi_app.db["variant"].queries[0][0] == "aggregate"
+    # AND the dataset response should contain the variant counts
+    ds_response = data["datasetAlleleResponses"][0]
+    assert ds_response["datasetId"] == public_dataset["_id"]
+    assert ds_response["variantCount"] == 1
+    assert ds_response["callCount"] == test_snv["datasetIds"]["public_ds"]["call_count"]
+
+    # WHEN variants are queried in a range of positions not containing the variant
+    query_string = b"&".join(
+        [QUERY_ARGS, b"startMin=1000&startMax=2000", b"includeDatasetResponses=HIT"]
+    )
+    status, data = asgi_request(asgi_app, "GET", "/apiv1.0/query", query_string=query_string)
+
+    # THEN the variant should not be found
+    assert data["exists"] is False
+    assert data["datasetAlleleResponses"] == []
+
+
+def test_asgi_query_auth_filtering(mock_app, test_snv, public_dataset, registered_dataset):
+    """Test that exact and range queries sent to the async server return data only from the datasets the user has access to"""
+
+    # GIVEN a database with a public and a registered access dataset
+    mock_app.db["dataset"].insert_many([public_dataset, registered_dataset])
+    # AND a variant found only in the registered dataset
+    test_snv["datasetIds"] = {
+        registered_dataset["_id"]: {"het": [0, 1], "sample_count": 2, "call_count": 2}
+    }
+    mock_app.db["variant"].insert_one(test_snv)
+    asgi_app = async_query_app(mock_app)
+
+    for args in [COORDS_ARGS, RANGE_ARGS]:
+        query_string = b"&".join([QUERY_ARGS, args, b"includeDatasetResponses=ALL"])
+
+        # WHEN the variant is queried by a user without access to the registered dataset
+        status, data = asgi_request(asgi_app, "GET", "/apiv1.0/query", query_string=query_string)
+        # THEN the variant should not be found
+        assert status == 200
+        assert data["exists"] is False
+        assert all(resp["exists"] is False for resp in data["datasetAlleleResponses"])
+
+        # WHEN the variant is queried by a user with access to the registered dataset
+        async def registered_access(request):
+            return ([registered_dataset["_id"]], False)
+
+        asgi_app.authlevel = registered_access
+        status, data = asgi_request(asgi_app, "GET", "/apiv1.0/query", query_string=query_string)
+        del asgi_app.authlevel
+
+        # THEN the variant should be found in the registered dataset
+        assert data["exists"] is True
+        ds_responses = {resp["datasetId"]: resp for resp in data["datasetAlleleResponses"]}
+        assert ds_responses[registered_dataset["_id"]]["exists"] is True
+        assert ds_responses[registered_dataset["_id"]]["sampleCount"] == 2
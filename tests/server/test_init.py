@@ -54,3 +54,61 @@ def test_create_app_in_container(monkeypatch):
     assert app
     db_attrs = str(vars(app.db))  # convert database attributes to string
     assert "host=['mongodb:27017']" in db_attrs
+
+
+def test_create_app_client_profiles():
+    """Test that the app uses separate database clients for queries and for loading data"""
+
+    # GIVEN an app created with the default config file
+    app = create_app()
+
+    # THEN queries should be sent to the primary member of replica sets
+    assert app.query_db.client.read_preference.mongos_mode == "primary"
+    assert app.query_db.client.options.pool_options.max_pool_size == app.config[
+        "MONGO_QUERY_CLIENT"
+    ].get("maxPoolSize")
+    # AND data should be saved using the write concern of the loading client
+    assert app.db.client.write_concern.document["w"] == "majority"
+    assert app.db.client is not app.query_db.client
+
+
+def test_job_pool_disabled_by_default(database):
+    """Test that the server doesn't start worker threads with the default JOB_WORKERS setting"""
+
+    # GIVEN an app created with the default config
+    app = create_app()
+    app.db = database
+    app.query_db = database
+    assert app.config["JOB_WORKERS"] == 0
+
+    # WHEN the app receives its first request
+    with app.test_client() as client:
+        client.get("/")
+
+    # THEN no worker threads should be running
+    assert app.job_pool.n_workers == 0
+    assert app.job_pool._threads == []
+
+
+def test_job_pool_started_by_first_request(monkeypatch, tmp_path, database):
+    """Test that worker threads enabled with JOB_WORKERS are started by the first request, before any job is queued"""
+
+    # GIVEN a config file enabling 2 worker threads in each server process
+    config_file = tmp_path / "config.py"
+    config_file.write_text("from cgbeacon2.instance.config import *\n\nJOB_WORKERS = 2\n")
+    monkeypatch.setenv("CGBEACON2_CONFIG", str(config_file))
+
+    # GIVEN an app whose job worker threads are not running
+    app = create_app()
+    app.db = database
+    app.query_db = database
+    assert app.job_pool._threads == []
+
+    # WHEN the app receives its first request
+    with app.test_client() as client:
+        client.get("/")
+
+    # THEN the worker threads should be running
+    assert len(app.job_pool._threads) == 2
+    assert all(thread.is_alive() for thread in app.job_pool._threads)
+    app.job_pool.stop()
@@ -1,5 +1,6 @@
 import pytest
-from cgbeacon2.utils.add import add_dataset
+from cgbeacon2.models.variant import Variant
+from cgbeacon2.utils.add import add_dataset, add_variants_batch
 from pymongo.errors import DuplicateKeyError
 
 
@@ -16,3 +17,54 @@ def test_add_dataset_twice(public_dataset, database):
     # THEN it should raise a pymongo DuplicateKeyError
     with pytest.raises(DuplicateKeyError) as error:
         add_dataset(database, public_dataset)
+
+
+def test_add_variants_batch(database, public_dataset, registered_dataset):
+    """Test saving a batch of variants with a bulk write"""
+
+    parsed_variant = dict(
+        chromosome="1",
+        start=235878452,
+        end=235878453,
+        reference_bases="G",
+        alternate_bases="GTTT",
+        variant_type="INDEL",
+    )
+    # GIVEN a batch with the same variant repeated for 2 samples
+    ds_id = public_dataset["_id"]
+    batch = [
+        Variant(parsed_variant, {ds_id: {"het": [0]}}),
+        Variant(parsed_variant, {ds_id: {"hom_alt": [1]}}),
+    ]
+
+    # WHEN the batch is saved to database
+    assert add_variants_batch(database, batch, ds_id) == 1
+
+    # THEN one variant should be created, with both samples and the cumulative call count
+    saved_variant = database["variant"].find_one()
+    assert saved_variant["referenceBases"] == "G"
+    assert (saved_variant["referenceLength"], saved_variant["alternateLength"]) == (1, 4)
+    assert saved_variant["datasetIds"][ds_id]["het"] == [0]
+    assert saved_variant["datasetIds"][ds_id]["hom_alt"] == [1]
+    assert saved_variant["call_count"] == 3
+    # AND the sample and call counters of the dataset
+    assert saved_variant["datasetIds"][ds_id]["sample_count"] == 2
+    assert saved_variant["datasetIds"][ds_id]["call_count"] == 3
+
+    # WHEN the same batch is saved again
+    # THEN no variant should be updated
+    assert add_variants_batch(database, batch, ds_id) == 0
+    assert database["variant"].find_one()["call_count"] == 3
+
+    # WHEN the same variant is saved for a sample of another dataset
+    other_ds_id = registered_dataset["_id"]
+    other_batch = [Variant(parsed_variant, {other_ds_id: {"het": [0]}})]
+    # THEN the variant should be updated
+    assert add_variants_batch(database, other_batch, other_ds_id) == 1
+    saved_variant = database["variant"].find_one()
+    assert saved_variant["datasetIds"][other_ds_id]["het"] == [0]
+    assert saved_variant["call_count"] == 4
+    # AND the counters of each dataset should contain only the samples of the dataset
+    assert saved_variant["datasetIds"][other_ds_id]["sample_count"] == 1
+    assert saved_variant["datasetIds"][other_ds_id]["call_count"] == 1
+    assert saved_variant["datasetIds"][ds_id]["call_count"] == 3
@@ -1,5 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+
+import responses
 from cgbeacon2.constants import MISSING_PUBLIC_KEY
-from cgbeacon2.utils.auth import elixir_key, claims, decode_passport
+from cgbeacon2.utils.auth import (
+    authlevel,
+    claims,
+    decode_passport,
+    elixir_key,
+    jwks_max_age,
+    prefetch_auth_data,
+)
+from tests.conftest import JWKS_URL
+
+
+class AsyncHTTPClient:
+    """A stub async HTTP client returning a JWK set or the user passports, recording requested URLs"""
+
+    def __init__(self, pem, passports) -> None:
+        self.pem = pem
+        self.passports = passports
+        self.calls = []
+
+    async def get(self, url, headers=None):
+        self.calls.append(url)
+        data = {"keys": [self.pem]}
+        if url == "mock_oidc_server":
+            data = {"ga4gh_passport_v1": self.passports}
+        return SimpleNamespace(
+            json=lambda: data, headers={"Cache-Control": "max-age=60"}, is_success=True
+        )
 
 
 def test_elixir_key_wrong_key():
@@ -64,3 +94,105 @@ def test_claims_with_aud_and_issuers():
     assert claims_options["aud"]["values"] == ",".join(mock_oauth2_settings["audience"])
     assert claims_options["aud"]["essential"]
     assert claims_options["exp"]["essential"]
+
+
+def test_elixir_key_cached(jwks_server, pem):
+    """Test that the JWK set returned by a JWK server is cached"""
+
+    # WHEN the public key is requested twice
+    assert elixir_key(JWKS_URL, pem["kid"]) == {"keys": [pem]}
+    assert elixir_key(JWKS_URL, pem["kid"]) == {"keys": [pem]}
+
+    # THEN the JWK server should be called only once
+    assert len(jwks_server.calls) == 1
+
+
+def test_elixir_key_rotated_kid(jwks_server, pem):
+    """Test that the JWK set is collected again when the requested key ID is not cached"""
+
+    # GIVEN a cached JWK set
+    elixir_key(JWKS_URL, pem["kid"])
+
+    # WHEN a key with another key ID is requested
+    elixir_key(JWKS_URL, "rotated_kid")
+
+    # THEN the JWK server should be called again
+    assert len(jwks_server.calls) == 2
+
+
+def test_elixir_key_no_cache(jwks_server, pem):
+    """Test that the JWK set is not cached when the JWK server doesn't allow it"""
+
+    # GIVEN a JWK server returning JWK sets that shouldn't be cached
+    jwks_server.replace(
+        responses.GET, JWKS_URL, json={"keys": [pem]}, headers={"Cache-Control": "no-store"}
+    )
+
+    # WHEN the public key is requested twice
+    elixir_key(JWKS_URL, pem["kid"])
+    elixir_key(JWKS_URL, pem["kid"])
+
+    # THEN the JWK server should be called twice
+    assert len(jwks_server.calls) == 2
+
+
+def test_elixir_key_error_not_cached(jwks_server, pem):
+    """Test that error responses of the JWK server are not cached"""
+
+    # GIVEN a JWK server returning an error
+    jwks_server.replace(responses.GET, JWKS_URL, json={"error": "unavailable"}, status=503)
+
+    # WHEN the public key is requested
+    # THEN the missing public key error should be returned
+    assert elixir_key(JWKS_URL, pem["kid"]) == MISSING_PUBLIC_KEY
+
+    # WHEN the JWK server is back and the public key is requested again
+    jwks_server.replace(responses.GET, JWKS_URL, json={"keys": [pem]})
+    # THEN the JWK set should be collected again
+    assert elixir_key(JWKS_URL, pem["kid"]) == {"keys": [pem]}
+    assert len(jwks_server.calls) == 2
+
+
+def test_elixir_key_no_keys_not_cached(jwks_server, pem):
+    """Test that JWK sets without keys are not cached"""
+
+    # GIVEN a JWK server returning a JWK set without keys
+    jwks_server.replace(responses.GET, JWKS_URL, json={"keys": []})
+
+    # WHEN the public key is requested twice, with any key ID
+    elixir_key(JWKS_URL, None)
+    elixir_key(JWKS_URL, None)
+
+    # THEN the JWK server should be called twice
+    assert len(jwks_server.calls) == 2
+
+
+def test_jwks_max_age():
+    """Test the function that returns for how long a JWK set can be cached"""
+
+    assert jwks_max_age("public, max-age=3600") == 3600
+    assert jwks_max_age("no-cache") == 0
+    assert jwks_max_age(None) > 0
+
+
+def test_prefetch_auth_data(mock_app, mock_oauth2, test_token, pem):
+    """Test collecting asynchronously the data required to compute the auth level of a token"""
+
+    oauth2_settings = dict(mock_app.config["ELIXIR_OAUTH2"], userinfo=mock_oauth2["userinfo"])
+    # GIVEN an async HTTP client returning a JWK set and the passports of the user
+    http_client = AsyncHTTPClient(pem, [test_token])
+    authorization = f"Bearer {test_token}"
+
+    # WHEN auth data is collected for a token
+    asyncio.run(prefetch_auth_data(authorization, oauth2_settings, http_client))
+
+    # THEN the JWK sets of the token and passports, and the user passports should be collected
+    assert http_client.calls == [
+        oauth2_settings["server"],
+        "mock_oidc_server",
+        "http://scilifelab.se/jkw",
+    ]
+
+    # And the auth level should be computed without further HTTP requests
+    request = SimpleNamespace(headers={"Authorization": authorization})
+    assert authlevel(request, oauth2_settings) == ([], False)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+import pytest
+from cgbeacon2.utils.bloom import (
+    BloomFilter,
+    BloomFilterRegistry,
+    bloom_filter_path,
+    create_bloom_filter,
+    filter_size,
+    open_bloom_filter,
+)
+
+
+def test_filter_size():
+    """Test computing the size of a Bloom filter from its capacity and false positive rate"""
+
+    # WHEN computing the size of a filter for 1M keys and a 0.1% false positive rate
+    n_bits, n_hashes = filter_size(1000000, 0.001)
+
+    # THEN the filter should use about 1.8 MB and 10 hash functions
+    assert n_bits % 8 == 0
+    assert 14000000 < n_bits < 15000000
+    assert n_hashes == 10
+
+
+def test_create_bloom_filter(tmp_path):
+    """Test creating a Bloom filter file and adding keys to it"""
+
+    path = bloom_filter_path(str(tmp_path), "GRCh37")
+    keys = [f"variant_{i}" for i in range(2000)]
+
+    # WHEN creating a filter containing half of the keys
+    assert create_bloom_filter(path, keys[:1000], capacity=2000, error_rate=0.01) == 1000
+
+    # THEN the filter should contain all the keys that were added
+    bloom_filter = BloomFilter(path)
+    assert all(key in bloom_filter for key in keys[:1000])
+    # AND report very few of the other keys
+    assert sum(key in bloom_filter for key in keys[1000:]) < 50
+
+    # WHEN the other keys are added by another process using the same file
+    writable_filter = open_bloom_filter(str(tmp_path), "GRCh37", writable=True)
+    writable_filter.add(keys[1000:])
+    writable_filter.mark_removed(3)
+    writable_filter.close()
+
+    # THEN they should be found by the filter opened before the update
+    assert all(key in bloom_filter for key in keys)
+    assert bloom_filter.count == 2000
+    assert bloom_filter.removed == 3
+    bloom_filter.close()
+
+
+def test_bloom_filter_updating_rebuilt(tmp_path):
+    """Test that keys added after a filter was rebuilt are saved to the new filter"""
+
+    # GIVEN a filter opened by a variant loader
+    path = bloom_filter_path(str(tmp_path), "GRCh37")
+    create_bloom_filter(path, ["variant_1"], capacity=1000)
+    loader_filter = open_bloom_filter(str(tmp_path), "GRCh37", writable=True)
+
+    # WHEN the filter is rebuilt from the variants in database
+    create_bloom_filter(path, ["variant_1", "variant_2"], capacity=1000)
+    # AND the loader adds a key
+    with loader_filter.updating():
+        loader_filter.add(["variant_3"])
+    loader_filter.close()
+
+    # THEN the key should be saved in the rebuilt filter
+    bloom_filter = BloomFilter(path)
+    assert all(key in bloom_filter for key in ["variant_1", "variant_2", "variant_3"])
+    assert bloom_filter.count == 3
+    bloom_filter.close()
+
+
+def test_create_bloom_filter_waits_for_loaders(tmp_path):
+    """Test that filters are not rebuilt while a loader is adding keys and saving variants"""
+
+    # GIVEN a loader adding a key to a filter, whose variant isn't saved in database yet
+    path = bloom_filter_path(str(tmp_path), "GRCh37")
+    create_bloom_filter(path, [], capacity=1000)
+    loader_filter = open_bloom_filter(str(tmp_path), "GRCh37", writable=True)
+    saved_keys = []
+    with loader_filter.updating():
+        loader_filter.add(["variant_1"])
+
+        # WHEN the filter is rebuilt from the saved variants meanwhile
+        rebuild = threading.Thread(
+            target=create_bloom_filter, args=(path, (key for key in saved_keys), 1000)
+        )
+        rebuild.start()
+        rebuild.join(timeout=0.2)
+        # THEN the rebuild should wait for the variant to be saved
+        assert rebuild.is_alive()
+        saved_keys.append("variant_1")
+
+    rebuild.join()
+    loader_filter.close()
+    # AND the rebuilt filter should contain the saved variant
+    bloom_filter = BloomFilter(path)
+    assert "variant_1" in bloom_filter
+    bloom_filter.close()
+
+
+def test_open_bloom_filter_not_found(tmp_path):
+    """Test opening Bloom filters which are not enabled or not created"""
+
+    # WHEN the filter directory is not configured
+    # THEN no filter should be returned
+    assert open_bloom_filter(None, "GRCh37") is None
+    # WHEN the filter of an assembly was not created
+    # THEN no filter should be returned
+    assert open_bloom_filter(str(tmp_path), "GRCh38") is None
+
+
+def test_bloom_filter_invalid_file(tmp_path):
+    """Test opening a file which is not a Bloom filter"""
+
+    path = tmp_path / "variants_GRCh37.bloom"
+    path.write_bytes(b"0" * 128)
+
+    with pytest.raises(ValueError):
+        BloomFilter(str(path))
+
+
+def test_bloom_filter_registry(tmp_path):
+    """Test the registry of the Bloom filters used by the query handlers"""
+
+    registry = BloomFilterRegistry(str(tmp_path), ttl=0)
+
+    # GIVEN no filter file
+    # THEN all variants might be present in database
+    assert registry.might_contain("GRCh37", "variant_1") is True
+
+    # WHEN a filter is created
+    path = bloom_filter_path(str(tmp_path), "GRCh37")
+    create_bloom_filter(path, ["variant_1"], capacity=100)
+
+    # THEN the registry should use it
+    assert registry.might_contain("GRCh37", "variant_1") is True
+    assert registry.might_contain("GRCh37", "variant_2") is False
+
+    # WHEN the filter is rebuilt
+    create_bloom_filter(path, ["variant_2"], capacity=100)
+
+    # THEN the registry should reopen the new filter file
+    assert registry.might_contain("GRCh37", "variant_2") is True
+    assert registry.might_contain("GRCh37", "variant_1") is False
+    # AND no temporary files should be left, only the lock file of the filter
+    assert sorted(os.listdir(tmp_path)) == ["variants_GRCh37.bloom", "variants_GRCh37.bloom.lock"]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.utils.dataset_registry import DatasetRegistry
+from cgbeacon2.utils.update import update_event
+
+
+def test_dataset_registry_no_database():
+    """Test the dataset registry when no database is provided"""
+
+    registry = DatasetRegistry()
+    assert registry.datasets(None) == {}
+    assert registry.datasets_by_level(None) == dict(public={}, registered={}, controlled={})
+    assert registry.event_dates(None) == (None, None)
+
+
+def test_dataset_registry_cached(database, public_dataset, registered_dataset):
+    """Test that the dataset registry doesn't read datasets again if no event was registered"""
+
+    # GIVEN a database with a public dataset
+    database["dataset"].insert_one(public_dataset)
+    registry = DatasetRegistry(ttl=0)
+
+    # THEN the registry should return it
+    assert list(registry.datasets(database)) == [public_dataset["_id"]]
+    assert list(registry.datasets_by_level(database)["public"]) == [public_dataset["_id"]]
+
+    # WHEN another dataset is saved without registering an event
+    database["dataset"].insert_one(registered_dataset)
+
+    # THEN the registry should still return the cached datasets
+    assert list(registry.datasets(database)) == [public_dataset["_id"]]
+
+
+def test_dataset_registry_event_invalidation(database, public_dataset, registered_dataset):
+    """Test that the dataset registry reloads datasets after a new event is registered"""
+
+    # GIVEN a database with a public dataset
+    database["dataset"].insert_one(public_dataset)
+    registry = DatasetRegistry(ttl=0)
+    assert len(registry.datasets(database)) == 1
+
+    # WHEN another dataset is saved and the corresponding event is registered
+    database["dataset"].insert_one(registered_dataset)
+    update_event(database, registered_dataset["_id"], "dataset", True)
+
+    # THEN the registry should return both datasets
+    assert len(registry.datasets(database)) == 2
+    assert list(registry.datasets_by_level(database)["registered"]) == [registered_dataset["_id"]]
+    # AND the date of the event
+    first_event, last_event = registry.event_dates(database)
+    assert first_event == last_event == database["event"].find_one()["created"]
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from cgbeacon2.utils.delete import delete_dataset
+from cgbeacon2.utils.bloom import bloom_filter_path, create_bloom_filter, open_bloom_filter
+from cgbeacon2.utils.delete import delete_dataset, delete_variants
 
 
 def test_delete_dataset_none_id():
@@ -8,3 +9,111 @@ def test_delete_dataset_none_id():
 
     result = delete_dataset(None, "dataset_id")
     assert result is None
+
+
+def test_delete_variants(database):
+    """Test removing the calls of one or more samples from the variant collection"""
+
+    # GIVEN a dataset with 2 samples
+    database["dataset"].insert_one(
+        {
+            "_id": "ds1",
+            "samples": ["s1", "s2"],
+            "sample_index": {"s1": 0, "s2": 1},
+            "variant_count": 3,
+            "allele_count": 6,
+        }
+    )
+    # AND variants called in one or both samples, one of them also found in another dataset
+    database["variant"].insert_many(
+        [
+            {
+                "_id": "var1",
+                "call_count": 3,
+                "datasetIds": {
+                    "ds1": {
+                        "het": [1],
+                        "hom_alt": [0],
+                        "sample_count": 2,
+                        "call_count": 3,
+                    }
+                },
+            },
+            {
+                "_id": "var2",
+                "call_count": 1,
+                "datasetIds": {"ds1": {"het": [0], "sample_count": 1, "call_count": 1}},
+            },
+            {
+                "_id": "var3",
+                "call_count": 3,
+                "datasetIds": {
+                    "ds1": {"hom_alt": [0], "sample_count": 1, "call_count": 2},
+                    "ds2": {"het": [0], "sample_count": 1, "call_count": 1},
+                },
+            },
+            # variant not found in any dataset, left by an interrupted job
+            {"_id": "var4", "call_count": 0, "datasetIds": {}},
+        ]
+    )
+
+    # WHEN the variants of the first sample are removed
+    updated, removed = delete_variants(database, "ds1", ["s1"])
+
+    # THEN one variant should be updated and 2 should be removed from the dataset
+    assert (updated, removed) == (1, 2)
+    var1 = database["variant"].find_one({"_id": "var1"})
+    assert var1["call_count"] == 1
+    assert var1["datasetIds"]["ds1"]["het"] == [1]
+    assert var1["datasetIds"]["ds1"]["hom_alt"] == []
+    assert var1["datasetIds"]["ds1"]["sample_count"] == 1
+    assert var1["datasetIds"]["ds1"]["call_count"] == 1
+    # AND the variant found only in the first sample should be deleted
+    assert database["variant"].find_one({"_id": "var2"}) is None
+    # AND the variant found in another dataset should be kept for that dataset
+    var3 = database["variant"].find_one({"_id": "var3"})
+    assert var3["call_count"] == 1
+    assert list(var3["datasetIds"]) == ["ds2"]
+    # AND variants not affected by the deletion should not be removed
+    assert database["variant"].find_one({"_id": "var4"})
+
+    # AND dataset counts should be updated
+    dataset = database["dataset"].find_one()
+    assert dataset["variant_count"] == 1
+    assert dataset["allele_count"] == 1
+
+    # WHEN the same sample is removed again
+    # THEN no variants should be updated or removed
+    assert delete_variants(database, "ds1", ["s1"]) == (0, 0)
+
+
+def test_delete_variants_bloom_filter(database, tmp_path):
+    """Test that variants removed from the database are counted by the variant Bloom filter"""
+
+    # GIVEN a dataset with a variant, saved in the Bloom filter of the dataset assembly
+    database["dataset"].insert_one(
+        {
+            "_id": "ds1",
+            "assembly_id": "GRCh37",
+            "samples": ["s1"],
+            "sample_index": {"s1": 0},
+            "variant_count": 1,
+        }
+    )
+    database["variant"].insert_one(
+        {
+            "_id": "var1",
+            "call_count": 1,
+            "datasetIds": {"ds1": {"het": [0], "sample_count": 1, "call_count": 1}},
+        }
+    )
+    create_bloom_filter(bloom_filter_path(str(tmp_path), "GRCh37"), ["var1"], capacity=100)
+
+    # WHEN the variants of the sample are removed
+    assert delete_variants(database, "ds1", ["s1"], bloom_filter_dir=str(tmp_path)) == (0, 1)
+
+    # THEN the filter should count the removed variant, which can't be removed from the filter
+    bloom_filter = open_bloom_filter(str(tmp_path), "GRCh37")
+    assert bloom_filter.removed == 1
+    assert "var1" in bloom_filter
+    bloom_filter.close()
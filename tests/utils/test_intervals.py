@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.utils.intervals import IntervalIndex
+
+
+def test_interval_index_overlaps():
+    """Test checking if genomic features overlap the intervals of an index"""
+
+    # GIVEN an index with intervals on chromosome 1 and 2
+    intervals = IntervalIndex([("chr1", 100, 200), ("1", 300, 400), ("2", 1000, 2000)])
+
+    # THEN features overlapping the intervals should be found, regardless of the 'chr' prefix
+    assert intervals.overlaps("1", 150, 151)
+    assert intervals.overlaps("chr1", 50, 101)
+    assert intervals.overlaps("1", 399, 500)
+    assert intervals.overlaps("2", 500, 5000)
+    # AND features outside the intervals should not
+    assert intervals.overlaps("1", 200, 300) is False
+    assert intervals.overlaps("1", 50, 100) is False
+    assert intervals.overlaps("3", 150, 151) is False
+
+
+def test_interval_index_regions():
+    """Test converting index intervals to tabix regions"""
+
+    # GIVEN an index with overlapping intervals
+    intervals = IntervalIndex([("1", 100, 200), ("1", 150, 250), ("X", 0, 10)])
+
+    # THEN the intervals should be merged and converted to 1-based regions
+    assert intervals.regions() == ["1:101-250", "X:1-10"]
+    # AND use the chromosome names of the VCF file
+    assert intervals.regions(contigs=["chr1", "chr2"]) == ["chr1:101-250"]
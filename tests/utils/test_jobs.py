@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import datetime
+import time
+
+from cgbeacon2.utils.jobs import (
+    JobHeartbeat,
+    claim_job,
+    create_job,
+    finish_job,
+    requeue_stale_jobs,
+    update_job_progress,
+)
+
+
+def test_claim_job_same_dataset(database):
+    """Test that jobs for the same dataset are run one at the time"""
+
+    # GIVEN two queued jobs for the same dataset and one job for another dataset
+    first_id = create_job(database, "add", {"dataset_id": "ds1", "samples": ["s1"]})
+    second_id = create_job(database, "delete", {"dataset_id": "ds1", "samples": ["s1"]})
+    other_id = create_job(database, "add", {"dataset_id": "ds2", "samples": ["s2"]})
+
+    # WHEN a worker claims a job
+    job = claim_job(database, "worker-1")
+    # THEN it should get the oldest job
+    assert job["_id"] == first_id
+    assert job["status"] == "running"
+    assert job["worker"] == "worker-1"
+
+    # AND another worker should get the job for the other dataset
+    assert claim_job(database, "worker-2")["_id"] == other_id
+    # AND no other jobs can be claimed while the datasets are locked
+    assert claim_job(database, "worker-3") is None
+
+    # WHEN the first job is finished
+    finish_job(database, job, result={"added": 3})
+    # THEN the first job should be completed
+    completed = database["job"].find_one({"_id": first_id})
+    assert completed["status"] == "completed"
+    assert completed["result"] == {"added": 3}
+    # AND the second job for the same dataset can be claimed
+    assert claim_job(database, "worker-3")["_id"] == second_id
+
+
+def test_finish_job_error(database):
+    """Test saving the outcome of a job that has failed"""
+
+    # GIVEN a running job
+    create_job(database, "add", {"dataset_id": "ds1"})
+    job = claim_job(database, "worker-1")
+
+    # WHEN the job is finished with an error
+    finish_job(database, job, error="VCF file not found")
+
+    # THEN the job should be saved as failed
+    failed = database["job"].find_one({"_id": job["_id"]})
+    assert failed["status"] == "failed"
+    assert failed["error"] == "VCF file not found"
+    # AND the dataset should be unlocked
+    assert database["job_lock"].find_one() is None
+
+
+def test_update_job_progress(database):
+    """Test updating the number of variants processed by a job"""
+
+    # GIVEN a running job
+    job_id = create_job(database, "add", {"dataset_id": "ds1"})
+    claim_job(database, "worker-1")
+
+    # WHEN progress is updated twice
+    update_job_progress(database, job_id, 1000)
+    update_job_progress(database, job_id, 500)
+
+    # THEN the job should contain the total number of processed variants
+    assert database["job"].find_one({"_id": job_id})["progress"]["variants"] == 1500
+
+
+def test_requeue_stale_jobs(database):
+    """Test queuing again running jobs that were not updated for a long time"""
+
+    # GIVEN a running job which wasn't updated for two hours
+    job_id = create_job(database, "add", {"dataset_id": "ds1"})
+    claim_job(database, "worker-1")
+    two_hours_ago = datetime.datetime.now() - datetime.timedelta(hours=2)
+    database["job"].update_one({"_id": job_id}, {"$set": {"updated": two_hours_ago}})
+
+    # WHEN stale jobs are requeued using a timeout of one hour
+    assert requeue_stale_jobs(database, 3600) == 1
+
+    # THEN the job should be claimable again
+    assert database["job"].find_one({"_id": job_id})["status"] == "queued"
+    assert claim_job(database, "worker-2")["_id"] == job_id
+
+
+def test_finish_requeued_job(database):
+    """Test that a worker can't save the outcome of a job that was queued again and claimed by another worker"""
+
+    # GIVEN a job claimed by a worker, queued again and claimed by another worker
+    job_id = create_job(database, "add", {"dataset_id": "ds1"})
+    job = claim_job(database, "worker-1")
+    two_hours_ago = datetime.datetime.now() - datetime.timedelta(hours=2)
+    database["job"].update_one({"_id": job_id}, {"$set": {"updated": two_hours_ago}})
+    requeue_stale_jobs(database, 3600)
+    claim_job(database, "worker-2")
+
+    # WHEN the first worker finishes the job
+    assert finish_job(database, job, result={"added": 3}) is False
+
+    # THEN the job should still be running for the second worker
+    running = database["job"].find_one({"_id": job_id})
+    assert running["status"] == "running"
+    assert running["worker"] == "worker-2"
+    # AND the dataset should still be locked
+    assert database["job_lock"].find_one({"_id": "ds1"})
+
+
+def test_job_heartbeat(database):
+    """Test that running jobs are updated by their heartbeat and not queued again"""
+
+    # GIVEN a running job last updated two hours ago
+    job_id = create_job(database, "delete", {"dataset_id": "ds1"})
+    job = claim_job(database, "worker-1")
+    two_hours_ago = datetime.datetime.now() - datetime.timedelta(hours=2)
+    database["job"].update_one({"_id": job_id}, {"$set": {"updated": two_hours_ago}})
+
+    # WHEN the job runs with a heartbeat
+    with JobHeartbeat(database, job, interval=0.05):
+        time.sleep(0.2)
+
+    # THEN the job should have been updated
+    assert database["job"].find_one({"_id": job_id})["updated"] > two_hours_ago
+    # AND it should not be queued again
+    assert requeue_stale_jobs(database, 3600) == 0
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from cgbeacon2.utils.metrics import (
+    REQUEST_MONGO_ROUND_TRIPS,
+    MetricsRegistry,
+    MongoCommandCounter,
+    finish_request_metrics,
+    start_request_metrics,
+    timed,
+)
+
+
+def test_histogram_render():
+    """Test rendering histogram observations using the Prometheus text format"""
+
+    # GIVEN a histogram with 2 buckets
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Test durations", ["stage"], buckets=(0.1, 1))
+
+    # WHEN values are observed
+    histogram.observe(0.05, stage="parse")
+    histogram.observe(0.5, stage="parse")
+    with timed(histogram, "write"):
+        pass
+
+    # THEN the rendered metrics should contain cumulative bucket counts, sum and count
+    rendered = registry.render()
+    assert "# TYPE test_seconds histogram" in rendered
+    assert 'test_seconds_bucket{stage="parse",le="0.1"} 1' in rendered
+    assert 'test_seconds_bucket{stage="parse",le="1"} 2' in rendered
+    assert 'test_seconds_bucket{stage="parse",le="+Inf"} 2' in rendered
+    assert 'test_seconds_sum{stage="parse"} 0.55' in rendered
+    assert 'test_seconds_count{stage="write"} 1' in rendered
+
+
+def test_counter_render():
+    """Test rendering counter values using the Prometheus text format"""
+
+    # GIVEN a counter
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Test counter", ["result"])
+
+    # WHEN it is increased
+    counter.inc(result="hit")
+    counter.inc(2, result="hit")
+
+    # THEN its value should be rendered with its label
+    assert counter.value(result="hit") == 3
+    assert 'test_total{result="hit"} 3' in registry.render()
+
+
+def test_request_mongo_round_trips():
+    """Test counting the database commands sent while handling a request"""
+
+    n_requests = REQUEST_MONGO_ROUND_TRIPS.count(endpoint="test_endpoint")
+    listener = MongoCommandCounter()
+
+    # GIVEN a request sending 2 database commands
+    start_request_metrics()
+    listener.started(SimpleNamespace(command_name="find"))
+    listener.started(SimpleNamespace(command_name="aggregate"))
+
+    # WHEN the request is completed
+    finish_request_metrics("test_endpoint", 200)
+
+    # THEN the number of round trips should be saved
+    assert REQUEST_MONGO_ROUND_TRIPS.count(endpoint="test_endpoint") == n_requests + 1
+    samples = dict(
+        ((name, tuple(labels)), value)
+        for name, labels, value in REQUEST_MONGO_ROUND_TRIPS.samples()
+    )
+    assert (
+        samples[
+            ("beacon_request_mongo_round_trips_bucket", (("endpoint", "test_endpoint"), ("le", 1)))
+        ]
+        == 0
+    )
+    assert (
+        samples[
+            ("beacon_request_mongo_round_trips_bucket", (("endpoint", "test_endpoint"), ("le", 2)))
+        ]
+        == 1
+    )
+
+    # And commands sent outside requests should not be counted
+    listener.started(SimpleNamespace(command_name="find"))
+    finish_request_metrics("test_endpoint", 200)
+    assert REQUEST_MONGO_ROUND_TRIPS.count(endpoint="test_endpoint") == n_requests + 1
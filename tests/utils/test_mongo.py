@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.utils.mongo import LOADING_CLIENT, QUERY_CLIENT, client_settings
+
+
+def test_client_settings():
+    """Test combining general and profile-specific database client settings"""
+
+    # GIVEN a config with general and profile-specific client settings
+    config = dict(
+        MONGO_CLIENT=dict(maxPoolSize=50, connectTimeoutMS=1000),
+        MONGO_QUERY_CLIENT=dict(maxPoolSize=100, readPreference="secondaryPreferred"),
+    )
+
+    # THEN profile-specific settings should override general settings
+    assert client_settings(config, QUERY_CLIENT) == dict(
+        maxPoolSize=100, connectTimeoutMS=1000, readPreference="secondaryPreferred"
+    )
+    # AND profiles without specific settings should use general settings
+    assert client_settings(config, LOADING_CLIENT) == dict(maxPoolSize=50, connectTimeoutMS=1000)
+    # AND no settings should be returned if config has no client settings
+    assert client_settings({}, QUERY_CLIENT) == {}
@@ -1,55 +1,63 @@
 # -*- coding: utf-8 -*-
-import pybedtools
-from cgbeacon2.resources import panel1_path, panel2_path
+import numpy
+from cyvcf2 import VCF
+from cgbeacon2.resources import panel1_path, panel2_path, test_empty_vcf_path, test_sv_vcf_path
+from cgbeacon2.utils.intervals import IntervalIndex
 from cgbeacon2.utils.parse import (
     bnd_mate_name,
+    count_indexed_variants,
     extract_variants,
-    genes_to_bedtool,
+    filter_variants,
+    genes_to_intervals,
+    indexed_contigs,
     merge_intervals,
     sv_end,
+    variant_carriers,
+    vcf_has_variants,
 )
+from tests.conftest import INDEXED_SV_VCF_PATH
 
 ALT = "G]17:198982]"
 
 
-def test_genes_to_bedtool_no_genes(database):
-    """Test function that created Bedtool filter file from a list of genes, without providing any gene ID"""
+def test_genes_to_intervals_no_genes(database):
+    """Test function that creates filter intervals from a list of genes, without providing any gene ID"""
     # GIVEN two empty list of gene hgnc IDs and ensembl ids
     hgnc_ids = []
     ensembl_ids = []
-    bt = genes_to_bedtool(database["gene"], hgnc_ids, ensembl_ids)
-    # THEN the function should return no Bedtool Object (None)
-    assert bt is None
+    intervals = genes_to_intervals(database["gene"], hgnc_ids, ensembl_ids)
+    # THEN the function should return no intervals (None)
+    assert intervals is None
 
 
-def test_genes_to_bedtool_hgnc_ids(database, gene_objects_build37, build="GRCh37"):
-    """Test function that created Bedtool filter file from a list of genes, providing hgnc ids"""
+def test_genes_to_intervals_hgnc_ids(database, gene_objects_build37, build="GRCh37"):
+    """Test function that creates filter intervals from a list of genes, providing hgnc ids"""
     # Given a populated gene collection
     database["gene"].insert_many(gene_objects_build37)
-    # When hgnc ids are provided to the genes_to_bedtool function
+    # When hgnc ids are provided to the genes_to_intervals function
     hgnc_ids = []
     for gene in gene_objects_build37:
         hgnc_ids.append(gene["hgnc_id"])
-    bt = genes_to_bedtool(database["gene"], hgnc_ids=hgnc_ids)
-    # THEN the function should return a BedTool object
-    assert isinstance(bt, pybedtools.bedtool.BedTool)
+    intervals = genes_to_intervals(database["gene"], hgnc_ids=hgnc_ids)
+    # THEN the function should return an IntervalIndex object
+    assert isinstance(intervals, IntervalIndex)
     # With 3 gene intervals
-    assert len(bt) == 3
+    assert len(intervals) == 3
 
 
-def test_genes_to_bedtool_ensembl_ids(database, gene_objects_build37):
-    """Test function that created Bedtool filter file from a list of genes, providing ensembl ids"""
+def test_genes_to_intervals_ensembl_ids(database, gene_objects_build37):
+    """Test function that creates filter intervals from a list of genes, providing ensembl ids"""
     # Given a populated gene collection
     database["gene"].insert_many(gene_objects_build37)
-    # When hgnc ids are provided to the genes_to_bedtool function
+    # When ensembl ids are provided to the genes_to_intervals function
     ensembl_ids = []
     for gene in gene_objects_build37:
         ensembl_ids.append(gene["ensembl_id"])
-    bt = genes_to_bedtool(database["gene"], ensembl_ids=ensembl_ids)
-    # THEN the function should return a BedTool object
-    assert isinstance(bt, pybedtools.bedtool.BedTool)
+    intervals = genes_to_intervals(database["gene"], ensembl_ids=ensembl_ids)
+    # THEN the function should return an IntervalIndex object
+    assert isinstance(intervals, IntervalIndex)
     # With 3 gene intervals
-    assert len(bt) == 3
+    assert len(intervals) == 3
 
 
 def test_bnd_mate_name():
@@ -75,40 +83,35 @@ def test_sv_end_bnd():
     assert end == 198981
 
 
-def test_merge_intervals():
-    """Test function using pyBedTools for merging intervals from one or more panels"""
+def test_merge_intervals(tmp_path):
+    """Test function merging intervals from one or more panels"""
 
-    a = pybedtools.example_bedtool("a.bed")  # path to test file a
-    # This file looks like this:
-    # chr1	1	100	feature1	0	+
-    # chr1	100	200	feature2	0	+
-    # chr1	150	500	feature3	0	-
-    # chr1    900	950	feature4	0	+
+    a = tmp_path / "a.bed"
+    a.write_text(
+        "chr1\t1\t100\tfeature1\t0\t+\n"
+        "chr1\t100\t200\tfeature2\t0\t+\n"
+        "chr1\t150\t500\tfeature3\t0\t-\n"
+        "chr1\t900\t950\tfeature4\t0\t+\n"
+    )
+    b = tmp_path / "b.bed"
+    b.write_text("chr1\t155\t200\tfeature5\t0\t-\nchr1\t800\t901\tfeature6\t0\t+\n")
 
-    assert len(a) == 4
-
-    b = pybedtools.example_bedtool("b.bed")  # path to test file b
-    # This file looks like this:
-    # chr1	155	200	feature5	0	-
-    # chr1	800	901	feature6	0	+
-
-    assert len(b) == 2
-
-    merged_bed = merge_intervals([a, b])
+    merged_bed = merge_intervals([str(a), str(b)])
     assert len(merged_bed) == 2
-    # Merged file looks like this:
-    # chr1	1	500
-    # chr1	800	950
+    # Merged intervals look like this:
+    # 1	1	500
+    # 1	800	950
+    assert list(merged_bed) == [("1", 1, 500), ("1", 800, 950)]
 
 
 def test_merge_demo_intervals():
-    """Test function using pyBedTools for merging intervals from one or more panels using demo intervals"""
-    a = pybedtools.BedTool(panel1_path)
+    """Test function merging intervals from one or more panels using demo intervals"""
+    a = merge_intervals([panel1_path])
     assert len(a) == 4
-    b = pybedtools.BedTool(panel2_path)
+    b = merge_intervals([panel2_path])
     assert len(b) == 3
 
-    merged_bed = merge_intervals([a, b])
+    merged_bed = merge_intervals([panel1_path, panel2_path])
     assert len(merged_bed) == len(a) + len(b) - 1  # a and b have a shared interval
 
 
@@ -117,3 +120,86 @@ def test_extract_variants_no_vcf_file():
 
     results = extract_variants("wrong_VCF_path")
     assert results is None
+
+
+def test_count_indexed_variants_no_index():
+    """Test counting variants from the index of a VCF file which is not indexed"""
+
+    vcf_obj = extract_variants(test_sv_vcf_path, samples={"ADM1059A1"})
+    assert count_indexed_variants(vcf_obj) is None
+
+
+def test_count_indexed_variants():
+    """Test counting variants from the index of an indexed VCF file"""
+
+    vcf_obj = extract_variants(INDEXED_SV_VCF_PATH, samples={"ADM1059A1"})
+    n_records = sum(1 for _ in VCF(INDEXED_SV_VCF_PATH))
+    assert n_records > 0
+    assert count_indexed_variants(vcf_obj) == n_records
+
+
+def test_indexed_contigs_no_index():
+    """Test that a VCF file which is not indexed can't be split by chromosome"""
+
+    assert indexed_contigs(test_sv_vcf_path) == []
+
+
+def test_filter_variants_indexed():
+    """Test that filtering an indexed VCF file by region returns the same variants as filtering it while reading"""
+
+    # GIVEN genomic intervals (BED coordinates) on chromosome 13, containing 4 structural variants
+    intervals = IntervalIndex(
+        [
+            # overlapping intervals containing the start of a variant (21729289)
+            ("13", 21729000, 21729300),
+            ("13", 21729200, 21729500),
+            # two intervals overlapped by the same variant (21732265-21735928)
+            ("13", 21733000, 21733500),
+            ("13", 21735000, 21735100),
+            # intervals ending just before a variant (21746642) and starting at it
+            ("13", 21746000, 21746641),
+            ("13", 21746642, 21747000),
+            # interval starting right after the end of an insertion (8:133920667)
+            ("chr8", 133920667, 133921000),
+        ]
+    )
+
+    # WHEN variants are filtered by querying the index of the VCF file
+    indexed_vcf = VCF(INDEXED_SV_VCF_PATH)
+    assert count_indexed_variants(indexed_vcf) is not None
+    indexed = [(var.CHROM, var.POS) for var in filter_variants(indexed_vcf, intervals)]
+    # AND while reading the same file without index
+    not_indexed = [
+        (var.CHROM, var.POS) for var in filter_variants(VCF(test_sv_vcf_path), intervals)
+    ]
+
+    # THEN both should return each overlapping variant once
+    expected = [("13", 21729289), ("13", 21732261), ("13", 21732265), ("13", 21746642)]
+    assert indexed == expected
+    assert not_indexed == expected
+
+
+def test_vcf_has_variants():
+    """Test the function that checks if a VCF file contains variants"""
+
+    assert vcf_has_variants(test_sv_vcf_path) is True
+    assert vcf_has_variants(test_empty_vcf_path) is False
+
+
+def test_variant_carriers():
+    """Test the function that collects the dataset indices of the samples carrying a variant by genotype"""
+
+    # GIVEN a VCF with 4 samples and genotypes HOM_REF, HET, UNKNOWN, HOM_ALT
+    g_types = numpy.array([0, 1, 2, 3], dtype=numpy.int32)
+    # AND the indices of the samples in the sample dictionary of a dataset
+    sample_indices = numpy.array([7, 5, 6, 4])
+
+    # WHEN carriers are collected for all samples
+    # THEN only HET and HOM_ALT sample indices should be returned
+    assert variant_carriers(sample_indices, numpy.array([0, 1, 2, 3]), g_types) == {
+        "het": [5],
+        "hom_alt": [4],
+    }
+    # WHEN carriers are collected for samples without calls
+    # THEN no carriers should be returned
+    assert variant_carriers(sample_indices[[0, 2]], numpy.array([0, 2]), g_types) == {}
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from cgbeacon2.utils.query_cache import (
+    LRUCacheBackend,
+    QueryCache,
+    RedisCacheBackend,
+    create_query_cache,
+)
+
+MONGO_QUERY = {"_id": "572dca7bd95dc2f288a0dbcfee2df7d2"}
+REDIS_URL = "redis://localhost:6379/0"
+
+
+class FakeRedis:
+    """A stub Redis client keeping entries and their expiry time in memory"""
+
+    def __init__(self, url) -> None:
+        self.url = url
+        self.entries = {}
+        self.now = time.time()  # moved forward by tests to expire entries
+
+    def get(self, key):
+        value, expiry = self.entries.get(key, (None, None))
+        if expiry is not None and expiry <= self.now:
+            self.entries.pop(key)
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.entries[key] = (value.encode("utf-8"), self.now + ex if ex else None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.entries) if key.startswith(match.rstrip("*"))]
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Replace the redis package with a module creating stub Redis clients"""
+    module = SimpleNamespace(Redis=SimpleNamespace(from_url=FakeRedis))
+    monkeypatch.setitem(sys.modules, "redis", module)
+    return module
+
+
+def test_lru_cache_backend_eviction():
+    """Test that the LRU backend discards the least recently used entries when full"""
+
+    # GIVEN a cache backend with 2 entries
+    backend = LRUCacheBackend(maxsize=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    # WHEN the first entry is read and a third entry is saved
+    assert backend.get("a") == "1"
+    backend.set("c", "3")
+
+    # THEN the second entry should be discarded
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert backend.get("c") == "3"
+
+
+def test_query_cache_key():
+    """Test the cache key of queries"""
+
+    query_cache = QueryCache(LRUCacheBackend())
+    key = query_cache.key(MONGO_QUERY, "HIT", ["ds1", "ds2"], (["ds3"], False), "event1")
+
+    # Key should not depend on the order of the requested datasets
+    assert key == query_cache.key(MONGO_QUERY, "HIT", ["ds2", "ds1"], (["ds3"], False), "event1")
+    # But it should change with response type, auth levels and last event
+    assert key != query_cache.key(MONGO_QUERY, "ALL", ["ds1", "ds2"], (["ds3"], False), "event1")
+    assert key != query_cache.key(MONGO_QUERY, "HIT", ["ds1", "ds2"], ([], False), "event1")
+    assert key != query_cache.key(MONGO_QUERY, "HIT", ["ds1", "ds2"], (["ds3"], True), "event1")
+    assert key != query_cache.key(MONGO_QUERY, "HIT", ["ds1", "ds2"], (["ds3"], False), "event2")
+
+
+def test_query_cache_get_set():
+    """Test saving and reading query results from the query cache"""
+
+    query_cache = QueryCache(LRUCacheBackend())
+    results = (True, [{"datasetId": "ds1", "exists": True, "sampleCount": 1}])
+
+    query_cache.set("key", results)
+    assert query_cache.get("key") == results
+    assert query_cache.get("other_key") is None
+
+
+def test_create_query_cache():
+    """Test creating a query cache from app settings"""
+
+    assert create_query_cache(None) is None
+    assert create_query_cache({"backend": "foo"}) is None
+
+    query_cache = create_query_cache({"backend": "lru", "maxsize": 10})
+    assert isinstance(query_cache.backend, LRUCacheBackend)
+    assert query_cache.backend.maxsize == 10
+
+
+def test_redis_cache_backend_get_set(fake_redis):
+    """Test saving and reading entries from the Redis backend"""
+
+    # GIVEN a Redis cache backend
+    backend = RedisCacheBackend(REDIS_URL, ttl=60)
+    assert backend._client.url == REDIS_URL
+
+    # WHEN an entry is saved
+    backend.set("key", "value")
+
+    # THEN it should be saved with the backend prefix and read back as a string
+    assert "cgbeacon2:query:key" in backend._client.entries
+    assert backend.get("key") == "value"
+    assert backend.get("other_key") is None
+
+    # WHEN the backend is cleared
+    backend._client.set("other_app:key", "other value")
+    backend.clear()
+    # THEN only entries with the backend prefix should be removed
+    assert backend.get("key") is None
+    assert list(backend._client.entries) == ["other_app:key"]
+
+
+def test_redis_cache_backend_expiry(fake_redis):
+    """Test that entries saved in Redis expire after the cache ttl"""
+
+    # GIVEN a query cache with a Redis backend and entries expiring after 60 seconds
+    query_cache = create_query_cache({"backend": "redis", "url": REDIS_URL, "ttl": 60})
+    assert isinstance(query_cache.backend, RedisCacheBackend)
+    results = (True, [{"datasetId": "ds1", "exists": True, "sampleCount": 1}])
+    query_cache.set("key", results)
+
+    # THEN the results should be returned before they expire
+    query_cache.backend._client.now += 59
+    assert query_cache.get("key") == results
+
+    # AND not after
+    query_cache.backend._client.now += 2
+    assert query_cache.get("key") is None
+
+
+def test_redis_cache_backend_not_installed(monkeypatch):
+    """Test creating a Redis query cache when the redis package is not installed"""
+
+    # GIVEN that the redis package can't be imported
+    monkeypatch.setitem(sys.modules, "redis", None)
+
+    # THEN the Redis backend should raise an import error
+    with pytest.raises(ImportError):
+        RedisCacheBackend(REDIS_URL)
+    # AND the query cache should be disabled
+    assert create_query_cache({"backend": "redis", "url": REDIS_URL}) is None
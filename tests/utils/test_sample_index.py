@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import pytest
+from cgbeacon2.utils.sample_index import (
+    carriers_allele_count,
+    dataset_sample_indices,
+    saved_sample_indices,
+)
+
+
+def test_dataset_sample_indices(database, public_dataset):
+    """Test assigning indices to the samples of a dataset"""
+
+    # GIVEN a dataset without a sample dictionary
+    database["dataset"].insert_one(public_dataset)
+    ds_id = public_dataset["_id"]
+
+    # WHEN indices are requested for 2 samples
+    indices = dataset_sample_indices(database, ds_id, ["s1", "s2"])
+    # THEN each sample should get a distinct index
+    assert indices == {"s1": 0, "s2": 1}
+
+    # WHEN indices are requested for a saved and a new sample
+    # THEN the saved sample should keep its index
+    assert dataset_sample_indices(database, ds_id, ["s2", "s3"]) == {"s2": 1, "s3": 2}
+    assert saved_sample_indices(database, ds_id, ["s3", "s4"]) == [2]
+
+
+def test_dataset_sample_indices_no_dataset(database):
+    """Test assigning sample indices for a dataset not found in database"""
+
+    with pytest.raises(ValueError):
+        dataset_sample_indices(database, "missing_ds", ["s1"])
+
+
+def test_carriers_allele_count():
+    """Test counting the alleles of the samples carrying a variant"""
+
+    assert carriers_allele_count({"het": [0, 4], "hom_alt": [2]}) == 4
+    assert carriers_allele_count({}) == 0
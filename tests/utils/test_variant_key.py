@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import pytest
+from cgbeacon2.utils.md5 import md5_key
+from cgbeacon2.utils.variant_key import COMPACT_KEY, compact_key, compact_key_range, variant_key
+
+
+def test_compact_key():
+    """Test creating binary variant keys sorted by genome assembly, chromosome and start"""
+
+    # GIVEN variants of 2 chromosomes
+    key = compact_key("1", 100, 101, "A", "C", "GRCh37")
+
+    # THEN keys should be 14 bytes long
+    assert isinstance(key, bytes)
+    assert len(key) == 14
+    # AND variants with different end, ref or alt at the same position should have different keys
+    assert key != compact_key("1", 100, 101, "A", "G", "GRCh37")
+    # AND keys should sort by start, chromosome and genome assembly
+    assert key < compact_key("1", 101, 102, "A", "C", "GRCh37")
+    assert compact_key("1", 200000, 200001, "A", "C", "GRCh37") < compact_key(
+        "2", 1, 2, "A", "C", "GRCh37"
+    )
+    assert compact_key("MT", 1, 2, "A", "C", "GRCh37") < compact_key("1", 1, 2, "A", "C", "GRCh38")
+
+    # AND no key should be created for non-canonical chromosomes
+    with pytest.raises(ValueError):
+        compact_key("chrUn_gl000220", 100, 101, "A", "C", "GRCh37")
+
+
+def test_variant_key():
+    """Test creating variant keys using the md5 and the compact key formats"""
+
+    args = ["1", 100, 101, "A", "C", "GRCh37"]
+    assert variant_key(*args) == md5_key(*args)
+    assert variant_key(*args, key_format=COMPACT_KEY) == compact_key(*args)
+
+
+def test_compact_key_range():
+    """Test the bounds of the compact keys of the variants within a start range"""
+
+    # GIVEN variants at different positions
+    keys = [compact_key("1", start, start + 1, "A", "C", "GRCh37") for start in [9, 10, 20, 21]]
+
+    # WHEN computing the key bounds of a start range
+    key_range = compact_key_range("GRCh37", "1", {"$gte": 10, "$lte": 20})
+
+    # THEN only variants within the range should be included
+    assert [key_range["$gte"] <= key <= key_range["$lte"] for key in keys] == [
+        False,
+        True,
+        True,
+        False,
+    ]
+    # AND an exact start should include only variants at that position
+    key_range = compact_key_range("GRCh37", "1", 21)
+    assert [key_range["$gte"] <= key <= key_range["$lte"] for key in keys] == [
+        False,
+        False,
+        False,
+        True,
+    ]
+    # AND no bounds should be returned for unknown chromosomes
+    assert compact_key_range("GRCh37", "chr1", 21) is None